@@ -4,7 +4,7 @@ from functools import wraps
 from aiogram import types
 from dotenv import load_dotenv
 
-from bot.core.database import is_user_allowed
+from bot.core.async_database import is_user_allowed
 
 load_dotenv()
 
@@ -16,7 +16,7 @@ def perms_allowed(func):
     async def wrapper(message: types.Message = None, query: types.CallbackQuery = None, **kwargs):
         user_id = message.from_user.id if message else query.from_user.id
         # Check against DB directly, and also check admin_ids from .env
-        if user_id in admin_ids or is_user_allowed(user_id):
+        if user_id in admin_ids or await is_user_allowed(user_id):
             if message:
                 return await func(message, **kwargs)
             elif query:
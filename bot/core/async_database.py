@@ -0,0 +1,155 @@
+"""
+Awaitable database API for handlers.
+
+The functions in bot.core.database are synchronous and would block the
+event loop (and every user's stream) on a slow query or fsync. This
+module runs them on worker threads instead: writes go through a single
+writer thread, so they are serialized and never contend for SQLite's
+write lock, while reads go to a small pool of reader threads that WAL
+mode lets run alongside the writer. Each worker thread keeps its own
+connection (see bot.core.database.get_connection).
+
+Every public function mirrors the synchronous one of the same name and
+returns its result, except save_chat_message and save_generation_stats:
+they go through the write-behind queue (bot.core.write_behind) and return
+a PendingWrite as soon as the row is queued. Reads and deletes of chat
+history first wait for queued rows, so they always see them.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+from bot.core import database
+from bot.core.write_behind import PendingWrite, WriteBehindQueue
+
+load_dotenv()
+
+
+class DatabaseExecutor:
+    """
+    Runs database functions on a writer thread and a reader pool.
+
+    Attributes:
+        readers: Number of reader threads
+    """
+
+    def __init__(self, readers: int = 4) -> None:
+        self.readers = max(1, readers)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=self.readers, thread_name_prefix="db-reader"
+        )
+
+    async def read(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a read-only database function on the reader pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(func, *args, **kwargs))
+
+    async def write(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a database function that modifies data on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(func, *args, **kwargs))
+
+    def write_nowait(self, func: Callable, *args, **kwargs) -> Future:
+        """Queue a write from synchronous code without waiting for it."""
+        return self._writer.submit(func, *args, **kwargs)
+
+    def shutdown(self) -> None:
+        """Finish queued work and stop the worker threads."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+db_executor = DatabaseExecutor(readers=int(os.getenv("DATABASE_READERS", "4")))
+write_behind = WriteBehindQueue(
+    db_executor,
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_MS", "50")) / 1000,
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "5000")),
+)
+
+
+def _reader(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.read(func, *args, **kwargs)
+
+    return wrapper
+
+
+def _writer(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.write(func, *args, **kwargs)
+
+    return wrapper
+
+
+def _after_queued_writes(wrapper: Callable) -> Callable:
+    # For functions touching the chats table: let queued messages land first
+    @functools.wraps(wrapper)
+    async def flushing_wrapper(*args, **kwargs):
+        await write_behind.flush()
+        return await wrapper(*args, **kwargs)
+
+    return flushing_wrapper
+
+
+async def save_chat_message(
+    user_id: int, session_id: str | None, role: str, content: str
+) -> PendingWrite | None:
+    """
+    Queue a chat message for saving.
+
+    Args:
+        user_id: Telegram user ID
+        session_id: Chat session ID (None for temporary chats)
+        role: Message role ("user" or "assistant")
+        content: Text content of the message
+
+    Returns:
+        Handle of the queued row (await .wait() for its id), or None for temporary chats
+    """
+    if session_id is None:
+        return None
+    return await write_behind.submit("chat_message", (user_id, session_id, role, content))
+
+
+async def save_generation_stats(stats: dict) -> PendingWrite:
+    """
+    Queue the telemetry of one generation.
+
+    Args:
+        stats: As for bot.core.database.save_generation_stats; chat_id may be
+            the PendingWrite returned by save_chat_message
+    """
+    return await write_behind.submit("generation_stats", (stats,))
+
+
+# Reads
+get_generation_stats = _reader(database.get_generation_stats)
+get_global_prompts = _reader(database.get_global_prompts)
+load_chat_history = _after_queued_writes(_reader(database.load_chat_history))
+get_all_users_from_db = _reader(database.get_all_users_from_db)
+get_user_chat_sessions = _reader(database.get_user_chat_sessions)
+search_chat_history = _after_queued_writes(_reader(database.search_chat_history))
+get_user_prompt = _reader(database.get_user_prompt)
+is_user_allowed = _reader(database.is_user_allowed)
+get_bot_config = _reader(database.get_bot_config)
+get_bot_configs = _reader(database.get_bot_configs)
+
+# Writes
+add_global_prompt = _writer(database.add_global_prompt)
+delete_global_prompt = _writer(database.delete_global_prompt)
+delete_chat_history = _after_queued_writes(_writer(database.delete_chat_history))
+remove_user_from_db = _writer(database.remove_user_from_db)
+create_chat_session = _writer(database.create_chat_session)
+delete_chat_session = _after_queued_writes(_writer(database.delete_chat_session))
+add_user_to_db = _writer(database.add_user_to_db)
+update_user_prompt = _writer(database.update_user_prompt)
+set_bot_config = _writer(database.set_bot_config)
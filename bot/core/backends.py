@@ -0,0 +1,345 @@
+"""
+Ollama backend pool for the Telegram bot.
+
+This module provides the Backend and BackendPool classes used to spread
+/api/chat traffic across several Ollama servers. The pool tracks in-flight
+requests per node, probes every node in the background (/api/tags and
+/api/ps), ejects nodes that keep failing and re-admits them once they
+answer again.
+
+Ejection works as a circuit breaker: while every node is ejected, requests
+fail fast with BackendUnavailableError instead of waiting on a dead server.
+After a cooldown a single trial request is let through (half-open); its
+outcome re-admits the node or restarts the cooldown.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Collection
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class BackendUnavailableError(Exception):
+    """
+    Raised when every backend is ejected and still cooling down.
+
+    Attributes:
+        retry_after: Seconds until a trial request will be allowed
+    """
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"All Ollama backends are unavailable (retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class Backend:
+    """
+    A single Ollama server.
+
+    Attributes:
+        url: Base URL of the server (e.g. "http://localhost:11434")
+        weight: Relative share of traffic this node should receive
+        in_flight: Number of requests currently running on this node
+        healthy: False while the node is ejected from the pool
+        failures: Consecutive failed probes/requests
+        installed_models: Model names reported by /api/tags (None until probed)
+        loaded_models: Model name -> /api/ps entry for models resident in memory
+        model_last_used: Model name -> time.time() of the last chat request
+        opened_at: time.time() the node was ejected (or last given a trial request)
+    """
+
+    def __init__(self, url: str, weight: int = 1) -> None:
+        self.url = url.rstrip("/")
+        self.weight = max(1, weight)
+        self.in_flight = 0
+        self.healthy = True
+        self.failures = 0
+        self.installed_models: set[str] | None = None
+        self.loaded_models: dict[str, dict] = {}
+        self.model_last_used: dict[str, float] = {}
+        self.last_probe = 0.0
+        self.opened_at = 0.0
+        # Smooth weighted round-robin counter
+        self._current_weight = 0
+
+    def __repr__(self) -> str:
+        state = "up" if self.healthy else "down"
+        return f"<Backend {self.url} w={self.weight} in_flight={self.in_flight} {state}>"
+
+
+def parse_backends(spec: str) -> list[Backend]:
+    """
+    Parse a backend list such as "host1:11434,http://host2:11434*2".
+
+    Each entry is "[scheme://]host:port" with an optional "*weight" suffix.
+
+    Args:
+        spec: Comma-separated backend list
+
+    Returns:
+        List of Backend objects (empty if spec is empty)
+    """
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        weight = 1
+        if "*" in entry:
+            entry, weight_str = entry.rsplit("*", 1)
+            try:
+                weight = int(weight_str)
+            except ValueError:
+                logger.warning(f"Invalid weight in backend '{entry}*{weight_str}', using 1")
+        if "://" not in entry:
+            entry = f"http://{entry}"
+        backends.append(Backend(entry, weight))
+    return backends
+
+
+class BackendPool:
+    """
+    Health-aware load balancer over several Ollama backends.
+
+    Routing prefers healthy nodes that already have the requested model
+    loaded (per /api/ps), then nodes that have it installed (per /api/tags).
+    Among those candidates the node is chosen by the configured strategy:
+
+    - "least_in_flight": lowest in_flight / weight
+    - "weighted": smooth weighted round-robin
+
+    Attributes:
+        backends: All configured backends, healthy or not
+        strategy: Routing strategy name
+        probe_interval: Seconds between background health probes
+        failure_threshold: Consecutive failures before a node is ejected
+        breaker_cooldown: Seconds an ejected node gets no traffic before a trial request
+    """
+
+    STRATEGIES = ("least_in_flight", "weighted")
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        strategy: str = "least_in_flight",
+        probe_interval: float = 10.0,
+        failure_threshold: int = 3,
+        breaker_cooldown: float = 30.0,
+    ) -> None:
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if strategy not in self.STRATEGIES:
+            logger.warning(f"Unknown load balancing strategy '{strategy}', using least_in_flight")
+            strategy = "least_in_flight"
+        self.backends = backends
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        self.failure_threshold = failure_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._session: aiohttp.ClientSession | None = None
+        self._probe_task: asyncio.Task | None = None
+
+    @property
+    def healthy_backends(self) -> list[Backend]:
+        """Backends currently admitted to the pool."""
+        return [b for b in self.backends if b.healthy]
+
+    def primary(self) -> Backend:
+        """First healthy backend (or the first configured one if all are down)."""
+        healthy = self.healthy_backends
+        return healthy[0] if healthy else self.backends[0]
+
+    # --- Routing ---
+
+    def select(
+        self, model: str | None = None, trial: bool = True, exclude: Collection[str] = ()
+    ) -> Backend | None:
+        """
+        Pick the backend that should serve a request for a model.
+
+        Args:
+            model: Model name, or None if the request is not model-specific
+            trial: Whether the request may be the half-open trial of an ejected
+                node. Metadata calls pass False, so the breaker state is
+                decided by real traffic.
+            exclude: URLs of healthy backends not to consider (e.g. full ones)
+
+        Returns:
+            The chosen Backend. If every node is ejected, one whose cooldown
+            has elapsed is returned for a trial request, or None if trial
+            is False. None too if every healthy node is excluded.
+
+        Raises:
+            BackendUnavailableError: If every node is ejected and cooling down
+        """
+        candidates = [b for b in self.healthy_backends if b.url not in exclude]
+        if not candidates:
+            if not trial or self.healthy_backends:
+                return None
+            candidates = self._trial_candidates()
+        if model:
+            loaded = [b for b in candidates if model in b.loaded_models]
+            if loaded:
+                candidates = loaded
+            else:
+                installed = [
+                    b for b in candidates
+                    if b.installed_models is None or model in b.installed_models
+                ]
+                if installed:
+                    candidates = installed
+
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == "weighted":
+            total = sum(b.weight for b in candidates)
+            for b in candidates:
+                b._current_weight += b.weight
+            chosen = max(candidates, key=lambda b: b._current_weight)
+            chosen._current_weight -= total
+            return chosen
+        return min(candidates, key=lambda b: b.in_flight / b.weight)
+
+    def _trial_candidates(self) -> list[Backend]:
+        """Ejected nodes past their cooldown; fails fast if there are none."""
+        now = time.time()
+        ready = [b for b in self.backends if now - b.opened_at >= self.breaker_cooldown]
+        if not ready:
+            retry_after = min(b.opened_at + self.breaker_cooldown for b in self.backends) - now
+            raise BackendUnavailableError(retry_after)
+        # Half-open: one trial at a time, the rest keep failing fast
+        trial = ready[0]
+        trial.opened_at = now
+        logger.info(f"Circuit half-open: sending a trial request to {trial.url}")
+        return [trial]
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        model: str | None = None,
+        backend: Backend | None = None,
+        exclude: Collection[str] = (),
+    ):
+        """
+        Select a backend and count the request as in flight while it runs.
+
+        Args:
+            model: Model name used for model-aware routing
+            backend: Backend reserved for the request (e.g. by the generation
+                scheduler); used unless it has been ejected since
+            exclude: URLs to avoid if another healthy node is available
+                (e.g. nodes a retried request already failed on)
+
+        Yields:
+            The chosen Backend
+        """
+        if backend is None or not backend.healthy:
+            backend = (exclude and self.select(model, exclude=exclude)) or self.select(model)
+        backend.in_flight += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+    # --- Health tracking ---
+
+    def mark_success(self, backend: Backend) -> None:
+        """Reset the failure count and re-admit the node if it was ejected."""
+        backend.failures = 0
+        if not backend.healthy:
+            backend.healthy = True
+            logger.info(f"Backend {backend.url} re-admitted to the pool")
+
+    def mark_failure(self, backend: Backend) -> None:
+        """Count a failure and eject the node once the threshold is reached."""
+        backend.failures += 1
+        if not backend.healthy:
+            # A failed trial request restarts the cooldown
+            backend.opened_at = time.time()
+        elif backend.failures >= self.failure_threshold:
+            backend.healthy = False
+            backend.opened_at = time.time()
+            backend.loaded_models = {}
+            logger.warning(
+                f"Backend {backend.url} ejected after {backend.failures} consecutive failures"
+            )
+
+    async def probe(self, backend: Backend) -> bool:
+        """
+        Probe a backend via /api/tags and refresh its loaded models via /api/ps.
+
+        Args:
+            backend: Backend to probe
+
+        Returns:
+            True if the node answered /api/tags with HTTP 200
+        """
+        if self._session is None:
+            return backend.healthy
+        timeout_config = ClientTimeout(total=5, connect=3)
+        backend.last_probe = time.time()
+        try:
+            async with self._session.get(
+                f"{backend.url}/api/tags", timeout=timeout_config
+            ) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        request_info=response.request_info,
+                        history=response.history,
+                        status=response.status,
+                    )
+                data = await response.json()
+                backend.installed_models = {m["name"] for m in data.get("models", [])}
+            async with self._session.get(
+                f"{backend.url}/api/ps", timeout=timeout_config
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    backend.loaded_models = {m["name"]: m for m in data.get("models", [])}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Health probe failed for {backend.url}: {e}")
+            self.mark_failure(backend)
+            return False
+        self.mark_success(backend)
+        return True
+
+    async def probe_all(self) -> None:
+        """Probe every configured backend concurrently."""
+        await asyncio.gather(*(self.probe(b) for b in self.backends))
+
+    async def _probe_loop(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"Unexpected error in backend health probe: {e}", exc_info=True)
+            await asyncio.sleep(self.probe_interval)
+
+    async def start(self, session: aiohttp.ClientSession) -> None:
+        """
+        Start background health probes.
+
+        Args:
+            session: Shared aiohttp session used for probe requests
+        """
+        self._session = session
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe_loop())
+        logger.info(f"Backend pool started ({self.strategy}): {self.backends}")
+
+    async def stop(self) -> None:
+        """Stop background health probes."""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        self._session = None
@@ -0,0 +1,167 @@
+"""
+Per-model calibration of token estimates.
+
+Token counts in this bot come from tiktoken's cl100k_base encoding (see
+bot.utils.count_tokens), which differs from the tokenizers of llama, qwen,
+gemma and other local models. This module learns, per model, the ratio
+between the model's real token counts reported by Ollama and the
+cl100k_base counts, and scales estimates by it wherever a token budget is
+enforced. The ratios are persisted in bot_config and loaded once at
+startup, so looking one up never touches the database.
+"""
+
+import json
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from bot.core.async_database import db_executor, get_bot_configs
+from bot.core.database import set_bot_config
+from bot.utils import count_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCalibrator:
+    """
+    Learns a model-tokens / cl100k-tokens ratio per model.
+
+    Each generation gives up to two samples:
+
+    - the answer: eval_count against the cl100k count of the answer text.
+      Generated tokens are never served from Ollama's prompt cache, so this
+      is a clean sample.
+    - the prompt: prompt_eval_count against the cl100k estimate of the
+      prompt. Ollama only counts the prompt tokens it did not reuse from
+      its KV cache, so samples far below the current ratio (a cache hit)
+      are ignored.
+
+    Samples are folded into an exponentially weighted average.
+
+    Attributes:
+        alpha: Weight of a new sample
+        min_ratio: Lowest plausible ratio (samples below are discarded)
+        max_ratio: Highest plausible ratio (samples above are discarded)
+        persist_every: Samples between writes to bot_config
+    """
+
+    CONFIG_PREFIX = "token_ratio:"
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        min_ratio: float = 0.5,
+        max_ratio: float = 3.0,
+        persist_every: int = 5,
+        enabled: bool = True,
+    ) -> None:
+        self.alpha = alpha
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.persist_every = max(1, persist_every)
+        self.enabled = enabled
+        # model -> {"ratio": float, "samples": int}
+        self._ratios: dict[str, dict] = {}
+
+    async def load(self) -> None:
+        """Load the ratios persisted in bot_config (call once at startup)."""
+        stored = await get_bot_configs(self.CONFIG_PREFIX)
+        for key, value in stored.items():
+            modelname = key[len(self.CONFIG_PREFIX) :]
+            entry = {"ratio": 1.0, "samples": 0}
+            try:
+                entry.update(json.loads(value))
+            except (ValueError, TypeError):
+                logger.warning(f"Ignoring invalid token calibration for '{modelname}'")
+                continue
+            self._ratios[modelname] = entry
+        if self._ratios:
+            logger.info(f"Loaded token calibration for {len(self._ratios)} models")
+
+    def _entry(self, modelname: str) -> dict:
+        entry = self._ratios.get(modelname)
+        if entry is None:
+            entry = self._ratios[modelname] = {"ratio": 1.0, "samples": 0}
+        return entry
+
+    def factor(self, modelname: str | None) -> float:
+        """
+        Ratio to multiply cl100k token counts by for a model.
+
+        Returns:
+            The learned ratio, or 1.0 if calibration is off or the model is unknown
+        """
+        if not self.enabled or not modelname:
+            return 1.0
+        return self._entry(modelname)["ratio"]
+
+    def estimate(self, modelname: str | None, baseline_tokens: int) -> int:
+        """Convert a cl100k token count into an estimate for the model."""
+        return round(baseline_tokens * self.factor(modelname))
+
+    def baseline_budget(self, modelname: str | None, model_tokens: int) -> int:
+        """Convert a budget in model tokens into cl100k tokens (e.g. for stored counts)."""
+        return int(model_tokens / self.factor(modelname))
+
+    def _add_sample(self, entry: dict, ratio: float) -> bool:
+        if not self.min_ratio <= ratio <= self.max_ratio:
+            return False
+        if entry["samples"] == 0:
+            entry["ratio"] = ratio
+        else:
+            entry["ratio"] += self.alpha * (ratio - entry["ratio"])
+        entry["samples"] += 1
+        return True
+
+    def observe(
+        self,
+        modelname: str,
+        prompt_estimate: int,
+        answer: str,
+        prompt_eval_count: int | None,
+        eval_count: int | None,
+    ) -> None:
+        """
+        Learn from a finished generation.
+
+        Args:
+            modelname: Model that answered
+            prompt_estimate: Calibrated prompt estimate used for the request
+            answer: Final answer text
+            prompt_eval_count: Prompt tokens Ollama evaluated
+            eval_count: Tokens Ollama generated
+        """
+        if not self.enabled or not modelname:
+            return
+        entry = self._entry(modelname)
+        current = entry["ratio"]
+        learned = False
+
+        if eval_count and answer:
+            learned |= self._add_sample(entry, eval_count / count_tokens(answer))
+
+        baseline_prompt = prompt_estimate / current if current else 0
+        if prompt_eval_count and baseline_prompt:
+            ratio = prompt_eval_count / baseline_prompt
+            # Much lower than expected means most of the prompt came from the cache
+            if ratio >= 0.7 * current:
+                learned |= self._add_sample(entry, ratio)
+
+        if learned and entry["samples"] % self.persist_every == 0:
+            # Called from the event loop, so hand the write to the DB writer thread
+            db_executor.write_nowait(
+                set_bot_config, self.CONFIG_PREFIX + modelname, json.dumps(entry)
+            )
+            logger.info(
+                f"Token calibration for '{modelname}': {entry['ratio']:.3f} "
+                f"model tokens per cl100k token ({entry['samples']} samples)"
+            )
+
+
+token_calibrator = TokenCalibrator(
+    alpha=float(os.getenv("TOKEN_CALIBRATION_ALPHA", "0.1")),
+    enabled=os.getenv("TOKEN_CALIBRATION", "true").lower() in ("1", "true", "yes"),
+)
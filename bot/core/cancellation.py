@@ -0,0 +1,83 @@
+"""
+Tracking of running generations so they can be stopped.
+
+This module provides the GenerationRegistry class, which maps a
+(chat_id, user_id) pair to the task currently generating an answer for it.
+/stop, the inline "⏹ Stop" button and (optionally) a newer message from
+the same user cancel that task.
+"""
+
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationRegistry:
+    """
+    Registry of cancellable generation tasks keyed by (chat_id, user_id).
+
+    Attributes:
+        preempt: Cancel a running generation when the same user starts a new one
+    """
+
+    def __init__(self, preempt: bool = False) -> None:
+        self.preempt = preempt
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._stopped: set[asyncio.Task] = set()
+
+    @property
+    def active(self) -> int:
+        """Number of generations currently registered."""
+        return len(self._tasks)
+
+    def register(self, key: tuple[int, int], task: asyncio.Task) -> None:
+        """
+        Register the task generating for a chat/user.
+
+        If preemption is enabled, a generation already running for the same
+        key is stopped.
+        """
+        previous = self._tasks.get(key)
+        if previous is not None and previous is not task and not previous.done():
+            if self.preempt:
+                logger.info(f"Pre-empting generation for {key}")
+                self._stop_task(previous)
+        self._tasks[key] = task
+
+    def unregister(self, key: tuple[int, int], task: asyncio.Task) -> None:
+        """Remove a finished task (only if it is still the registered one)."""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        self._stopped.discard(task)
+
+    def _stop_task(self, task: asyncio.Task) -> None:
+        self._stopped.add(task)
+        task.cancel()
+
+    def stop(self, key: tuple[int, int]) -> bool:
+        """
+        Stop the generation running for a chat/user.
+
+        Returns:
+            True if a running generation was cancelled
+        """
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            return False
+        self._stop_task(task)
+        return True
+
+    def was_stopped(self, task: asyncio.Task) -> bool:
+        """True if the task was cancelled through stop() or pre-emption."""
+        return task in self._stopped
+
+
+generations = GenerationRegistry(
+    preempt=os.getenv("PREEMPT_ON_NEW_MESSAGE", "false").lower() in ("1", "true", "yes")
+)
@@ -0,0 +1,303 @@
+"""
+Model catalog for the Ollama Telegram bot.
+
+This module provides two caches over Ollama's model metadata:
+
+- ModelListCache: the /api/tags model list, served stale-while-revalidate
+  so admin menus never wait on a round trip once it has been filled.
+- CapabilityCatalog: capabilities (vision, tools, ...), families and
+  context length of every installed model from /api/show, so hot-path
+  checks are a single dict lookup.
+
+Every /api/tags fetch made by the list cache also feeds the capability
+catalog, so both share one fetch.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from bot.core.ollama import model_list, show_model
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class ModelCapabilities:
+    """
+    Capabilities of one installed model, as reported by /api/show.
+
+    Attributes:
+        name: Model name
+        capabilities: Capability strings (e.g. {"completion", "vision", "tools"})
+        families: Model families (e.g. ("gemma3",))
+        context_length: Maximum context length in tokens, if reported
+        fetched_at: time.time() when the entry was fetched
+    """
+
+    name: str
+    capabilities: frozenset = field(default_factory=frozenset)
+    families: tuple = ()
+    context_length: int | None = None
+    fetched_at: float = 0.0
+
+    @property
+    def vision(self) -> bool:
+        return "vision" in self.capabilities or "multimodal" in self.capabilities
+
+    @property
+    def tools(self) -> bool:
+        return "tools" in self.capabilities
+
+    @classmethod
+    def from_show(cls, name: str, data: dict) -> "ModelCapabilities":
+        """Build an entry from a decoded /api/show response."""
+        details = data.get("details") or {}
+        model_info = data.get("model_info") or {}
+        context_length = None
+        for key, value in model_info.items():
+            if key.endswith(".context_length"):
+                context_length = int(value)
+                break
+        families = details.get("families") or ([details["family"]] if details.get("family") else [])
+        return cls(
+            name=name,
+            capabilities=frozenset(data.get("capabilities") or ()),
+            families=tuple(families),
+            context_length=context_length,
+            fetched_at=time.time(),
+        )
+
+
+class CapabilityCatalog:
+    """
+    In-memory catalog of model capabilities, refreshed in the background.
+
+    Attributes:
+        ttl: Seconds an entry is kept before /api/show is called again
+        concurrency: Max concurrent /api/show requests during a refresh
+        entries: Model name -> ModelCapabilities
+    """
+
+    def __init__(self, ttl: float = 600.0, concurrency: int = 4) -> None:
+        self.ttl = ttl
+        self.concurrency = max(1, concurrency)
+        self.entries: dict[str, ModelCapabilities] = {}
+        self._task: asyncio.Task | None = None
+
+    def get(self, modelname: str) -> ModelCapabilities | None:
+        """Return the cached entry for a model, or None if it is unknown."""
+        return self.entries.get(modelname)
+
+    async def fetch(self, modelname: str) -> ModelCapabilities | None:
+        """
+        Fetch and store the entry for a single model.
+
+        Returns:
+            The new entry, or None if /api/show failed
+        """
+        data = await show_model(modelname)
+        if data is None:
+            return None
+        entry = ModelCapabilities.from_show(modelname, data)
+        self.entries[modelname] = entry
+        return entry
+
+    async def refresh(self, models: list[dict]) -> None:
+        """
+        Fetch new and expired models with bounded concurrency.
+
+        Entries fetched less than ttl seconds ago are kept, so the frequent
+        model list revalidations only cost /api/show calls for new models.
+
+        Args:
+            models: /api/tags model list
+        """
+        names = [m["name"] for m in models]
+        now = time.time()
+        due = [
+            name for name in names
+            if name not in self.entries or now - self.entries[name].fetched_at >= self.ttl
+        ]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(name: str) -> None:
+            async with semaphore:
+                await self.fetch(name)
+
+        await asyncio.gather(*(fetch_one(name) for name in due))
+        # Forget models that are no longer installed (an empty list usually
+        # means Ollama could not be listed, so keep what we have)
+        for name in (set(self.entries) - set(names)) if names else ():
+            del self.entries[name]
+        if due:
+            logger.info(
+                f"Capability catalog refreshed {len(due)} of {len(self.entries)} model(s)"
+            )
+
+    def invalidate(self, modelname: str) -> None:
+        """Drop a model's entry (e.g. after it was deleted)."""
+        self.entries.pop(modelname, None)
+
+    async def on_pull_complete(self, job) -> None:
+        """PullQueue completion hook: refresh the model list and its capabilities."""
+        if job.status == "success":
+            model_list_cache.invalidate()
+            await self.fetch(job.model)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                # The list cache feeds the new list back into refresh()
+                await model_list_cache.revalidate()
+            except Exception as e:
+                logger.warning(f"Capability catalog refresh failed: {e}")
+            await asyncio.sleep(self.ttl)
+
+    def start(self) -> None:
+        """Fill the catalog now and keep refreshing it every ttl seconds."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Stop background refreshes."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ModelListCache:
+    """
+    Stale-while-revalidate cache of the /api/tags model list.
+
+    get() returns the last known list right away and revalidates in the
+    background once it is older than max_age. Only the very first call
+    waits for Ollama. Every successful fetch is passed to the catalog.
+
+    Attributes:
+        max_age: Seconds after which the cached list is revalidated
+        catalog: CapabilityCatalog refreshed from each fetched list
+        models: Last fetched list, or None before the first fetch
+        fetched_at: time.monotonic() of the last successful fetch
+    """
+
+    def __init__(self, catalog: CapabilityCatalog | None = None, max_age: float = 30.0) -> None:
+        self.max_age = max_age
+        self.catalog = catalog
+        self.models: list[dict] | None = None
+        self.fetched_at = 0.0
+        self._revalidating: asyncio.Task | None = None
+        self._catalog_task: asyncio.Task | None = None
+
+    @property
+    def is_stale(self) -> bool:
+        return self.models is None or time.monotonic() - self.fetched_at > self.max_age
+
+    async def get(self) -> list[dict]:
+        """
+        Return the model list, revalidating in the background if stale.
+
+        Returns:
+            List of model dictionaries from Ollama API, empty list on error
+        """
+        if self.models is None:
+            await self.revalidate()
+            return self.models or []
+        if self.is_stale:
+            self._start_revalidation()
+        return self.models
+
+    def _start_revalidation(self) -> asyncio.Task:
+        if self._revalidating is None or self._revalidating.done():
+            self._revalidating = asyncio.create_task(self._fetch())
+        return self._revalidating
+
+    async def revalidate(self) -> list[dict]:
+        """Fetch the list now (joining an in-progress fetch) and update the catalog."""
+        await asyncio.shield(self._start_revalidation())
+        return self.models or []
+
+    async def _fetch(self) -> None:
+        try:
+            models = await model_list()
+        except Exception as e:
+            logger.warning(f"Could not refresh model list: {e}")
+            return
+        self.models = models
+        self.fetched_at = time.monotonic()
+        if self.catalog is not None and (
+            self._catalog_task is None or self._catalog_task.done()
+        ):
+            self._catalog_task = asyncio.create_task(self.catalog.refresh(models))
+
+    def invalidate(self) -> None:
+        """Mark the list stale and revalidate it in the background (after pull/delete)."""
+        self.fetched_at = 0.0
+        if self.models is not None:
+            self._start_revalidation()
+
+
+capability_catalog = CapabilityCatalog(
+    ttl=float(os.getenv("CAPABILITY_TTL", "600")),
+    concurrency=int(os.getenv("CAPABILITY_CONCURRENCY", "4")),
+)
+
+model_list_cache = ModelListCache(
+    capability_catalog, max_age=float(os.getenv("MODEL_LIST_MAX_AGE", "30"))
+)
+
+
+async def get_model_capabilities(modelname: str) -> set:
+    """
+    Return the capability strings of a model, fetching them if not cataloged.
+
+    Returns:
+        set: Capability strings (e.g. {"vision", "tools", ...}),
+             empty set if capabilities cannot be determined.
+    """
+    entry = capability_catalog.get(modelname) or await capability_catalog.fetch(modelname)
+    return set(entry.capabilities) if entry else set()
+
+
+def model_supports_vision(modelname: str) -> bool:
+    """
+    Check if a model supports vision using the capability catalog.
+
+    Falls back to known name patterns only when the model is not cataloged
+    (e.g. Ollama was unreachable at startup).
+
+    Returns:
+        bool: True if model supports vision, False otherwise.
+    """
+    entry = capability_catalog.get(modelname)
+    if entry is not None:
+        return entry.vision
+
+    # Fallback: check by model name patterns (case-insensitive)
+    model_lower = modelname.lower()
+    # Common vision model name patterns
+    vision_patterns = [
+        "llava",
+        "bakllava",
+        "moondream",
+        "vision",
+        "vl",  # vision-language
+        "multimodal",
+        "gemma3",
+        "phi4-multimodal",
+    ]
+    for pattern in vision_patterns:
+        if pattern in model_lower:
+            return True
+
+    return False
@@ -0,0 +1,139 @@
+"""
+In-flight request coalescing for Ollama generations.
+
+This module provides the StreamCoalescer class. Identical generations
+(same model, options and messages) that overlap in time share a single
+Ollama stream: the first request starts it, later ones subscribe and get
+every chunk produced so far replayed, then the rest as it arrives.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a flight in subscriber queues
+_END = object()
+
+
+def request_key(modelname: str, messages: list[dict], options: dict | None = None) -> str:
+    """
+    Build a canonical hash identifying a generation request.
+
+    Args:
+        modelname: Model name
+        messages: Chat messages (role, content, images)
+        options: Ollama options sent with the request
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON encoding
+    """
+    canonical = json.dumps(
+        {"model": modelname, "options": options or {}, "messages": messages},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """A running generation and the queues of everyone waiting on it."""
+
+    def __init__(self) -> None:
+        self.chunks: list = []
+        self.subscribers: set[asyncio.Queue] = set()
+        self.finished = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+
+
+class StreamCoalescer:
+    """
+    Shares one upstream stream between identical in-flight requests.
+
+    The producer runs in its own task so that it outlives any single
+    subscriber; it is cancelled only when every subscriber has left.
+
+    Attributes:
+        coalesced: Number of requests that joined an existing stream
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of upstream streams currently running."""
+        return len(self._flights)
+
+    async def stream(
+        self, key: str, producer: Callable[[], AsyncIterator]
+    ) -> AsyncIterator:
+        """
+        Stream the chunks for a request, starting or joining its flight.
+
+        Args:
+            key: Request key from request_key()
+            producer: Called with no arguments to start the upstream async
+                iterator if no identical request is in flight
+
+        Yields:
+            Chunks from the shared upstream stream, in order
+
+        Raises:
+            Whatever the upstream stream raised. If the flight is cancelled
+            from outside (e.g. at shutdown), the stream just ends.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, producer))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced generation {key[:12]} ({len(flight.subscribers)} waiting)")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in flight.chunks:
+            queue.put_nowait(chunk)
+        flight.subscribers.add(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                yield item
+        finally:
+            flight.subscribers.discard(queue)
+            if not flight.subscribers and not flight.finished:
+                # Nobody is listening anymore: stop the upstream generation.
+                # Forget the flight right away so an identical request that
+                # arrives before the task has unwound starts a fresh one.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key: str, flight: _Flight, producer: Callable[[], AsyncIterator]) -> None:
+        try:
+            async for chunk in producer():
+                flight.chunks.append(chunk)
+                for queue in flight.subscribers:
+                    queue.put_nowait(chunk)
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            for queue in flight.subscribers:
+                queue.put_nowait(_END)
+
+
+coalescer = StreamCoalescer()
@@ -0,0 +1,291 @@
+"""
+Context window sizing, history trimming and Ollama options for chat requests.
+
+This module computes the options sent with every /api/chat request:
+num_ctx is derived from the token-counted conversation and rounded up to
+a fixed set of bucket sizes (Ollama reloads a model whenever num_ctx
+changes, so it must not drift by a few tokens per message), and sampling
+options come from the selected system prompt and per-session overrides
+set with /options.
+
+Ollama reuses its KV cache for the longest prompt prefix that matches the
+previous request, so the history is trimmed rarely and in large steps:
+between trims every turn only appends to an unchanged prefix. Each message
+caches its token count, so sizing a turn only tokenizes the new messages.
+"""
+
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from bot.core.calibration import token_calibrator
+from bot.core.catalog import capability_catalog
+from bot.core.database import MESSAGE_TOKENS_KEY
+from bot.utils import count_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Options users may set with /options (or system prompts may define), with their types
+ALLOWED_OPTIONS: dict[str, type] = {
+    "temperature": float,
+    "top_p": float,
+    "top_k": int,
+    "min_p": float,
+    "repeat_penalty": float,
+    "presence_penalty": float,
+    "frequency_penalty": float,
+    "seed": int,
+    "num_predict": int,
+    "num_ctx": int,
+}
+
+# Rough per-message overhead of the chat template, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Rough cost of one attached image, in tokens
+IMAGE_TOKENS = 768
+
+
+def _parse_buckets(spec: str) -> list[int]:
+    buckets = sorted({int(part) for part in spec.split(",") if part.strip()})
+    return buckets or [4096]
+
+
+dynamic_num_ctx = os.getenv("DYNAMIC_NUM_CTX", "true").lower() in ("1", "true", "yes")
+num_ctx_buckets = _parse_buckets(os.getenv("NUM_CTX_BUCKETS", "2048,4096,8192,16384,32768"))
+# Tokens kept free for the answer when num_predict is not set
+num_ctx_reserve = int(os.getenv("NUM_CTX_RESERVE", "1024"))
+# When the history outgrows the context, trim it down to this share of it
+trim_target = float(os.getenv("CONTEXT_TRIM_TARGET", "0.5"))
+
+
+class PrefixCacheStats:
+    """
+    Measures how much of each prompt Ollama served from its KV cache.
+
+    Ollama's prompt_eval_count only counts the prompt tokens it had to
+    evaluate, so the rest of the (estimated) prompt was reused.
+
+    Attributes:
+        turns: Generations recorded
+        prompt_tokens: Sum of estimated prompt sizes
+        evaluated_tokens: Sum of prompt_eval_count
+        trims: Times a history was trimmed
+    """
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.evaluated_tokens = 0
+        self.trims = 0
+
+    def record(self, prompt_tokens: int, prompt_eval_count: int | None) -> float | None:
+        """
+        Record one generation.
+
+        Args:
+            prompt_tokens: Estimated size of the prompt sent
+            prompt_eval_count: prompt_eval_count reported by Ollama
+
+        Returns:
+            Share of the prompt reused from the cache, or None if unknown
+        """
+        if prompt_eval_count is None or prompt_tokens <= 0:
+            return None
+        self.turns += 1
+        self.prompt_tokens += prompt_tokens
+        self.evaluated_tokens += min(prompt_eval_count, prompt_tokens)
+        return max(0.0, 1 - prompt_eval_count / prompt_tokens)
+
+    def stats(self) -> dict:
+        """Counters and overall reuse rate for instrumentation."""
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "evaluated_tokens": self.evaluated_tokens,
+            "reuse_rate": (
+                1 - self.evaluated_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            ),
+            "trims": self.trims,
+        }
+
+
+prefix_stats = PrefixCacheStats()
+
+
+def parse_options(text: str) -> dict:
+    """
+    Parse "key=value" pairs as typed by the user in /options.
+
+    Args:
+        text: Space-separated pairs, e.g. "temperature=0.2 num_predict=512"
+
+    Returns:
+        Dict of option name -> typed value
+
+    Raises:
+        ValueError: On unknown option names or values of the wrong type
+    """
+    options = {}
+    for pair in text.split():
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got '{pair}'")
+        kind = ALLOWED_OPTIONS.get(name)
+        if kind is None:
+            raise ValueError(f"Unknown option '{name}'")
+        try:
+            options[name] = kind(value)
+        except ValueError:
+            raise ValueError(f"Option '{name}' needs a {kind.__name__} value") from None
+    return options
+
+
+def message_tokens(msg: dict) -> int:
+    """
+    Token count of a message's content, cached in the message dict.
+
+    The count is kept with the content it was computed for, so a message
+    whose content is replaced (e.g. the system prompt) is counted again.
+    """
+    content = msg.get("content") or ""
+    cached = msg.get(MESSAGE_TOKENS_KEY)
+    if cached is not None and cached[0] is content:
+        return cached[1]
+    tokens = count_tokens(content)
+    msg[MESSAGE_TOKENS_KEY] = (content, tokens)
+    return tokens
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """
+    Estimate the prompt size of a conversation in tokens.
+
+    Args:
+        messages: Chat messages (role, content, images)
+
+    Returns:
+        Approximate token count including template overhead and images
+    """
+    total = 0
+    for msg in messages:
+        total += message_tokens(msg) + MESSAGE_OVERHEAD_TOKENS
+        total += IMAGE_TOKENS * len(msg.get("images") or ())
+    return total
+
+
+def bucket_num_ctx(needed: int, max_ctx: int | None = None) -> int:
+    """
+    Round a context size up to the next bucket.
+
+    Args:
+        needed: Tokens required (prompt + room for the answer)
+        max_ctx: Model's maximum context length, if known
+
+    Returns:
+        The smallest bucket >= needed, capped at the largest bucket and max_ctx
+    """
+    size = next((b for b in num_ctx_buckets if b >= needed), num_ctx_buckets[-1])
+    if max_ctx:
+        size = min(size, max_ctx)
+    return size
+
+
+def _max_context(modelname: str) -> int | None:
+    capabilities = capability_catalog.get(modelname)
+    return capabilities.context_length if capabilities else None
+
+
+def _answer_reserve(options: dict) -> int:
+    num_predict = options.get("num_predict", 0)
+    return num_predict if num_predict > 0 else num_ctx_reserve
+
+
+def trim_history(
+    modelname: str, messages: list[dict], options: dict | None = None
+) -> int:
+    """
+    Drop the oldest turns, in one large step, if the history no longer fits.
+
+    The system prompt is kept and the history restarts at a user message.
+    Trimming down to CONTEXT_TRIM_TARGET of the budget (instead of just
+    below it) leaves room for many more turns before the next trim, so the
+    prompt prefix stays stable and Ollama can keep reusing its KV cache.
+
+    Args:
+        modelname: Model that will answer
+        messages: Conversation, modified in place
+        options: Ollama options for the request (num_ctx, num_predict)
+
+    Returns:
+        Estimated prompt size in model tokens after trimming
+    """
+    options = options or {}
+    factor = token_calibrator.factor(modelname)
+    sizes = [estimate_tokens([msg]) * factor for msg in messages]
+    total = sum(sizes)
+    if "num_ctx" in options:
+        limit = options["num_ctx"]
+    else:
+        max_ctx = _max_context(modelname)
+        limit = min(num_ctx_buckets[-1], max_ctx) if max_ctx else num_ctx_buckets[-1]
+    budget = limit - _answer_reserve(options)
+    if total <= budget:
+        return round(total)
+
+    first = 1 if messages and messages[0].get("role") == "system" else 0
+    target = budget * trim_target
+    cut = first
+    # Always keep the latest message, even if it alone exceeds the target
+    while cut < len(messages) - 1 and total > target:
+        total -= sizes[cut]
+        cut += 1
+    while cut < len(messages) - 1 and messages[cut].get("role") != "user":
+        total -= sizes[cut]
+        cut += 1
+    logger.info(
+        f"Trimmed {cut - first} old messages for '{modelname}' "
+        f"(~{sum(sizes):.0f} -> ~{total:.0f} tokens, budget {budget})"
+    )
+    del messages[first:cut]
+    prefix_stats.trims += 1
+    return round(total)
+
+
+def build_options(
+    modelname: str,
+    messages: list[dict],
+    prompt_options: dict | None = None,
+    session_options: dict | None = None,
+    prompt_tokens: int | None = None,
+) -> dict:
+    """
+    Build the "options" object for an /api/chat request.
+
+    Session overrides win over system prompt options. num_ctx is sized
+    from the conversation unless it was set explicitly.
+
+    Args:
+        modelname: Model that will answer
+        messages: Messages that will be sent
+        prompt_options: Options defined by the selected system prompt
+        session_options: Overrides set with /options
+        prompt_tokens: Prompt size in model tokens if already estimated (e.g. by trim_history)
+
+    Returns:
+        Dict of Ollama options (may be empty)
+    """
+    options = {**(prompt_options or {}), **(session_options or {})}
+    if dynamic_num_ctx and "num_ctx" not in options:
+        if prompt_tokens is None:
+            prompt_tokens = token_calibrator.estimate(modelname, estimate_tokens(messages))
+        needed = prompt_tokens + _answer_reserve(options)
+        options["num_ctx"] = bucket_num_ctx(needed, _max_context(modelname))
+        if needed > options["num_ctx"]:
+            logger.warning(
+                f"Conversation needs ~{needed} tokens but num_ctx is capped at "
+                f"{options['num_ctx']} for '{modelname}'; Ollama will truncate it"
+            )
+    return options
@@ -1,18 +1,92 @@
+import functools
+import logging
+import os
+import re
 import sqlite3
+import threading
 import uuid
+
+from dotenv import load_dotenv
+
+from bot.core.metrics import db_call_seconds
 from bot.utils import count_tokens
 
+load_dotenv()
 
-# From run.py
-def init_db() -> None:
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "users.db")
+# Memory-mapped I/O and page cache sizes per connection
+DATABASE_MMAP_MB = int(os.getenv("DATABASE_MMAP_MB", "256"))
+DATABASE_CACHE_MB = int(os.getenv("DATABASE_CACHE_MB", "16"))
+# Compiled statements kept per connection (sqlite3's statement cache)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# Bumped by close_db() so threads drop connections closed under them
+_generation = 0
+
+
+def get_connection() -> sqlite3.Connection:
     """
-    Initialize the SQLite database with all required tables.
+    Return this thread's long-lived connection, opening it on first use.
 
-    Creates tables: users, chat_sessions, chats, system_prompts, bot_config
-    if they don't already exist.
+    Every thread (the event loop and asyncio.to_thread workers) keeps one
+    connection for the life of the process, so queries reuse the compiled
+    statements in sqlite3's statement cache instead of reopening the file
+    and re-parsing the schema on every call. The database runs in WAL mode
+    so readers never block on the writer.
     """
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        # check_same_thread=False only so close_db() can close it at shutdown
+        conn = sqlite3.connect(
+            DATABASE_PATH,
+            timeout=5.0,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={DATABASE_MMAP_MB * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size=-{DATABASE_CACHE_MB * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _local.conn = conn
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_db() -> None:
+    """Close every connection opened by get_connection() (the last one checkpoints the WAL)."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        try:
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing database connection: {e}")
+
+
+def _timed(func):
+    """Record the call latency in the bot_db_call_seconds histogram."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with db_call_seconds.time(function=func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _create_base_tables(c: sqlite3.Cursor) -> None:
     c.execute("""CREATE TABLE IF NOT EXISTS users
                  (id INTEGER PRIMARY KEY,
                   name TEXT,
@@ -43,12 +117,347 @@ def init_db() -> None:
     c.execute("""CREATE TABLE IF NOT EXISTS bot_config
                  (key TEXT PRIMARY KEY,
                   value TEXT)""")
+
+
+def _add_chat_token_counts(c: sqlite3.Cursor) -> None:
+    _add_column(c, "chats", "token_count", "INTEGER")
+
+
+def _create_generation_stats(c: sqlite3.Cursor) -> None:
+    c.execute("""CREATE TABLE IF NOT EXISTS generation_stats
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  chat_id INTEGER,
+                  user_id INTEGER,
+                  model TEXT,
+                  cached BOOLEAN,
+                  ttft_ms REAL,
+                  edit_count INTEGER,
+                  total_duration INTEGER,
+                  load_duration INTEGER,
+                  prompt_eval_count INTEGER,
+                  prompt_eval_duration INTEGER,
+                  eval_count INTEGER,
+                  eval_duration INTEGER,
+                  done_reason TEXT,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (chat_id) REFERENCES chats(id),
+                  FOREIGN KEY (user_id) REFERENCES users(id))""")
+
+
+def _create_hot_path_indexes(c: sqlite3.Cursor) -> None:
+    # load_chat_history: WHERE session_id = ? ORDER BY timestamp DESC, id DESC
+    # (the rowid is implicitly the last index column)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chats_session ON chats(session_id, timestamp)")
+    # delete_chat_history: WHERE user_id = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chats_user ON chats(user_id)")
+    # get_user_chat_sessions: covering, no table lookups
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_sessions_user"
+        " ON chat_sessions(user_id, created_at, session_id, name)"
+    )
+    # get_generation_stats: WHERE created_at >= ?
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_generation_stats_created"
+        " ON generation_stats(created_at)"
+    )
+
+
+def _add_chat_cum_tokens(c: sqlite3.Cursor) -> None:
+    # Running total of token_count per session, in insertion order (id);
+    # existing rows are filled by fill_cum_tokens_batch()
+    _add_column(c, "chats", "cum_tokens", "INTEGER")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_session_cum ON chats(session_id, cum_tokens)"
+    )
+
+
+# bot_config key holding the progress of the search index backfill
+FTS_BACKFILL_KEY = "chats_fts_backfill"
+
+
+def _create_chats_fts(c: sqlite3.Cursor) -> None:
+    # Full-text index over chats.content for /search. External content:
+    # the text is stored once, in chats, and triggers keep the index in sync.
+    # user_id is indexed too so a search can be limited to one user's rows.
+    # detail=column keeps the doclists small (bm25 reads the whole doclist of
+    # every query term) at the cost of phrase queries, which /search never
+    # issues; the 3-character prefix index serves "abc*" searches.
+    try:
+        c.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5("
+            "content, user_id, content='chats', content_rowid='id',"
+            " tokenize='unicode61 remove_diacritics 2', detail=column, prefix='3')"
+        )
+    except sqlite3.OperationalError as e:
+        logger.warning(f"SQLite has no FTS5 support, /search is disabled: {e}")
+        return
+    # Rows with ids up to bot_config[FTS_BACKFILL_KEY] are not indexed until
+    # index_chats_batch() reaches them, so they must not be removed from the
+    # index (an FTS5 'delete' of a row it doesn't hold corrupts it)
+    indexed = (
+        "old.id > COALESCE((SELECT CAST(value AS INTEGER) FROM bot_config"
+        f" WHERE key = '{FTS_BACKFILL_KEY}'), 0)"
+    )
+    c.execute("""CREATE TRIGGER IF NOT EXISTS chats_fts_insert AFTER INSERT ON chats BEGIN
+                     INSERT INTO chats_fts (rowid, content, user_id)
+                     VALUES (new.id, new.content, new.user_id);
+                 END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS chats_fts_delete AFTER DELETE ON chats
+                  WHEN {indexed} BEGIN
+                      INSERT INTO chats_fts (chats_fts, rowid, content, user_id)
+                      VALUES ('delete', old.id, old.content, old.user_id);
+                  END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS chats_fts_update
+                  AFTER UPDATE OF content, user_id ON chats WHEN {indexed} BEGIN
+                      INSERT INTO chats_fts (chats_fts, rowid, content, user_id)
+                      VALUES ('delete', old.id, old.content, old.user_id);
+                      INSERT INTO chats_fts (rowid, content, user_id)
+                      VALUES (new.id, new.content, new.user_id);
+                  END""")
+    # Per-term document counts, see search_chat_history()
+    c.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts_vocab USING fts5vocab(chats_fts, col)"
+    )
+    # ORDER BY rank: bm25 on the message text only
+    c.execute("INSERT INTO chats_fts (chats_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+    # Rows saved so far are indexed in the background by index_chats_batch()
+    c.execute(
+        "INSERT OR REPLACE INTO bot_config (key, value)"
+        " SELECT ?, COALESCE(MAX(id), 0) FROM chats",
+        (FTS_BACKFILL_KEY,),
+    )
+
+
+@_timed
+def index_chats_batch(batch_size: int = 2000) -> int | None:
+    """
+    Add one batch of messages saved before the search index existed to it.
+
+    Works downwards from the newest unindexed id, so recent messages become
+    searchable first. Progress is kept in bot_config[FTS_BACKFILL_KEY] and
+    committed with each batch, so an interrupted backfill resumes where it
+    stopped. Must run on the writer thread: the delete triggers read the
+    progress to know which rows are indexed.
+
+    Args:
+        batch_size: Ids covered per transaction
+
+    Returns:
+        Number of messages indexed, or None if nothing was left to index
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    row = c.execute("SELECT value FROM bot_config WHERE key = ?", (FTS_BACKFILL_KEY,)).fetchone()
+    if row is None:
+        return None
+    upto = int(row[0])
+    low = max(0, upto - batch_size)
+    try:
+        c.execute(
+            "INSERT INTO chats_fts (rowid, content, user_id)"
+            " SELECT id, content, user_id FROM chats WHERE id > ? AND id <= ?",
+            (low, upto),
+        )
+        indexed = c.rowcount
+        if low > 0:
+            c.execute(
+                "UPDATE bot_config SET value = ? WHERE key = ?", (str(low), FTS_BACKFILL_KEY)
+            )
+        else:
+            c.execute("DELETE FROM bot_config WHERE key = ?", (FTS_BACKFILL_KEY,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return indexed
+
+
+@_timed
+def merge_chats_fts(pages: int = 500) -> bool:
+    """
+    Do a bounded step of merging the search index's segments.
+
+    A backfill leaves many small segments behind; merging them keeps
+    searches fast without the long write lock of a full 'optimize'.
+
+    Args:
+        pages: Index pages written at most in this step
+
+    Returns:
+        True if there is more merging to do
+    """
+    conn = get_connection()
+    before = conn.total_changes
+    conn.execute("INSERT INTO chats_fts (chats_fts, rank) VALUES ('merge', ?)", (pages,))
     conn.commit()
-    conn.close()
+    # Per the FTS5 docs: fewer than 2 changes means no merge work was left
+    return conn.total_changes - before >= 2
+
+
+def _add_column(c: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    # Databases created by older versions may already have the column
+    columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Schema migrations, in order. PRAGMA user_version stores how many have been
+# applied. Databases from before migrations existed are at version 0; the
+# first steps are idempotent so they upgrade cleanly. Only append here.
+MIGRATIONS = (
+    _create_base_tables,
+    _add_chat_token_counts,
+    _create_generation_stats,
+    _create_hot_path_indexes,
+    _add_chat_cum_tokens,
+    _create_chats_fts,
+)
 
 
 # From run.py
-def save_chat_message(user_id: int, session_id: str | None, role: str, content: str) -> None:
+@_timed
+def init_db() -> None:
+    """
+    Create or upgrade the database schema.
+
+    Applies every migration in MIGRATIONS newer than the database's
+    PRAGMA user_version, each in its own transaction together with the
+    version bump, then refreshes the query planner statistics. Messages
+    saved before the search index existed are indexed afterwards, in the
+    background (see index_chats_batch).
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version > len(MIGRATIONS):
+        logger.warning(
+            f"Database schema version {version} is newer than this bot ({len(MIGRATIONS)})"
+        )
+        return
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Applying database migration {number}: {migration.__name__.lstrip('_')}")
+        c.execute("BEGIN")
+        try:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if version < len(MIGRATIONS):
+        c.execute("ANALYZE")
+        conn.commit()
+    if version >= MIGRATIONS.index(_create_chats_fts) + 1:
+        c.execute("SELECT 1 FROM sqlite_master WHERE name = 'chats_fts'")
+        if c.fetchone() is None:
+            # The migration ran on an SQLite build without FTS5; try again
+            # in case SQLite has been upgraded since
+            c.execute("BEGIN")
+            try:
+                _create_chats_fts(c)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+@_timed
+@_timed
+def fill_token_counts_batch(after_id: int = 0, batch_size: int = 500) -> int | None:
+    """
+    Fill chats.token_count for one batch of rows saved before the column existed.
+
+    Keyset paging on the rowid: each batch resumes after the previous one
+    instead of rescanning the rows already filled. Must run on the writer
+    thread, like the other writes.
+
+    Args:
+        after_id: Last id of the previous batch (0 to start)
+        batch_size: Rows tokenized per transaction
+
+    Returns:
+        Last id filled, to pass as after_id to the next batch, or None if
+        no rows were left
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT id, content FROM chats WHERE id > ? AND token_count IS NULL ORDER BY id LIMIT ?",
+        (after_id, batch_size),
+    )
+    rows = c.fetchall()
+    if not rows:
+        return None
+    c.executemany(
+        "UPDATE chats SET token_count = ? WHERE id = ?",
+        [(count_tokens(content or ""), row_id) for row_id, content in rows],
+    )
+    conn.commit()
+    return rows[-1][0]
+
+
+@_timed
+def fill_cum_tokens_batch(after_session: str = "", batch_size: int = 500) -> str | None:
+    """
+    Compute chats.cum_tokens for one batch of sessions that lack them.
+
+    Runs once every token_count is filled (see fill_token_counts_batch).
+    Sessions are taken in session_id order on idx_chats_session_cum. Must
+    run on the writer thread.
+
+    Args:
+        after_session: Last session id of the previous batch ("" to start)
+        batch_size: Sessions totalled per transaction
+
+    Returns:
+        Last session id done, to pass as after_session to the next batch,
+        or None if no sessions were left
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT DISTINCT session_id FROM chats"
+        " WHERE session_id > ? AND cum_tokens IS NULL ORDER BY session_id LIMIT ?",
+        (after_session, batch_size),
+    )
+    sessions = [row[0] for row in c.fetchall()]
+    if not sessions:
+        return None
+    c.execute(
+        "UPDATE chats SET cum_tokens = totals.cum FROM"
+        " (SELECT id, SUM(token_count) OVER (PARTITION BY session_id ORDER BY id) AS cum"
+        f"  FROM chats WHERE session_id IN ({', '.join('?' * len(sessions))})) AS totals"
+        " WHERE chats.id = totals.id",
+        sessions,
+    )
+    conn.commit()
+    return sessions[-1]
+
+
+def backfill_token_counts(batch_size: int = 500) -> None:
+    """
+    Fill chats.token_count and chats.cum_tokens for rows saved before
+    the columns existed, one committed batch at a time.
+
+    The bot runs the batches through the writer thread instead (see
+    run.py), so chat writes interleave with them.
+
+    Args:
+        batch_size: Rows tokenized (or sessions totalled) per transaction
+    """
+    last_id = 0
+    while (last_id := fill_token_counts_batch(last_id, batch_size)) is not None:
+        pass
+    last_session = ""
+    while (last_session := fill_cum_tokens_batch(last_session, batch_size)) is not None:
+        pass
+
+
+# From run.py
+@_timed
+def save_chat_message(
+    user_id: int, session_id: str | None, role: str, content: str
+) -> int | None:
     """
     Save a single chat message to the database.
 
@@ -57,20 +466,168 @@ def save_chat_message(user_id: int, session_id: str | None, role: str, content:
         session_id: Chat session ID (None for temporary chats)
         role: Message role ("user" or "assistant")
         content: Text content of the message
+
+    Returns:
+        Row id of the saved message, or None for temporary chats
     """
     if session_id is None:
-        return
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
+        return None
+    conn = get_connection()
+    row_id = _insert_chat_message(conn.cursor(), user_id, session_id, role, content)
+    conn.commit()
+    return row_id
+
+
+def _insert_chat_message(
+    c: sqlite3.Cursor, user_id: int, session_id: str, role: str, content: str
+) -> int:
+    # cum_tokens stays NULL while older rows of the session still lack it
     c.execute(
-        "INSERT INTO chats (user_id, session_id, role, content) VALUES (?, ?, ?, ?)",
-        (user_id, session_id, role, content),
+        "INSERT INTO chats (user_id, session_id, role, content, token_count, cum_tokens)"
+        " VALUES (:user_id, :session_id, :role, :content, :tokens,"
+        " CASE WHEN EXISTS (SELECT 1 FROM chats"
+        "  WHERE session_id = :session_id AND cum_tokens IS NULL) THEN NULL"
+        " ELSE COALESCE((SELECT MAX(cum_tokens) FROM chats"
+        "  WHERE session_id = :session_id), 0) + :tokens END)",
+        {
+            "user_id": user_id,
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "tokens": count_tokens(content or ""),
+        },
     )
+    return c.lastrowid
+
+
+GENERATION_STATS_COLUMNS = (
+    "chat_id",
+    "user_id",
+    "model",
+    "cached",
+    "ttft_ms",
+    "edit_count",
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "done_reason",
+)
+
+
+@_timed
+def save_generation_stats(stats: dict) -> None:
+    """
+    Save the telemetry of one generation.
+
+    Args:
+        stats: Values keyed by GENERATION_STATS_COLUMNS (missing keys are NULL).
+            chat_id links to the assistant message in `chats` (None for
+            temporary chats); durations are in nanoseconds as reported by Ollama.
+    """
+    conn = get_connection()
+    _insert_generation_stats(conn.cursor(), stats)
     conn.commit()
-    conn.close()
+
+
+def _insert_generation_stats(c: sqlite3.Cursor, stats: dict) -> int:
+    c.execute(
+        f"INSERT INTO generation_stats ({', '.join(GENERATION_STATS_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(GENERATION_STATS_COLUMNS))})",
+        tuple(stats.get(column) for column in GENERATION_STATS_COLUMNS),
+    )
+    return c.lastrowid
+
+
+# Row inserters usable by write_batch(), by kind
+_BATCH_INSERTS = {
+    "chat_message": lambda c, args: _insert_chat_message(c, *args),
+    "generation_stats": lambda c, args: _insert_generation_stats(c, *args),
+}
+
+
+def _resolve_refs(value):
+    # Earlier writes of the same queue stand in for their (future) row id
+    if isinstance(value, dict):
+        return {key: getattr(item, "row_id", item) for key, item in value.items()}
+    return getattr(value, "row_id", value)
+
+
+def _apply_write(c: sqlite3.Cursor, write) -> None:
+    args = tuple(_resolve_refs(arg) for arg in write.args)
+    write.row_id = _BATCH_INSERTS[write.kind](c, args)
+
+
+@_timed
+def write_batch(writes: list) -> None:
+    """
+    Insert a batch of queued rows in a single transaction.
+
+    Used by the write-behind queue (bot.core.write_behind). Each write has
+    a kind (a key of _BATCH_INSERTS) and args; its row_id is set once it is
+    inserted, and argument values (or dict values) that are earlier writes
+    are replaced by their row id, so a stats row can point at a message
+    queued before it. If the batch fails, the writes are retried one by
+    one and the failing ones get their error set instead.
+
+    Args:
+        writes: Objects with kind, args, row_id and error attributes
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    # Any exception, not only sqlite3.Error: a bad write must not leave the
+    # transaction open, or its rows would be committed by the next batch
+    try:
+        for write in writes:
+            _apply_write(c, write)
+        conn.commit()
+        return
+    except Exception:
+        conn.rollback()
+    for write in writes:
+        write.row_id = None
+    for write in writes:
+        try:
+            _apply_write(c, write)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            write.row_id = None
+            write.error = e
+
+
+@_timed
+def get_generation_stats(window: str | None = None) -> list[tuple]:
+    """
+    Retrieve generation telemetry, optionally limited to a recent window.
+
+    Args:
+        window: SQLite datetime modifier such as "-24 hours" (None = all rows)
+
+    Returns:
+        List of tuples: (model, cached, ttft_ms, edit_count, total_duration,
+        load_duration, prompt_eval_count, prompt_eval_duration, eval_count,
+        eval_duration) for each generation
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    query = (
+        "SELECT model, cached, ttft_ms, edit_count, total_duration, load_duration,"
+        " prompt_eval_count, prompt_eval_duration, eval_count, eval_duration"
+        " FROM generation_stats"
+    )
+    if window is None:
+        c.execute(query)
+    else:
+        c.execute(query + " WHERE created_at >= datetime('now', ?)", (window,))
+    rows = c.fetchall()
+    return rows
 
 
 # From func/interactions.py
+@_timed
 def add_global_prompt(name: str, prompt_text: str) -> None:
     """
     Add a new global system prompt.
@@ -79,17 +636,17 @@ def add_global_prompt(name: str, prompt_text: str) -> None:
         name: Display name for the prompt
         prompt_text: Actual system prompt text
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute(
         "INSERT INTO system_prompts (name, prompt, is_global) VALUES (?, ?, 1)",
         (name, prompt_text),
     )
     conn.commit()
-    conn.close()
 
 
 # From func/interactions.py
+@_timed
 def get_global_prompts() -> list[tuple]:
     """
     Retrieve all global system prompts from database.
@@ -97,15 +654,15 @@ def get_global_prompts() -> list[tuple]:
     Returns:
         List of tuples: (id, name, prompt) for each global prompt
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT id, name, prompt FROM system_prompts WHERE is_global = 1")
     prompts = c.fetchall()
-    conn.close()
     return prompts
 
 
 # From func/interactions.py
+@_timed
 def delete_global_prompt(prompt_id: int) -> None:
     """
     Delete a global system prompt by ID.
@@ -113,61 +670,112 @@ def delete_global_prompt(prompt_id: int) -> None:
     Args:
         prompt_id: ID of the prompt to delete
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("DELETE FROM system_prompts WHERE id = ?", (prompt_id,))
     conn.commit()
-    conn.close()
 
 
 # From func/interactions.py
+@_timed
 def load_chat_history(session_id: str, token_limit: int = 4096) -> list[dict]:
     """
     Load chat history from the database for a specific session,
     limited by an approximate token count.
+
+    Returns the newest messages whose token counts add up to at most
+    token_limit, oldest first. With running totals (cum_tokens) in place
+    this is a single range query on idx_chats_session_cum; sessions not
+    backfilled yet are read newest first in pages until the budget is used.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
-    # Retrieve messages in reverse chronological order to get the most recent ones first
     c.execute(
-        "SELECT role, content FROM chats WHERE session_id = ? ORDER BY timestamp DESC",
-        (session_id,),
+        "SELECT 1 FROM chats WHERE session_id = ? AND cum_tokens IS NULL LIMIT 1", (session_id,)
     )
+    if c.fetchone() is not None:
+        return _load_chat_history_paged(c, session_id, token_limit)
 
-    history = []
-    total_tokens = 0
+    # Every row whose running total reaches into the last token_limit tokens;
+    # the first one may end exactly where the budget starts
+    c.execute(
+        "SELECT role, content, token_count, cum_tokens FROM chats"
+        " WHERE session_id = :session_id AND cum_tokens >="
+        " (SELECT MAX(cum_tokens) FROM chats WHERE session_id = :session_id) - :limit"
+        " ORDER BY cum_tokens, id",
+        {"session_id": session_id, "limit": token_limit},
+    )
+    rows = c.fetchall()
+    if rows and rows[0][3] - rows[0][2] < rows[-1][3] - token_limit:
+        rows = rows[1:]
+    return [_history_message(role, content, tokens) for role, content, tokens, _ in rows]
 
-    all_messages = c.fetchall()
-    conn.close()
 
-    # Build the history chronologically by inserting at the beginning
-    for role, content in all_messages:
-        message_tokens = count_tokens(content)
+# Key under which a message dict caches the token count of its content, as
+# (content, tokens); see bot.core.context.message_tokens. Keys starting with
+# "_" are not sent to Ollama.
+MESSAGE_TOKENS_KEY = "_tokens"
 
-        if total_tokens + message_tokens > token_limit:
-            break
 
-        history.insert(0, {"role": role, "content": content})
-        total_tokens += message_tokens
+def _history_message(role: str, content: str, tokens: int) -> dict:
+    return {"role": role, "content": content, MESSAGE_TOKENS_KEY: (content, tokens)}
 
+
+def _load_chat_history_paged(
+    c: sqlite3.Cursor, session_id: str, token_limit: int, page_size: int = 50
+) -> list[dict]:
+    history = []
+    total_tokens = 0
+    last_id = None
+    budget_used = False
+    while not budget_used:
+        if last_id is None:
+            c.execute(
+                "SELECT id, role, content, token_count FROM chats WHERE session_id = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (session_id, page_size),
+            )
+        else:
+            c.execute(
+                "SELECT id, role, content, token_count FROM chats WHERE session_id = ?"
+                " AND id < ? ORDER BY id DESC LIMIT ?",
+                (session_id, last_id, page_size),
+            )
+        rows = c.fetchall()
+        for row_id, role, content, token_count in rows:
+            message_tokens = (
+                token_count if token_count is not None else count_tokens(content or "")
+            )
+            if total_tokens + message_tokens > token_limit:
+                budget_used = True
+                break
+            history.append(_history_message(role, content, message_tokens))
+            total_tokens += message_tokens
+            last_id = row_id
+        if len(rows) < page_size:
+            break
+    # Collected newest first
+    history.reverse()
     return history
 
 
 # From func/interactions.py
+@_timed
 def delete_chat_history(user_id: int) -> bool:
     """
     Deletes all chat history for a specific user from the database.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("DELETE FROM chats WHERE user_id = ?", (user_id,))
     deleted = c.rowcount > 0
     conn.commit()
-    conn.close()
+    _term_doc_counts.clear()
     return deleted
 
 
 # From func/interactions.py
+@_timed
 def get_all_users_from_db() -> list[tuple]:
     """
     Retrieve all users from the database.
@@ -175,16 +783,16 @@ def get_all_users_from_db() -> list[tuple]:
     Returns:
         List of tuples: (id, name, selected_prompt_id) for each user
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     # FIX: Select all 3 columns to prevent unpacking errors in handlers
     c.execute("SELECT id, name, selected_prompt_id FROM users")
     users = c.fetchall()
-    conn.close()
     return users
 
 
 # From func/interactions.py
+@_timed
 def remove_user_from_db(user_id: int) -> bool:
     """
     Remove a user from the allowlist.
@@ -195,54 +803,166 @@ def remove_user_from_db(user_id: int) -> bool:
     Returns:
         bool: True if user was removed, False if not found
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("DELETE FROM users WHERE id = ?", (user_id,))
     removed = c.rowcount > 0
     conn.commit()
-    conn.close()
     return removed
 
 
 # From func/interactions.py
+@_timed
 def get_user_chat_sessions(user_id: int) -> list[tuple]:
     """
     Retrieves all chat sessions for a specific user.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute(
         "SELECT session_id, name FROM chat_sessions WHERE user_id = ? ORDER BY created_at DESC",
         (user_id,),
     )
     sessions = c.fetchall()
-    conn.close()
     return sessions
 
 
+# Marks around matched terms in search snippets (control characters, so
+# they can't clash with message text)
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+
+# Terms found in more than this share of messages get no bm25 weight (their
+# idf is clamped to ~0) but ranking would read their whole doclist, which
+# takes 100+ ms on a few million rows; they are left out of ranked searches
+COMMON_TERM_SHARE = 0.5
+
+
+def _search_terms(text: str) -> list[tuple[str, bool]]:
+    # Split like the unicode61 tokenizer (letters and digits); a * right
+    # after a word of 3+ characters asks for prefix matching (shorter
+    # prefixes would match a large part of the vocabulary)
+    return [
+        (word.lower(), prefix == "*" and len(word) >= 3)
+        for word, prefix in re.findall(r"([^\W_]+)(\*?)", text)
+    ]
+
+
+def _fts_query(terms: list[tuple[str, bool]]) -> str:
+    # Every term is quoted, so user input can't form operators or syntax errors
+    return " ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in terms)
+
+
+# Document counts are cached per term: counting reads the term's whole
+# doclist, which is slow for very common terms. They only decide whether a
+# term is common (bm25 reads live statistics), so a count is reused until
+# the table has grown by TERM_COUNT_MAX_GROWTH; deletes clear the cache.
+TERM_COUNT_CACHE_SIZE = 4096
+TERM_COUNT_MAX_GROWTH = 0.01
+# term -> (messages containing it, MAX(chats.id) when counted)
+_term_doc_counts: dict[str, tuple[int, int]] = {}
+
+
+def _term_doc_count(c: sqlite3.Cursor, term: str, max_docs: int) -> int:
+    cached = _term_doc_counts.get(term)
+    if cached is not None and max_docs - cached[1] <= max_docs * TERM_COUNT_MAX_GROWTH:
+        return cached[0]
+    row = c.execute(
+        "SELECT doc FROM chats_fts_vocab WHERE term = ? AND col = 'content'", (term,)
+    ).fetchone()
+    count = row[0] if row else 0
+    if len(_term_doc_counts) >= TERM_COUNT_CACHE_SIZE:
+        _term_doc_counts.clear()
+    _term_doc_counts[term] = (count, max_docs)
+    return count
+
+
+@_timed
+def search_chat_history(
+    user_id: int, text: str, limit: int = 5, offset: int = 0
+) -> list[tuple] | None:
+    """
+    Full-text search over a user's saved chat messages.
+
+    Results are ranked with bm25 on the message text. Words found in most
+    messages (see COMMON_TERM_SHARE) carry no weight in bm25, so they are
+    dropped when the query has other words; a query of only such words
+    lists the newest matches first. Snippets mark the matched terms with
+    SNIPPET_START / SNIPPET_END.
+
+    Args:
+        user_id: Telegram user ID whose messages are searched
+        text: Words to search for, all must match ("word*" matches a prefix)
+        limit: Maximum number of results
+        offset: Results to skip (for pagination)
+
+    Returns:
+        List of tuples: (session_id, session_name, role, snippet, timestamp),
+        best match first, or None if the search index is not available.
+        Until the background backfill finishes, older messages may be missing.
+    """
+    terms = _search_terms(text)
+    if not terms:
+        return []
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'chats_fts_vocab'")
+    if c.fetchone() is None:
+        return None
+
+    max_docs = c.execute("SELECT COALESCE(MAX(id), 0) FROM chats").fetchone()[0]
+    ranked_terms = [
+        (word, prefix)
+        for word, prefix in terms
+        if prefix or _term_doc_count(c, word, max_docs) <= COMMON_TERM_SHARE * max_docs
+    ]
+    order = "rank" if ranked_terms else "chats_fts.rowid DESC"
+    c.execute(
+        "SELECT chats.session_id, chat_sessions.name, chats.role,"
+        " snippet(chats_fts, 0, ?, ?, '…', 16), chats.timestamp"
+        " FROM chats_fts"
+        " JOIN chats ON chats.id = chats_fts.rowid"
+        " JOIN chat_sessions ON chat_sessions.session_id = chats.session_id"
+        " WHERE chats_fts MATCH ? AND chats.user_id = ?"
+        f" ORDER BY {order}"
+        " LIMIT ? OFFSET ?",
+        (
+            SNIPPET_START,
+            SNIPPET_END,
+            f'user_id : "{user_id}" AND content : ({_fts_query(ranked_terms or terms)})',
+            user_id,
+            limit,
+            offset,
+        ),
+    )
+    return c.fetchall()
+
+
 # From func/interactions.py
+@_timed
 def create_chat_session(user_id: int, name: str) -> str:
     """
     Creates a new chat session for a user.
     """
     session_id = str(uuid.uuid4())
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute(
         "INSERT INTO chat_sessions (session_id, user_id, name) VALUES (?, ?, ?)",
         (session_id, user_id, name),
     )
     conn.commit()
-    conn.close()
     return session_id
 
 
 # From func/interactions.py
+@_timed
 def delete_chat_session(session_id: str, user_id: int) -> bool:
     """
     Deletes a chat session and all its associated messages from the database.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
 
     # Delete messages associated with the session
@@ -256,29 +976,30 @@ def delete_chat_session(session_id: str, user_id: int) -> bool:
 
     deleted_sessions = c.rowcount > 0
     conn.commit()
-    conn.close()
+    _term_doc_counts.clear()
     return deleted_sessions
 
 
 # From func/interactions.py
+@_timed
 def add_user_to_db(user_id: int, user_name: str) -> bool:
     """
     Adds a user to the 'users' table. Returns True if added, False if already exists.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     try:
         c.execute("INSERT INTO users (id, name) VALUES (?, ?)", (user_id, user_name))
         conn.commit()
         was_added = True
     except sqlite3.IntegrityError:
+        conn.rollback()
         was_added = False  # User already exists
-    finally:
-        conn.close()
     return was_added
 
 
 # From func/interactions.py
+@_timed
 def update_user_prompt(user_id: int, prompt_id: str | None) -> None:
     """
     Updates the user's selected prompt.
@@ -287,7 +1008,7 @@ def update_user_prompt(user_id: int, prompt_id: str | None) -> None:
     - A string key for predefined prompts ("default", "code", etc.)
     - A numeric ID for custom prompts (will be converted to string)
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     # Ensure the user exists before trying to update, crucial for admins.
     c.execute("INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)", (user_id, f"User {user_id}"))
@@ -295,10 +1016,10 @@ def update_user_prompt(user_id: int, prompt_id: str | None) -> None:
     prompt_id_str = str(prompt_id) if prompt_id is not None else None
     c.execute("UPDATE users SET selected_prompt_id = ? WHERE id = ?", (prompt_id_str, user_id))
     conn.commit()
-    conn.close()
 
 
 # From func/interactions.py
+@_timed
 def get_user_prompt(user_id: int) -> str | None:
     """
     Returns the user's selected prompt identifier.
@@ -307,50 +1028,67 @@ def get_user_prompt(user_id: int) -> str | None:
     - A string key for predefined prompts ("default", "code", etc.)
     - A string representation of a numeric ID for custom prompts
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT selected_prompt_id FROM users WHERE id = ?", (user_id,))
     result = c.fetchone()
-    conn.close()
     if result and result[0] is not None:
         return str(result[0])  # Ensure it's returned as string
     return None
 
 
 # From func/interactions.py
+@_timed
 def is_user_allowed(user_id: int) -> bool:
     """
     Checks if a user is in the 'users' table in the database.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT 1 FROM users WHERE id = ?", (user_id,))
     allowed = c.fetchone() is not None
-    conn.close()
     return allowed
 
 
 # Bot configuration functions
+@_timed
 def get_bot_config(key: str) -> str | None:
     """
     Retrieves a configuration value from bot_config table.
     Returns None if key doesn't exist.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT value FROM bot_config WHERE key = ?", (key,))
     result = c.fetchone()
-    conn.close()
     return result[0] if result else None
 
 
+@_timed
+def get_bot_configs(prefix: str) -> dict[str, str]:
+    """
+    Retrieves every configuration value whose key starts with a prefix.
+
+    Returns:
+        Dict of key -> value
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    # Range scan on the primary key; "\U0010ffff" sorts after any key with the prefix
+    c.execute(
+        "SELECT key, value FROM bot_config WHERE key >= ? AND key < ?",
+        (prefix, prefix + "\U0010ffff"),
+    )
+    return dict(c.fetchall())
+
+
+@_timed
 def set_bot_config(key: str, value: str):
     """
     Sets or updates a configuration value in bot_config table.
     Uses INSERT OR REPLACE to handle both new and existing keys.
     """
-    conn = sqlite3.connect("users.db")
+    conn = get_connection()
     c = conn.cursor()
     c.execute("INSERT OR REPLACE INTO bot_config (key, value) VALUES (?, ?)", (key, value))
     conn.commit()
-    conn.close()
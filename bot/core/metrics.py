@@ -0,0 +1,288 @@
+"""
+Prometheus-compatible metrics for the bot process.
+
+This module provides a small metrics registry (counters, histograms and
+callback gauges with labels) rendered in the Prometheus text exposition
+format, plus an optional aiohttp server that serves it on /metrics.
+The server only starts when METRICS_PORT is set. Counters and histograms
+are updated from database worker threads too, so updates take a lock.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from aiohttp import web
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast DB calls to slow generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [bucket counts..., sum]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def _samples(self) -> list[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+messages_total = registry.counter(
+    "bot_messages_total", "Messages received by the main handler", ("chat_type",)
+)
+generations_total = registry.counter(
+    "bot_generations_total", "Answers produced, by model and outcome", ("model", "outcome")
+)
+errors_total = registry.counter(
+    "bot_generation_errors_total", "Failed generations by error type", ("type",)
+)
+ttft_seconds = registry.histogram(
+    "bot_ttft_seconds", "Time from receiving a message to the first token", ("model",)
+)
+tokens_per_second = registry.histogram(
+    "bot_generation_tokens_per_second",
+    "Generation speed reported by Ollama",
+    ("model",),
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200),
+)
+db_call_seconds = registry.histogram(
+    "bot_db_call_seconds", "Latency of database calls", ("function",)
+)
+db_write_batch_size = registry.histogram(
+    "bot_db_write_batch_size",
+    "Rows committed per write-behind flush",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+db_writes_total = registry.counter(
+    "bot_db_writes_total",
+    "Rows written by the write-behind queue, by kind and outcome",
+    ("kind", "outcome"),
+)
+db_write_backpressure_total = registry.counter(
+    "bot_db_write_backpressure_total", "Writes that had to wait for room in the write-behind queue"
+)
+telegram_request_seconds = registry.histogram(
+    "bot_telegram_request_seconds", "Latency of Telegram Bot API calls", ("method",)
+)
+
+
+class TelegramLatencyMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that times every Bot API request."""
+
+    async def __call__(self, make_request, bot, method):
+        with telegram_request_seconds.time(method=type(method).__name__):
+            return await make_request(bot, method)
+
+
+class MetricsServer:
+    """
+    Embedded HTTP server exposing the registry on /metrics.
+
+    Attributes:
+        host: Interface to bind
+        port: TCP port (the server is disabled when 0)
+    """
+
+    def __init__(self, registry: Registry, host: str = "0.0.0.0", port: int = 0) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self) -> None:
+        """Start serving /metrics if a port is configured."""
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics server listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer(
+    registry,
+    host=os.getenv("METRICS_HOST", "0.0.0.0"),
+    port=int(os.getenv("METRICS_PORT", "0")),
+)
@@ -1,118 +1,367 @@
 import logging
 import os
 import json
+import asyncio
+import random
+import time
 import aiohttp
 from aiohttp import ClientTimeout
 from dotenv import load_dotenv
 
+from bot.core.backends import Backend, BackendPool, parse_backends
+from bot.core.stream import ChatChunk, iter_chat_chunks, iter_ndjson
+
 load_dotenv()
 
 ollama_base_url = os.getenv("OLLAMA_BASE_URL")
 ollama_port = os.getenv("OLLAMA_PORT", "11434")
+# Overall deadline for a generation, in seconds
 timeout = os.getenv("TIMEOUT", "3000")
+# Per-phase deadlines: TCP connect, time to the first chunk (includes model
+# load and prompt evaluation) and longest silence between two chunks
+connect_timeout = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+first_token_timeout = float(os.getenv("OLLAMA_FIRST_TOKEN_TIMEOUT", "300"))
+stall_timeout = float(os.getenv("OLLAMA_STALL_TIMEOUT", "60"))
+# Retries for failures before the stream starts
+max_retries = int(os.getenv("OLLAMA_RETRIES", "2"))
+retry_base_delay = float(os.getenv("OLLAMA_RETRY_BASE_DELAY", "0.5"))
+retry_max_delay = float(os.getenv("OLLAMA_RETRY_MAX_DELAY", "5"))
+RETRY_STATUSES = (502, 503, 504)
+# How long Ollama keeps a model in memory after a request (e.g. "30m", "-1" = forever)
+keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Connection pool tuning for the shared client
+pool_limit = int(os.getenv("OLLAMA_POOL_LIMIT", "100"))
+pool_limit_per_host = int(os.getenv("OLLAMA_POOL_LIMIT_PER_HOST", "32"))
+keepalive_timeout = float(os.getenv("OLLAMA_KEEPALIVE_TIMEOUT", "60"))
+
+# Backend pool: OLLAMA_BACKENDS="host1:11434,host2:11434*2" overrides the single
+# OLLAMA_BASE_URL/OLLAMA_PORT backend
+backend_pool = BackendPool(
+    parse_backends(os.getenv("OLLAMA_BACKENDS", "") or f"{ollama_base_url}:{ollama_port}"),
+    strategy=os.getenv("OLLAMA_LB_STRATEGY", "least_in_flight"),
+    probe_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+    failure_threshold=int(os.getenv("OLLAMA_HEALTH_FAILURES", "3")),
+    breaker_cooldown=float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30")),
+)
+
+
+class OllamaClient:
+    """
+    Long-lived HTTP client shared by every call to the Ollama API.
+
+    Owns a single aiohttp session backed by a tuned TCPConnector so that
+    chat turns reuse pooled keep-alive connections instead of opening a
+    new connection pool (and TCP handshake) per request.
+
+    Attributes:
+        limit: Maximum number of simultaneous connections
+        limit_per_host: Maximum number of simultaneous connections per Ollama host
+        keepalive_timeout: Seconds an idle connection is kept open for reuse
+    """
 
-# Cache for model capabilities to avoid repeated API calls
-_model_capabilities_cache = {}
+    def __init__(
+        self,
+        limit: int = pool_limit,
+        limit_per_host: int = pool_limit_per_host,
+        keepalive_timeout: float = keepalive_timeout,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    async def start(self) -> None:
+        """Create the connector and session if they don't exist yet."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        # Per-request timeouts are passed on each call
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=ClientTimeout(total=None)
+        )
+        logging.info(
+            f"Ollama client started (limit={self.limit}, per_host={self.limit_per_host}, "
+            f"keepalive={self.keepalive_timeout}s)"
+        )
+
+    async def close(self) -> None:
+        """Close the session and release all pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logging.info("Ollama client closed")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session. Raises RuntimeError if the client was not started."""
+        if self._session is None or self._session.closed:
+            raise RuntimeError("Ollama client is not started. Call init_client() first.")
+        return self._session
+
+
+# Shared client, created in run.py:main via init_client()
+client: OllamaClient | None = None
+
+
+async def init_client() -> OllamaClient:
+    """
+    Create and start the shared Ollama client and the backend health probes.
+
+    Returns:
+        The started OllamaClient instance
+    """
+    global client
+    if client is None:
+        client = OllamaClient()
+    await client.start()
+    await backend_pool.start(client.session)
+    return client
+
+
+async def close_client() -> None:
+    """Stop backend health probes and close the shared Ollama client (called at shutdown)."""
+    global client
+    await backend_pool.stop()
+    if client is not None:
+        await client.close()
+        client = None
+
+
+def _parse_keep_alive(value: str) -> str | int:
+    """Ollama accepts durations ("30m") or plain seconds (-1, 0, 300)."""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Return the shared session, starting the client lazily if needed."""
+    if client is None:
+        await init_client()
+    return client.session
+
+
+async def _manage_model_on(backend, action: str, model_name: str):
+    """Run a delete on a single backend and return its response."""
+    timeout_config = ClientTimeout(total=60, connect=10)
+    session = await _get_session()
+    url = f"{backend.url}/api/{action}"
+    data = json.dumps({"name": model_name})
+    headers = {"Content-Type": "application/json"}
+    async with session.delete(
+        url, data=data, headers=headers, timeout=timeout_config
+    ) as response:
+        return response
 
 
 async def manage_model(action: str, model_name: str):
     """
-    Manage Ollama models (pull or delete).
+    Manage Ollama models on every healthy backend.
+
+    Only "delete" is handled here; pulls stream their progress through
+    pull_model() and are run by the pull queue (bot/core/pulls.py).
 
     Args:
-        action: Either "pull" or "delete"
+        action: "delete"
         model_name: Name of the model to manage
 
     Returns:
-        aiohttp.ClientResponse or None if action unsupported
-    """
-    # Optimized timeout for model management operations
-    timeout_config = ClientTimeout(total=600, connect=10)  # 10 min total, 10s connect
-    async with aiohttp.ClientSession(timeout=timeout_config) as session:
-        url = f"http://{ollama_base_url}:{ollama_port}/api/{action}"
-
-        if action == "pull":
-            # Use the exact payload structure from the curl example
-            data = json.dumps({"name": model_name})
-            headers = {"Content-Type": "application/json"}
-            logging.info(f"Pulling model: {model_name}")
-            logging.info(f"Request URL: {url}")
-            logging.info(f"Request Payload: {data}")
-
-            async with session.post(url, data=data, headers=headers) as response:
-                logging.info(f"Pull model response status: {response.status}")
-                response_text = await response.text()
-                logging.info(f"Pull model response text: {response_text}")
-                return response
-        elif action == "delete":
-            data = json.dumps({"name": model_name})
-            headers = {"Content-Type": "application/json"}
-            async with session.delete(url, data=data, headers=headers) as response:
-                return response
+        aiohttp.ClientResponse (the first failed one, if any backend failed)
+        or None if action unsupported
+    """
+    if action != "delete":
+        logging.error(f"Unsupported model management action: {action}")
+        return None
+
+    backends = backend_pool.healthy_backends or [backend_pool.primary()]
+    responses = await asyncio.gather(
+        *(_manage_model_on(b, action, model_name) for b in backends)
+    )
+    for response in responses:
+        if response.status != 200:
+            return response
+    return responses[0]
+
+
+async def pull_model(model_name: str):
+    """
+    Pull a model on every healthy backend, streaming Ollama's progress.
+
+    Backends are pulled one after another.
+
+    Args:
+        model_name: Name of the model to pull
+
+    Yields:
+        dict: Progress objects from /api/pull (status, digest, total, completed),
+              each tagged with the "backend" URL it came from
+
+    Raises:
+        aiohttp.ClientResponseError: On HTTP errors or an error line from Ollama
+        aiohttp.ClientError: On connection errors
+    """
+    # Long total timeout for big models, but fail fast if the stream stalls
+    timeout_config = ClientTimeout(total=None, connect=10, sock_read=300)
+    session = await _get_session()
+    backends = backend_pool.healthy_backends or [backend_pool.primary()]
+
+    for backend in backends:
+        url = f"{backend.url}/api/pull"
+        logging.info(f"Pulling model '{model_name}' on {backend.url}")
+        async with session.post(
+            url, json={"name": model_name, "stream": True}, timeout=timeout_config
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logging.error(f"Pull model error: {response.status} - {error_text}")
+                raise aiohttp.ClientResponseError(
+                    request_info=response.request_info,
+                    history=response.history,
+                    status=response.status,
+                    message=error_text,
+                )
+            async for progress in iter_ndjson(response.content.iter_any()):
+                if "error" in progress:
+                    raise aiohttp.ClientResponseError(
+                        request_info=response.request_info,
+                        history=response.history,
+                        status=response.status,
+                        message=progress["error"],
+                    )
+                progress["backend"] = backend.url
+                yield progress
+        logging.info(f"Pulled model '{model_name}' on {backend.url}")
+
+
+async def _fetch_tags(backend) -> list[dict]:
+    """Fetch /api/tags from a single backend."""
+    # Quick timeout for listing models
+    timeout_config = ClientTimeout(total=15, connect=5)
+    session = await _get_session()
+    async with session.get(f"{backend.url}/api/tags", timeout=timeout_config) as response:
+        if response.status == 200:
+            data = await response.json()
+            return data["models"]
         else:
-            logging.error(f"Unsupported model management action: {action}")
-            return None
+            return []
 
 
 async def model_list():
     """
-    Fetch list of available models from Ollama.
+    Fetch list of available models from all healthy Ollama backends.
+
+    Models installed on several backends are listed once.
 
     Returns:
         List of model dictionaries from Ollama API, empty list on error
     """
-    # Quick timeout for listing models
-    timeout_config = ClientTimeout(total=15, connect=5)
-    async with aiohttp.ClientSession(timeout=timeout_config) as session:
-        url = f"http://{ollama_base_url}:{ollama_port}/api/tags"
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["models"]
-            else:
-                return []
+    backends = backend_pool.healthy_backends or [backend_pool.primary()]
+    if len(backends) == 1:
+        return await _fetch_tags(backends[0])
+
+    results = await asyncio.gather(*(_fetch_tags(b) for b in backends), return_exceptions=True)
+    models = {}
+    for backend, result in zip(backends, results):
+        if isinstance(result, Exception):
+            logging.warning(f"Could not list models on {backend.url}: {result}")
+            continue
+        for model in result:
+            models.setdefault(model["name"], model)
+    return list(models.values())
+
+
+class GenerationTimeout(asyncio.TimeoutError):
+    """
+    Raised when a generation misses one of its deadlines.
 
+    Attributes:
+        phase: "first_token" (no answer started in time), "stall" (the
+            stream stopped producing chunks) or "total" (overall deadline)
+    """
+
+    def __init__(self, phase: str) -> None:
+        super().__init__(f"Ollama generation timed out ({phase})")
+        self.phase = phase
 
-async def generate(payload: dict, modelname: str, prompt: str):
+
+async def _read_with_deadlines(
+    response: aiohttp.ClientResponse, first_token_at: float, deadline: float
+):
     """
-    Generate response from Ollama API using chat completion.
+    Yield raw body chunks, enforcing the first-token, stall and total deadlines.
 
     Args:
-        payload: Dictionary with messages, stream flag, etc.
-        modelname: Name of the model to use
-        prompt: User prompt (for logging)
-
-    Yields:
-        dict: Response chunks from Ollama (streaming) or full response (non-streaming)
+        response: Streaming /api/chat response
+        first_token_at: Loop time by which the first chunk must arrive
+        deadline: Loop time by which the whole stream must end
 
     Raises:
-        aiohttp.ClientResponseError: On HTTP errors from Ollama
-        aiohttp.ClientError: On connection errors
+        GenerationTimeout: When a deadline is missed
     """
-    # Optimized timeout configuration for better resource management
-    client_timeout = ClientTimeout(
-        total=int(timeout),
-        connect=10,  # Connection timeout: 10s
-        sock_read=int(timeout),  # Socket read timeout
-    )
-    async with aiohttp.ClientSession(timeout=client_timeout) as session:
-        url = f"http://{ollama_base_url}:{ollama_port}/api/chat"
-
-        # Prepare the payload according to Ollama API specification
-        ollama_payload = {
-            "model": modelname,
-            "messages": payload.get("messages", []),
-            "stream": payload.get("stream", True),
-        }
+    loop = asyncio.get_running_loop()
+    phase, limit = "first_token", first_token_at
+    while True:
+        if deadline < limit:
+            phase, limit = "total", deadline
+        try:
+            async with asyncio.timeout_at(limit):
+                data = await response.content.readany()
+        except TimeoutError:
+            raise GenerationTimeout(phase) from None
+        if not data:
+            return
+        yield data
+        phase, limit = "stall", loop.time() + stall_timeout
+
+
+async def _chat_once(
+    session: aiohttp.ClientSession,
+    ollama_payload: dict,
+    modelname: str,
+    deadline: float,
+    backend: Backend | None = None,
+    tried: set[str] | None = None,
+):
+    """
+    Run one /api/chat attempt on the reserved backend or the one chosen by the pool.
 
+    Backends in tried are avoided while another healthy one is available; the
+    backend used is added to it.
+    """
+    loop = asyncio.get_running_loop()
+    first_token_at = min(loop.time() + first_token_timeout, deadline)
+    client_timeout = ClientTimeout(total=None, connect=connect_timeout, sock_connect=connect_timeout)
+    if tried is None:
+        tried = set()
+
+    async with backend_pool.acquire(modelname, backend, exclude=tried) as backend:
+        tried.add(backend.url)
+        url = f"{backend.url}/api/chat"
         try:
             logging.info(f"Sending request to Ollama API: {url}")
             logging.info(f"Payload: {json.dumps(ollama_payload, indent=2)}")
 
-            async with session.post(url, json=ollama_payload) as response:
+            try:
+                async with asyncio.timeout_at(first_token_at):
+                    response = await session.post(url, json=ollama_payload, timeout=client_timeout)
+            except TimeoutError as e:
+                if isinstance(e, aiohttp.ClientError):
+                    raise  # connect timeout
+                raise GenerationTimeout("first_token") from None
+
+            async with response:
                 if response.status != 200:
                     error_text = await response.text()
                     logging.error(f"API Error: {response.status} - {error_text}")
+                    if response.status in RETRY_STATUSES:
+                        backend_pool.mark_failure(backend)
                     raise aiohttp.ClientResponseError(
                         request_info=response.request_info,
                         history=response.history,
@@ -120,107 +369,184 @@ async def generate(payload: dict, modelname: str, prompt: str):
                         message=f"API Error: {error_text}",
                     )
 
+                # The node answered and now has the model resident
+                backend_pool.mark_success(backend)
+                backend.loaded_models.setdefault(modelname, {"name": modelname})
+                backend.model_last_used[modelname] = time.time()
+
                 # Handle streaming and non-streaming responses
                 if ollama_payload.get("stream", True):
-                    buffer = b""
-                    async for chunk in response.content.iter_any():
-                        buffer += chunk
-                        while b"\n" in buffer:
-                            line, buffer = buffer.split(b"\n", 1)
-                            line = line.strip()
-                            if line:
-                                try:
-                                    yield json.loads(line)
-                                except json.JSONDecodeError as e:
-                                    logging.error(f"JSON Decode Error: {e}")
-                                    logging.error(f"Problematic line: {line}")
+                    try:
+                        async for chunk in iter_chat_chunks(
+                            _read_with_deadlines(response, first_token_at, deadline)
+                        ):
+                            yield chunk
+                    except (asyncio.CancelledError, GeneratorExit):
+                        # Drop the connection instead of returning it to the pool,
+                        # so Ollama notices the disconnect and stops generating
+                        response.close()
+                        raise
                 else:
                     # Non-streaming: yield the single complete JSON response
-                    response_data = await response.json()
-                    yield response_data
-
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            response_data = await response.json()
+                    except TimeoutError:
+                        raise GenerationTimeout("total") from None
+                    yield ChatChunk.from_dict(response_data)
+
+        except GenerationTimeout as e:
+            logging.error(f"Ollama on {backend.url} missed the {e.phase} deadline")
+            # A hung server counts against the circuit breaker
+            backend_pool.mark_failure(backend)
+            raise
+        except aiohttp.ClientConnectionError as e:
+            logging.error(f"Client Error during request to {backend.url}: {e}")
+            backend_pool.mark_failure(backend)
+            raise
         except aiohttp.ClientError as e:
             logging.error(f"Client Error during request: {e}")
             raise
 
 
-async def get_model_capabilities(modelname: str) -> set:
-    """
-    Fetch model information from Ollama API to determine its capabilities.
-    Uses /api/show endpoint. Results are cached in memory.
-
-    Returns:
-        set: A set of capability strings (e.g., {"vision", "embedding", ...})
-             Returns empty set if capabilities cannot be determined.
+async def generate(
+    payload: dict,
+    modelname: str,
+    prompt: str,
+    options: dict | None = None,
+    backend: Backend | None = None,
+):
     """
-    global _model_capabilities_cache
+    Generate response from Ollama API using chat completion.
 
-    # Check cache first
-    if modelname in _model_capabilities_cache:
-        return _model_capabilities_cache[modelname]
+    Failures before the first chunk (connection errors, HTTP 502/503/504)
+    are retried with jittered exponential backoff; nothing has been shown
+    to the user yet, so a retry is safe. Retries go to another healthy
+    backend when there is one, even before the failing node is ejected.
+    Once streaming has started, errors are raised as-is.
 
-    try:
-        timeout_config = ClientTimeout(total=10, connect=5)
-        async with aiohttp.ClientSession(timeout=timeout_config) as session:
-            url = f"http://{ollama_base_url}:{ollama_port}/api/show"
-            payload = {"name": modelname}
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # Extract capabilities from model info
-                    capabilities = set()
-                    model_info = data.get("model", {})
-                    # Check for vision/multimodal capabilities
-                    if "vision" in model_info.get("capabilities", []):
-                        capabilities.add("vision")
-                    if "multimodal" in model_info.get("capabilities", []):
-                        capabilities.add("multimodal")
-                    # Cache the result
-                    _model_capabilities_cache[modelname] = capabilities
-                    logging.info(f"Model '{modelname}' capabilities: {capabilities}")
-                    return capabilities
-                else:
-                    logging.warning(
-                        f"Could not fetch capabilities for '{modelname}': HTTP {response.status}"
-                    )
-                    _model_capabilities_cache[modelname] = set()
-                    return set()
-    except Exception as e:
-        logging.warning(f"Error fetching capabilities for '{modelname}': {e}")
-        _model_capabilities_cache[modelname] = set()
-        return set()
+    Args:
+        payload: Dictionary with messages, stream flag, etc.
+        modelname: Name of the model to use
+        prompt: User prompt (for logging)
+        options: Ollama model options (num_ctx, temperature, ...), if any
+        backend: Backend reserved by the generation scheduler, if any
 
+    Yields:
+        ChatChunk: Response chunks from Ollama (streaming) or full response (non-streaming)
 
-def model_supports_vision(modelname: str) -> bool:
+    Raises:
+        aiohttp.ClientResponseError: On HTTP errors from Ollama
+        aiohttp.ClientError: On connection errors
+        GenerationTimeout: When the first-token, stall or total deadline is missed
+        BackendUnavailableError: When every backend is ejected (circuit open)
+    """
+    session = await _get_session()
+
+    # Prepare the payload according to Ollama API specification
+    ollama_payload = {
+        "model": modelname,
+        # Keys starting with "_" are local bookkeeping (e.g. cached token counts)
+        "messages": [
+            {key: value for key, value in msg.items() if not key.startswith("_")}
+            for msg in payload.get("messages", [])
+        ],
+        "stream": payload.get("stream", True),
+        "keep_alive": _parse_keep_alive(keep_alive),
+    }
+    if options:
+        ollama_payload["options"] = options
+
+    deadline = asyncio.get_running_loop().time() + float(timeout)
+    attempt = 0
+    tried: set[str] = set()
+    while True:
+        started = False
+        try:
+            # The reservation only holds for the first attempt
+            async for chunk in _chat_once(
+                session,
+                ollama_payload,
+                modelname,
+                deadline,
+                backend if attempt == 0 else None,
+                tried,
+            ):
+                started = True
+                yield chunk
+            return
+        except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError) as e:
+            retryable = (
+                isinstance(e, aiohttp.ClientConnectionError) or e.status in RETRY_STATUSES
+            )
+            if started or not retryable or attempt >= max_retries:
+                raise
+            # Full jitter keeps retries from many users from arriving in lockstep
+            delay = random.uniform(0, min(retry_max_delay, retry_base_delay * 2**attempt))
+            attempt += 1
+            logging.warning(
+                f"Ollama request failed before streaming ({e}); "
+                f"retry {attempt}/{max_retries} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+
+async def embed(texts: list[str], modelname: str) -> list[list[float]]:
     """
-    Check if a model supports vision based on known patterns or cached API info.
-    This is a quick synchronous check using cached data.
+    Embed texts with Ollama's /api/embed endpoint.
+
+    Args:
+        texts: Input strings
+        modelname: Embedding model (e.g. "nomic-embed-text")
 
     Returns:
-        bool: True if model likely supports vision, False otherwise.
+        One embedding vector per input text
+
+    Raises:
+        aiohttp.ClientResponseError: On HTTP errors from Ollama
+        aiohttp.ClientError: On connection errors
     """
-    # Check cache first (from async function)
-    if modelname in _model_capabilities_cache:
-        return (
-            "vision" in _model_capabilities_cache[modelname]
-            or "multimodal" in _model_capabilities_cache[modelname]
-        )
+    timeout_config = ClientTimeout(total=30, connect=5)
+    session = await _get_session()
+    async with backend_pool.acquire(modelname) as backend:
+        async with session.post(
+            f"{backend.url}/api/embed",
+            json={"model": modelname, "input": texts, "keep_alive": _parse_keep_alive(keep_alive)},
+            timeout=timeout_config,
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise aiohttp.ClientResponseError(
+                    request_info=response.request_info,
+                    history=response.history,
+                    status=response.status,
+                    message=f"API Error: {error_text}",
+                )
+            data = await response.json()
+            return data["embeddings"]
+
+
+async def show_model(modelname: str) -> dict | None:
+    """
+    Fetch model details from Ollama's /api/show endpoint.
+
+    Args:
+        modelname: Name of the model
 
-    # Fallback: check by model name patterns (case-insensitive)
-    model_lower = modelname.lower()
-    # Common vision model name patterns
-    vision_patterns = [
-        "llava",
-        "bakllava",
-        "moondream",
-        "vision",
-        "vl",  # vision-language
-        "multimodal",
-        "gemma3",
-        "phi4-multimodal",
-    ]
-    for pattern in vision_patterns:
-        if pattern in model_lower:
-            return True
-
-    return False
+    Returns:
+        Decoded /api/show response, or None if the model could not be queried
+    """
+    try:
+        timeout_config = ClientTimeout(total=10, connect=5)
+        session = await _get_session()
+        # Never the half-open trial of an ejected node: that is left to real traffic
+        backend = backend_pool.select(modelname, trial=False) or backend_pool.primary()
+        url = f"{backend.url}/api/show"
+        async with session.post(url, json={"model": modelname}, timeout=timeout_config) as response:
+            if response.status == 200:
+                return await response.json()
+            logging.warning(f"Could not fetch details for '{modelname}': HTTP {response.status}")
+            return None
+    except Exception as e:
+        logging.warning(f"Error fetching details for '{modelname}': {e}")
+        return None
@@ -0,0 +1,194 @@
+"""
+Background model pull queue for the Ollama Telegram bot.
+
+This module provides the PullQueue class. Pull requests are queued and run
+by a fixed number of worker tasks; a second request for a model that is
+already queued or pulling joins the existing job instead of starting a new
+download. Subscribers receive rate-limited progress updates.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from bot.core.ollama import pull_model
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[["PullJob"], Awaitable[None]]
+
+
+class PullJob:
+    """
+    State of a single model pull.
+
+    Attributes:
+        model: Model name being pulled
+        status: "queued" | "pulling" | "success" | "error"
+        detail: Latest status line reported by Ollama
+        completed: Bytes downloaded for the current layer
+        total: Size in bytes of the current layer
+        digests: Digests of layers that finished downloading
+        error: Error message when status is "error"
+        finished: Event set once the job succeeded or failed
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.status = "queued"
+        self.detail = ""
+        self.completed = 0
+        self.total = 0
+        self.digests: list[str] = []
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished = asyncio.Event()
+        self._subscribers: list[ProgressCallback] = []
+        self._last_notify = 0.0
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "pulling")
+
+    @property
+    def percent(self) -> float:
+        """Download progress of the current layer (0-100)."""
+        return 100.0 * self.completed / self.total if self.total else 0.0
+
+    def apply(self, progress: dict) -> None:
+        """Update the job from one /api/pull progress object."""
+        self.detail = progress.get("status", self.detail)
+        digest = progress.get("digest")
+        if digest:
+            self.total = progress.get("total", self.total) or 0
+            self.completed = progress.get("completed", self.completed) or 0
+            if self.total and self.completed >= self.total and digest not in self.digests:
+                self.digests.append(digest)
+
+
+class PullQueue:
+    """
+    Runs model pulls in the background with bounded concurrency.
+
+    Attributes:
+        concurrency: Number of pulls allowed to run at once
+        notify_interval: Minimum seconds between progress notifications per job
+        jobs: Model name -> most recent PullJob for that model
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 1,
+        notify_interval: float = 3.0,
+        pull_fn=pull_model,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.notify_interval = notify_interval
+        self.jobs: dict[str, PullJob] = {}
+        self._pull_fn = pull_fn
+        self._queue: asyncio.Queue[PullJob] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._on_complete: list[Callable[[PullJob], Awaitable[None]]] = []
+
+    def add_completion_hook(self, hook: Callable[[PullJob], Awaitable[None]]) -> None:
+        """Register a coroutine called after every job that finishes, successful or not."""
+        self._on_complete.append(hook)
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(
+        self, model: str, on_progress: ProgressCallback | None = None
+    ) -> tuple[PullJob, bool]:
+        """
+        Queue a pull, or join the active job for the same model.
+
+        Args:
+            model: Model name to pull
+            on_progress: Optional coroutine called with the job on progress
+
+        Returns:
+            Tuple (job, created): created is False if an existing job was reused
+        """
+        self._ensure_started()
+        job = self.jobs.get(model)
+        created = job is None or not job.is_active
+        if created:
+            job = PullJob(model)
+            self.jobs[model] = job
+            self._queue.put_nowait(job)
+            logger.info(f"Queued pull for model '{model}' ({self.pending} pending)")
+        if on_progress is not None:
+            job._subscribers.append(on_progress)
+        return job, created
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def _notify(self, job: PullJob, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - job._last_notify < self.notify_interval:
+            return
+        job._last_notify = now
+        for callback in list(job._subscribers):
+            try:
+                await callback(job)
+            except Exception as e:
+                logger.warning(f"Pull progress callback failed for '{job.model}': {e}")
+
+    async def _run(self, job: PullJob) -> None:
+        job.status = "pulling"
+        await self._notify(job, force=True)
+        try:
+            async for progress in self._pull_fn(job.model):
+                job.apply(progress)
+                await self._notify(job)
+            job.status = "success"
+            logger.info(f"Pulled model '{job.model}' ({len(job.digests)} layers)")
+        except asyncio.CancelledError:
+            job.status = "error"
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "error"
+            job.error = getattr(e, "message", None) or str(e) or type(e).__name__
+            logger.error(f"Failed to pull model '{job.model}': {job.error}")
+        finally:
+            job.finished.set()
+
+        await self._notify(job, force=True)
+        for hook in self._on_complete:
+            try:
+                await hook(job)
+            except Exception as e:
+                logger.warning(f"Pull completion hook failed for '{job.model}': {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def stop(self) -> None:
+        """Cancel workers (called at shutdown); running pulls are aborted."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+pull_queue = PullQueue(concurrency=int(os.getenv("PULL_CONCURRENCY", "1")))
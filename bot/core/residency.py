@@ -0,0 +1,187 @@
+"""
+Model residency management for the Ollama Telegram bot.
+
+This module provides the ResidencyManager class, which keeps model load
+time out of the user's request: it preloads (warms) the active model at
+startup and on model switch, and unloads least-recently-used models when
+the models resident on a backend exceed a configured memory budget.
+Loaded models and their sizes come from the backend pool's /api/ps probes.
+"""
+
+import asyncio
+import logging
+import os
+
+import aiohttp
+from aiohttp import ClientTimeout
+from dotenv import load_dotenv
+
+from bot.core.backends import Backend, BackendPool
+from bot.core.context import dynamic_num_ctx, num_ctx_buckets
+from bot.core.ollama import backend_pool, keep_alive, _get_session, _parse_keep_alive
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class ResidencyManager:
+    """
+    Preloads models and enforces a per-backend memory budget.
+
+    Attributes:
+        pool: Backend pool whose nodes are managed
+        keep_alive: keep_alive value sent when warming a model
+        memory_budget: Max bytes of resident models per backend (0 = no limit)
+        check_interval: Seconds between budget checks
+        preferred: Model last warmed (the active model); never unloaded
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        keep_alive: str | int = "30m",
+        memory_budget: int = 0,
+        check_interval: float = 30.0,
+    ) -> None:
+        self.pool = pool
+        self.keep_alive = keep_alive
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        self.preferred: str | None = None
+        self._task: asyncio.Task | None = None
+        # Strong references, so running warm-ups are not garbage-collected
+        self._warming: set[asyncio.Task] = set()
+
+    async def _load(
+        self, backend: Backend, model: str, keep_alive: str | int, options: dict | None = None
+    ) -> bool:
+        """Send an empty generate request, which (un)loads a model without generating."""
+        session = await _get_session()
+        # Loading a large model from disk can take minutes
+        timeout_config = ClientTimeout(total=600, connect=10)
+        body = {"model": model, "keep_alive": keep_alive}
+        if options:
+            body["options"] = options
+        try:
+            async with session.post(
+                f"{backend.url}/api/generate",
+                json=body,
+                timeout=timeout_config,
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning(
+                        f"Could not (un)load '{model}' on {backend.url}: "
+                        f"HTTP {response.status} - {error_text}"
+                    )
+                    return False
+                await response.read()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not (un)load '{model}' on {backend.url}: {e}")
+            return False
+
+    async def warm(self, model: str) -> None:
+        """
+        Preload a model on every healthy backend and make it the preferred model.
+
+        Args:
+            model: Model name to load into memory
+        """
+        if not model:
+            return
+        self.preferred = model
+        backends = self.pool.healthy_backends
+        logger.info(f"Warming model '{model}' on {len(backends)} backend(s)")
+        # Load with the smallest context bucket, which is what a fresh chat uses,
+        # so the first request does not trigger a reload with another num_ctx
+        options = {"num_ctx": num_ctx_buckets[0]} if dynamic_num_ctx else None
+        results = await asyncio.gather(
+            *(self._load(b, model, self.keep_alive, options) for b in backends)
+        )
+        for backend, loaded in zip(backends, results):
+            if loaded:
+                backend.loaded_models.setdefault(model, {"name": model})
+                logger.info(f"Model '{model}' is resident on {backend.url}")
+        await self.enforce_budget()
+
+    def warm_in_background(self, model: str) -> asyncio.Task:
+        """Schedule warm() without blocking the caller; stop() cancels it."""
+        task = asyncio.create_task(self.warm(model))
+        self._warming.add(task)
+        task.add_done_callback(self._warm_done)
+        return task
+
+    def _warm_done(self, task: asyncio.Task) -> None:
+        self._warming.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Warming failed: {task.exception()}", exc_info=task.exception())
+
+    async def unload(self, backend: Backend, model: str) -> bool:
+        """
+        Unload a model from a backend (keep_alive=0).
+
+        Returns:
+            True if Ollama accepted the request
+        """
+        unloaded = await self._load(backend, model, 0)
+        if unloaded:
+            backend.loaded_models.pop(model, None)
+            logger.info(f"Unloaded model '{model}' from {backend.url}")
+        return unloaded
+
+    async def enforce_budget(self) -> None:
+        """Unload least-recently-used models on backends over the memory budget."""
+        if not self.memory_budget:
+            return
+        for backend in self.pool.healthy_backends:
+            resident = dict(backend.loaded_models)
+            used = sum(info.get("size", 0) for info in resident.values())
+            if used <= self.memory_budget:
+                continue
+            # Oldest first; models never used by a chat count as oldest
+            candidates = sorted(
+                (m for m in resident if m != self.preferred),
+                key=lambda m: backend.model_last_used.get(m, 0.0),
+            )
+            for model in candidates:
+                if used <= self.memory_budget:
+                    break
+                if await self.unload(backend, model):
+                    used -= resident[model].get("size", 0)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.enforce_budget()
+            except Exception as e:
+                logger.error(f"Unexpected error in residency check: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """Start periodic budget enforcement."""
+        if self.memory_budget and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Stop periodic budget enforcement and cancel running warm-ups."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        warming = list(self._warming)
+        for task in warming:
+            task.cancel()
+        await asyncio.gather(*warming, return_exceptions=True)
+
+
+residency = ResidencyManager(
+    backend_pool,
+    keep_alive=_parse_keep_alive(keep_alive),
+    memory_budget=int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+    check_interval=float(os.getenv("MODEL_RESIDENCY_INTERVAL", "30")),
+)
@@ -0,0 +1,248 @@
+"""
+Exact-match response cache for deterministic prompts.
+
+This module provides the ResponseCache class: an opt-in cache of final
+answers keyed by the canonical request hash (model, options, messages).
+It has an LRU memory tier in front of a size-bounded SQLite disk tier,
+with a TTL on both; the disk tier is only touched from the database
+threads (bot.core.async_database). Cached answers are replayed with
+bot.core.stream.replay_chunks so they go through the normal streaming/edit
+path.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from bot.core.async_database import db_executor
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + SQLite) cache of generated answers.
+
+    Attributes:
+        enabled: Lookups and stores are skipped when False
+        path: SQLite file of the disk tier
+        max_memory_entries: Entries kept in the memory tier
+        max_disk_bytes: Total content bytes kept in the disk tier
+        ttl: Seconds an entry stays valid
+        hits: Lookups answered from either tier
+        misses: Lookups that found nothing (or only expired entries)
+    """
+
+    def __init__(
+        self,
+        path: str = "response_cache.db",
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 86400.0,
+        enabled: bool = False,
+    ) -> None:
+        self.enabled = enabled
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, str, str]] = OrderedDict()
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._disk_bytes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per database thread, like bot.core.database
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    conn.execute("""CREATE TABLE IF NOT EXISTS responses
+                                    (key TEXT PRIMARY KEY,
+                                     model TEXT,
+                                     content TEXT,
+                                     size INTEGER,
+                                     created_at REAL,
+                                     last_access REAL)""")
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_responses_last_access"
+                        " ON responses(last_access)"
+                    )
+                    conn.commit()
+                    row = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+                    self._disk_bytes = row[0]
+                    self._schema_ready = True
+        return conn
+
+    def _remember(self, key: str, created_at: float, model: str, content: str) -> None:
+        self._memory[key] = (created_at, model, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> str | None:
+        """
+        Look up a cached answer.
+
+        The memory tier is checked on the event loop; the disk tier is read
+        on the database reader pool.
+
+        Args:
+            key: Request key from request_key()
+
+        Returns:
+            The cached answer text, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[2]
+            del self._memory[key]
+
+        try:
+            row = await db_executor.read(self._disk_get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            row = None
+        if row is not None:
+            model, content, created_at = row
+            if now - created_at <= self.ttl:
+                db_executor.write_nowait(self._disk_touch, key, now)
+                self._remember(key, created_at, model, content)
+                self.hits += 1
+                return content
+            db_executor.write_nowait(self._disk_delete, key)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, model: str, content: str) -> None:
+        """
+        Store a final answer in both tiers, evicting old disk entries if needed.
+
+        The disk write is queued on the database writer thread.
+
+        Args:
+            key: Request key from request_key()
+            model: Model that produced the answer
+            content: Final answer text
+        """
+        if not self.enabled or not content:
+            return
+        now = time.time()
+        self._remember(key, now, model, content)
+        db_executor.write_nowait(self._disk_put, key, model, content, now)
+
+    def _disk_get(self, key: str) -> tuple | None:
+        return (
+            self._connection()
+            .execute("SELECT model, content, created_at FROM responses WHERE key = ?", (key,))
+            .fetchone()
+        )
+
+    # Writer thread only: the disk size accounting is not locked
+
+    def _disk_touch(self, key: str, now: float) -> None:
+        try:
+            conn = self._connection()
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache update failed: {e}")
+
+    def _disk_delete(self, key: str) -> None:
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self._disk_bytes -= row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache delete failed: {e}")
+
+    def _disk_put(self, key: str, model: str, content: str, now: float) -> None:
+        size = len(content.encode("utf-8"))
+        try:
+            conn = self._connection()
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, size, now, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Delete least recently accessed disk entries until under max_disk_bytes."""
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logger.info(f"Response cache evicted {len(evicted)} entries")
+
+    def stats(self) -> dict:
+        """Hit/miss counters and tier sizes for instrumentation."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def close(self) -> None:
+        """Close the disk tier connections (after the database threads have stopped)."""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+            self._schema_ready = False
+        self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+
+response_cache = ResponseCache(
+    path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.db"),
+    max_memory_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "256")),
+    max_disk_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+    enabled=os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+)
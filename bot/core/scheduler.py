@@ -0,0 +1,276 @@
+"""
+Generation scheduler for the Ollama Telegram bot.
+
+This module provides the GenerationScheduler class, which sits in front of
+generate() and caps how many generations run at once on each backend.
+Requests beyond the cap are queued and served round-robin across
+(chat, user) queues so one heavy user cannot starve the others. Admins get
+a separate priority lane.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from bot.core.backends import Backend, BackendPool
+from bot.core.ollama import backend_pool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    """
+    A single generation request waiting for (or holding) a slot.
+
+    Attributes:
+        user_id: Telegram user ID
+        chat_id: Telegram chat ID
+        model: Model the generation will run on
+        priority: True for the admin lane
+        enqueued_at: time.time() when the request was submitted
+        granted: Future resolved when the slot is granted
+        backend: Backend the slot was granted on (None: left to the pool)
+    """
+
+    def __init__(self, user_id: int, chat_id: int, model: str, priority: bool) -> None:
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.model = model
+        self.priority = priority
+        self.enqueued_at = time.time()
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.backend: Backend | None = None
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return (self.chat_id, self.user_id)
+
+
+class GenerationScheduler:
+    """
+    Caps concurrent generations and queues the rest fairly.
+
+    Slots are counted per backend: a slot is granted on a healthy backend
+    that has fewer than max_per_backend generations, chosen by the pool's
+    routing among those, and the generation then runs on that backend.
+    While no backend is healthy (or without a pool), max_per_backend caps
+    the total. An optional pool-wide cap per model applies on top. Waiting
+    tickets are served from the admin lane first, then round-robin across
+    (chat, user) queues.
+
+    Attributes:
+        max_per_backend: Concurrent generations allowed per backend
+        max_per_model: Concurrent generations allowed per model (0 = no cap)
+        pool: Backends to place generations on
+        running: Number of generations currently holding a slot
+        running_per_model: Model name -> generations currently holding a slot
+        running_per_backend: Backend URL -> generations currently holding a slot
+    """
+
+    def __init__(
+        self,
+        max_per_backend: int = 2,
+        max_per_model: int = 0,
+        pool: BackendPool | None = None,
+    ) -> None:
+        self.max_per_backend = max(1, max_per_backend)
+        self.max_per_model = max(0, max_per_model)
+        self.pool = pool
+        self.running = 0
+        self.running_per_model: dict[str, int] = {}
+        self.running_per_backend: dict[str, int] = {}
+        self._admin_lane: deque[Ticket] = deque()
+        self._queues: OrderedDict[tuple[int, int], deque[Ticket]] = OrderedDict()
+
+    @property
+    def capacity(self) -> int:
+        """Total concurrent generations allowed right now."""
+        healthy = len(self.pool.healthy_backends) if self.pool is not None else 0
+        return self.max_per_backend * max(1, healthy)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of tickets waiting for a slot."""
+        return len(self._admin_lane) + sum(len(q) for q in self._queues.values())
+
+    def _place(self, ticket: Ticket) -> bool:
+        """Check whether a ticket can run now and pick its backend if so."""
+        if self.max_per_model and self.running_per_model.get(ticket.model, 0) >= self.max_per_model:
+            return False
+        healthy = self.pool.healthy_backends if self.pool is not None else []
+        if not healthy:
+            # Nothing to count per backend: the pool decides (trial request
+            # or fail fast), with max_per_backend as the total cap
+            ticket.backend = None
+            return self.running < self.max_per_backend
+        full = [
+            b.url for b in healthy if self.running_per_backend.get(b.url, 0) >= self.max_per_backend
+        ]
+        if len(full) == len(healthy):
+            return False
+        ticket.backend = self.pool.select(ticket.model, trial=False, exclude=full)
+        return ticket.backend is not None
+
+    def _grant(self, ticket: Ticket) -> None:
+        self.running += 1
+        self.running_per_model[ticket.model] = self.running_per_model.get(ticket.model, 0) + 1
+        if ticket.backend is not None:
+            url = ticket.backend.url
+            self.running_per_backend[url] = self.running_per_backend.get(url, 0) + 1
+        ticket.granted.set_result(True)
+
+    def _release(self, ticket: Ticket) -> None:
+        self.running -= 1
+        count = self.running_per_model.get(ticket.model, 1) - 1
+        if count > 0:
+            self.running_per_model[ticket.model] = count
+        else:
+            self.running_per_model.pop(ticket.model, None)
+        if ticket.backend is not None:
+            url = ticket.backend.url
+            count = self.running_per_backend.get(url, 1) - 1
+            if count > 0:
+                self.running_per_backend[url] = count
+            else:
+                self.running_per_backend.pop(url, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant slots to waiting tickets while there is capacity."""
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._grant(ticket)
+
+    def _next_ticket(self) -> Ticket | None:
+        """Pop the next servable ticket: admin lane first, then round-robin."""
+        for ticket in self._admin_lane:
+            if self._place(ticket):
+                self._admin_lane.remove(ticket)
+                return ticket
+        for key, queue in self._queues.items():
+            if self._place(queue[0]):
+                ticket = queue.popleft()
+                if queue:
+                    # Serve this queue again only after every other queue
+                    self._queues.move_to_end(key)
+                else:
+                    del self._queues[key]
+                return ticket
+        return None
+
+    def _remove(self, ticket: Ticket) -> None:
+        """Drop a ticket that gave up before being granted."""
+        if ticket.priority:
+            try:
+                self._admin_lane.remove(ticket)
+            except ValueError:
+                pass
+            return
+        queue = self._queues.get(ticket.key)
+        if queue is not None:
+            try:
+                queue.remove(ticket)
+            except ValueError:
+                pass
+            if not queue:
+                del self._queues[ticket.key]
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        Estimate a waiting ticket's position in the queue (1 = next).
+
+        Args:
+            ticket: A ticket returned while waiting in slot()
+
+        Returns:
+            1-based position, or 0 if the ticket is not waiting
+        """
+        if ticket.granted.done():
+            return 0
+        if ticket.priority:
+            try:
+                return list(self._admin_lane).index(ticket) + 1
+            except ValueError:
+                return 0
+        queue = self._queues.get(ticket.key)
+        if queue is None or ticket not in queue:
+            return 0
+        index = list(queue).index(ticket)
+        ahead = len(self._admin_lane) + index
+        before = True
+        for key, other in self._queues.items():
+            if key == ticket.key:
+                before = False
+                continue
+            # Round-robin serves one ticket per queue per round
+            ahead += min(len(other), index + (1 if before else 0))
+        return ahead + 1
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        chat_id: int,
+        model: str,
+        priority: bool = False,
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+    ):
+        """
+        Wait for a generation slot and hold it for the duration of the block.
+
+        Args:
+            user_id: Telegram user ID
+            chat_id: Telegram chat ID
+            model: Model the generation will run on
+            priority: Use the admin priority lane
+            on_queued: Awaited with the queue position if the request has to wait
+
+        Yields:
+            The granted Ticket
+        """
+        ticket = Ticket(user_id, chat_id, model, priority)
+        if ticket.priority:
+            self._admin_lane.append(ticket)
+        else:
+            self._queues.setdefault(ticket.key, deque()).append(ticket)
+        self._dispatch()
+
+        try:
+            if not ticket.granted.done():
+                position = self.position(ticket)
+                logger.info(
+                    f"Generation for user {user_id} queued at position {position} "
+                    f"({self.running}/{self.capacity} running)"
+                )
+                if on_queued is not None:
+                    await on_queued(position)
+            await ticket.granted
+        except BaseException:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release(ticket)
+            else:
+                ticket.granted.cancel()
+                self._remove(ticket)
+            raise
+
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+
+scheduler = GenerationScheduler(
+    max_per_backend=int(os.getenv("GEN_MAX_PER_BACKEND", "2")),
+    max_per_model=int(os.getenv("GEN_MAX_PER_MODEL", "0")),
+    pool=backend_pool,
+)
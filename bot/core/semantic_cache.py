@@ -0,0 +1,351 @@
+"""
+Semantic answer cache for the Ollama Telegram bot.
+
+This module provides the VectorIndex and SemanticCache classes. Incoming
+standalone questions are embedded with Ollama's /api/embed and compared by
+cosine similarity against previously answered questions with the same
+system prompt and model; above a threshold the stored answer is reused.
+
+Vectors live in a NumPy float32 matrix persisted to a memory-mapped file,
+with the answers in a JSON-lines sidecar. The index is only touched from
+one worker thread, so file appends and searches never block the event
+loop. NumPy is optional: without it the cache stays disabled.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from bot.core.ollama import embed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndex:
+    """
+    Append-only index of unit vectors grouped by scope.
+
+    Vectors are appended to "<path>.f32" and read back through np.memmap;
+    per-row metadata (scope, payload) is appended to "<path>.jsonl".
+    compact() rewrites both files without the rows that are no longer needed.
+    Not thread-safe: use it from a single thread.
+
+    Attributes:
+        path: File prefix of the index
+        dim: Vector dimension (set by the first vector added)
+        rows: Per-row metadata dicts, aligned with the vector file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.dim: int | None = None
+        self.rows: list[dict] = []
+        self._matrix = None
+        self._scopes: dict[str, list[int]] = {}
+        self._scope_arrays: dict[str, "np.ndarray"] = {}
+
+    @property
+    def vectors_path(self) -> str:
+        return f"{self.path}.f32"
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.path}.jsonl"
+
+    def load(self) -> None:
+        """Map existing vectors and metadata from disk (if any)."""
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.vectors_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if not rows:
+            return
+        self.dim = rows[0]["dim"]
+        # Ignore a torn trailing row if the process died mid-append
+        stored = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        self.rows = rows[:stored]
+        self._scopes.clear()
+        for i, row in enumerate(self.rows):
+            self._scopes.setdefault(row["scope"], []).append(i)
+        self._remap()
+        logger.info(f"Semantic cache loaded {len(self.rows)} entries from {self.path}")
+
+    def _remap(self) -> None:
+        if self.rows:
+            self._matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim)
+            )
+        else:
+            self._matrix = None
+        self._scope_arrays.clear()
+
+    def compact(self, keep: Callable[[dict], bool], max_rows: int | None = None) -> int:
+        """
+        Rewrite the index with only the rows worth keeping.
+
+        Args:
+            keep: Called with each row's metadata; False drops the row
+            max_rows: Keep at most this many of the newest remaining rows
+
+        Returns:
+            Number of rows dropped
+        """
+        kept = [i for i, row in enumerate(self.rows) if keep(row)]
+        if max_rows is not None and len(kept) > max_rows:
+            kept = kept[len(kept) - max_rows :]
+        dropped = len(self.rows) - len(kept)
+        if not dropped:
+            return 0
+        vectors = np.array(self._matrix[kept]) if kept else np.empty((0, self.dim), np.float32)
+        rows = [self.rows[i] for i in kept]
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            f.write(vectors.tobytes())
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        # Unmap before replacing the file (required on Windows)
+        self._matrix = None
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        self.rows = rows
+        self._scopes.clear()
+        for i, row in enumerate(self.rows):
+            self._scopes.setdefault(row["scope"], []).append(i)
+        self._remap()
+        return dropped
+
+    def add(self, scope: str, vector: "np.ndarray", payload: dict) -> None:
+        """
+        Append a unit vector with its metadata.
+
+        Args:
+            scope: Scope key the vector can be matched in
+            vector: Normalized float32 vector
+            payload: JSON-serializable data returned on a match
+        """
+        if self.dim is None:
+            self.dim = len(vector)
+        if len(vector) != self.dim:
+            logger.warning(f"Semantic cache: dimension {len(vector)} != {self.dim}, not stored")
+            return
+        row = {"scope": scope, "dim": self.dim, **payload}
+        with open(self.vectors_path, "ab") as f:
+            f.write(vector.astype(np.float32).tobytes())
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._scopes.setdefault(scope, []).append(len(self.rows))
+        self.rows.append(row)
+        self._remap()
+
+    def search(self, scope: str, vector: "np.ndarray") -> tuple[dict | None, float]:
+        """
+        Find the most similar vector within a scope.
+
+        Args:
+            scope: Scope key to search in
+            vector: Normalized query vector
+
+        Returns:
+            Tuple (row metadata, cosine similarity), or (None, 0.0) if the
+            scope is empty
+        """
+        indices = self._scopes.get(scope)
+        if not indices or self._matrix is None or len(vector) != self.dim:
+            return None, 0.0
+        rows = self._scope_arrays.get(scope)
+        if rows is None:
+            rows = self._scope_arrays[scope] = np.asarray(indices, dtype=np.int64)
+        scores = self._matrix[rows] @ vector
+        best = int(np.argmax(scores))
+        return self.rows[int(rows[best])], float(scores[best])
+
+
+class SemanticCache:
+    """
+    Reuses answers for near-duplicate standalone questions.
+
+    Only turns made of a system prompt and a single text-only user message
+    are eligible, since answers to follow-up questions depend on history.
+
+    Attributes:
+        enabled: False when switched off or NumPy is missing
+        embed_model: Ollama embedding model
+        threshold: Minimum cosine similarity for a hit
+        ttl: Seconds an answer stays valid
+        max_entries: Entries stored before expired and oldest ones are pruned
+        hits: Lookups answered from the cache
+        misses: Eligible lookups with no match
+    """
+
+    def __init__(
+        self,
+        path: str = "semantic_cache",
+        embed_model: str = "nomic-embed-text",
+        threshold: float = 0.92,
+        ttl: float = 86400.0,
+        max_entries: int = 10000,
+        enabled: bool = False,
+        embed_fn=embed,
+    ) -> None:
+        if enabled and np is None:
+            logger.warning("Semantic cache requires numpy; it is disabled")
+            enabled = False
+        self.enabled = enabled
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._embed = embed_fn
+        self._index = VectorIndex(path)
+        self._loaded = False
+        # Lookups arriving together right after startup load the index once
+        self._load_lock = asyncio.Lock()
+        # Every index operation runs on this one thread
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+    @staticmethod
+    def question(messages: list[dict]) -> str | None:
+        """Return the question if the turn is eligible, else None."""
+        if len(messages) != 2 or messages[0].get("role") != "system":
+            return None
+        user = messages[1]
+        if user.get("role") != "user" or user.get("images"):
+            return None
+        return user.get("content") or None
+
+    @staticmethod
+    def scope(modelname: str, messages: list[dict]) -> str:
+        """Scope key: one per (system prompt, model) pair."""
+        system_prompt = messages[0].get("content", "")
+        return hashlib.sha256(f"{modelname}\0{system_prompt}".encode("utf-8")).hexdigest()[:16]
+
+    async def _vector(self, text: str) -> "np.ndarray":
+        embeddings = await self._embed([text], self.embed_model)
+        vector = np.asarray(embeddings[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    async def lookup(
+        self, modelname: str, messages: list[dict]
+    ) -> tuple[str | None, "np.ndarray | None"]:
+        """
+        Look for a stored answer to a near-duplicate question.
+
+        Args:
+            modelname: Chat model that would answer
+            messages: Messages of the current turn
+
+        Returns:
+            Tuple (answer or None, query vector or None). Pass the vector to
+            store() after generating so the question isn't embedded twice.
+        """
+        if not self.enabled:
+            return None, None
+        question = self.question(messages)
+        if question is None:
+            return None, None
+        loop = asyncio.get_running_loop()
+        if not self._loaded:
+            async with self._load_lock:
+                if not self._loaded:
+                    await loop.run_in_executor(self._worker, self._load)
+                    self._loaded = True
+        try:
+            vector = await self._vector(question)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None, None
+
+        row, score = await loop.run_in_executor(
+            self._worker, self._index.search, self.scope(modelname, messages), vector
+        )
+        if row is not None and score >= self.threshold and time.time() - row["created_at"] <= self.ttl:
+            self.hits += 1
+            logger.info(f"Semantic cache hit (similarity {score:.3f})")
+            return row["answer"], vector
+        self.misses += 1
+        return None, vector
+
+    def store(
+        self, modelname: str, messages: list[dict], vector: "np.ndarray | None", answer: str
+    ) -> None:
+        """
+        Remember the answer to an eligible question.
+
+        Args:
+            modelname: Chat model that answered
+            messages: Messages of the turn (system + user, as passed to lookup)
+            vector: Query vector returned by lookup()
+            answer: Final answer text
+        """
+        if not self.enabled or vector is None or not answer:
+            return
+        question = self.question(messages[:2])
+        if question is None:
+            return
+        self._worker.submit(
+            self._add,
+            self.scope(modelname, messages),
+            vector,
+            {"question": question, "answer": answer, "created_at": time.time()},
+        )
+
+    def _fresh(self, row: dict) -> bool:
+        return time.time() - row["created_at"] <= self.ttl
+
+    def _load(self) -> None:
+        self._index.load()
+        dropped = self._index.compact(self._fresh, self.max_entries)
+        if dropped:
+            logger.info(f"Semantic cache pruned {dropped} entries")
+
+    def _add(self, scope: str, vector: "np.ndarray", payload: dict) -> None:
+        # Worker thread
+        try:
+            self._index.add(scope, vector, payload)
+            if len(self._index.rows) > self.max_entries:
+                # Prune to 3/4 of the cap so this runs once per max_entries/4 answers
+                dropped = self._index.compact(self._fresh, self.max_entries * 3 // 4)
+                logger.info(f"Semantic cache pruned {dropped} entries")
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    def stats(self) -> dict:
+        """Hit/miss counters for instrumentation."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._index.rows),
+        }
+
+    def close(self) -> None:
+        """Finish queued stores and stop the worker thread."""
+        self._worker.shutdown(wait=True)
+
+
+semantic_cache = SemanticCache(
+    path=os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache"),
+    embed_model=os.getenv("SEMANTIC_CACHE_EMBED_MODEL", "nomic-embed-text"),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+)
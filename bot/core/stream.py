@@ -0,0 +1,215 @@
+"""
+Streaming NDJSON decoding for Ollama responses.
+
+This module provides the NDJSONDecoder class, a linear-time line scanner
+over a bytearray buffer, and the ChatChunk type yielded for /api/chat
+streams. orjson is used for parsing when it is installed, otherwise the
+stdlib json module.
+"""
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+try:
+    import orjson
+
+    def _loads(data: memoryview):
+        return orjson.loads(data)
+
+    JSON_BACKEND = "orjson"
+except ImportError:
+    orjson = None
+
+    def _loads(data: memoryview):
+        return json.loads(bytes(data))
+
+    JSON_BACKEND = "json"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class ChatChunk:
+    """
+    One decoded chunk of an /api/chat response.
+
+    Attributes:
+        content: Text delta carried by this chunk ("" if none)
+        done: True for the final chunk
+        message: The raw "message" object, or None if the chunk has none
+        total_duration: Final chunk only, nanoseconds
+        load_duration: Final chunk only, nanoseconds
+        prompt_eval_count: Final chunk only, prompt tokens evaluated
+        prompt_eval_duration: Final chunk only, nanoseconds
+        eval_count: Final chunk only, tokens generated
+        eval_duration: Final chunk only, nanoseconds
+        done_reason: Final chunk only, e.g. "stop" or "length"
+        raw: The full decoded JSON object
+    """
+
+    content: str = ""
+    done: bool = False
+    message: dict | None = None
+    total_duration: int | None = None
+    load_duration: int | None = None
+    prompt_eval_count: int | None = None
+    prompt_eval_duration: int | None = None
+    eval_count: int | None = None
+    eval_duration: int | None = None
+    done_reason: str | None = None
+    raw: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatChunk":
+        """Build a ChatChunk from a decoded /api/chat JSON object."""
+        message = data.get("message")
+        done = bool(data.get("done", False))
+        if not done:
+            # Fast path: intermediate chunks only carry a message delta
+            return cls(
+                content=message.get("content", "") if message else "",
+                message=message,
+                raw=data,
+            )
+        return cls(
+            content=message.get("content", "") if message else "",
+            done=True,
+            message=message,
+            total_duration=data.get("total_duration"),
+            load_duration=data.get("load_duration"),
+            prompt_eval_count=data.get("prompt_eval_count"),
+            prompt_eval_duration=data.get("prompt_eval_duration"),
+            eval_count=data.get("eval_count"),
+            eval_duration=data.get("eval_duration"),
+            done_reason=data.get("done_reason"),
+            raw=data,
+        )
+
+
+class NDJSONDecoder:
+    """
+    Incremental newline-delimited JSON decoder.
+
+    Bytes are appended to a bytearray and only the newly received part is
+    scanned for newlines, so a line split over many network chunks or a
+    chunk holding many lines is decoded in linear time. Consumed bytes are
+    dropped once per feed() call.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._scan_from = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        Add received bytes and decode every complete line.
+
+        Args:
+            data: Raw bytes from the response body
+
+        Returns:
+            List of decoded JSON objects (possibly empty)
+        """
+        buffer = self._buffer
+        buffer += data
+        newline = buffer.find(b"\n", self._scan_from)
+        if newline == -1:
+            self._scan_from = len(buffer)
+            return []
+
+        objects = []
+        start = 0
+        with memoryview(buffer) as view:
+            while newline != -1:
+                self._decode_line(view[start:newline], objects)
+                start = newline + 1
+                newline = buffer.find(b"\n", start)
+        del buffer[:start]
+        self._scan_from = len(buffer)
+        return objects
+
+    def flush(self) -> list:
+        """
+        Decode a trailing line that was not terminated by a newline.
+
+        Returns:
+            List with the decoded object, or an empty list
+        """
+        objects = []
+        if self._buffer:
+            with memoryview(self._buffer) as view:
+                self._decode_line(view, objects)
+            self._buffer.clear()
+        self._scan_from = 0
+        return objects
+
+    @staticmethod
+    def _decode_line(line: memoryview, objects: list) -> None:
+        # Skip blank lines ("\n" or "\r\n" keep-alives)
+        if len(line) == 0 or (len(line) == 1 and line[0] == 0x0D):
+            return
+        try:
+            objects.append(_loads(line))
+        except ValueError as e:
+            # orjson.JSONDecodeError and json.JSONDecodeError are ValueErrors
+            logger.error(f"JSON Decode Error: {e}")
+            logger.error(f"Problematic line: {bytes(line)!r}")
+
+
+async def iter_ndjson(content: AsyncIterator[bytes]) -> AsyncIterator:
+    """
+    Decode an NDJSON byte stream into JSON objects.
+
+    Args:
+        content: Async iterator of raw byte chunks (e.g. response.content.iter_any())
+
+    Yields:
+        Decoded JSON objects in order
+    """
+    decoder = NDJSONDecoder()
+    async for data in content:
+        for obj in decoder.feed(data):
+            yield obj
+    for obj in decoder.flush():
+        yield obj
+
+
+async def iter_chat_chunks(content: AsyncIterator[bytes]) -> AsyncIterator[ChatChunk]:
+    """
+    Decode an /api/chat NDJSON stream into ChatChunk objects.
+
+    Args:
+        content: Async iterator of raw byte chunks
+
+    Yields:
+        ChatChunk for every decoded line
+    """
+    async for obj in iter_ndjson(content):
+        yield ChatChunk.from_dict(obj)
+
+
+async def replay_chunks(content: str, chunk_size: int = 400) -> AsyncIterator[ChatChunk]:
+    """
+    Replay a stored answer (e.g. from a cache) as a ChatChunk stream.
+
+    Args:
+        content: Full answer text
+        chunk_size: Characters per content chunk
+
+    Yields:
+        Content chunks, then a final done chunk flagged as cached
+    """
+    started = time.perf_counter_ns()
+    for i in range(0, len(content), chunk_size):
+        piece = content[i : i + chunk_size]
+        yield ChatChunk(content=piece, message={"role": "assistant", "content": piece})
+    yield ChatChunk(
+        done=True,
+        message={"role": "assistant", "content": ""},
+        total_duration=time.perf_counter_ns() - started,
+        done_reason="stop",
+        raw={"cached": True},
+    )
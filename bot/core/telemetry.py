@@ -0,0 +1,142 @@
+"""
+Aggregation of per-generation telemetry for the admin /stats command.
+
+Rows come from the generation_stats table (see
+bot.core.database.get_generation_stats); this module turns them into
+per-model latency percentiles, throughput and load-time breakdowns.
+"""
+
+import math
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Window used by /stats when none is given
+default_window = os.getenv("STATS_DEFAULT_WINDOW", "24h")
+# "/stats 6h" style windows -> SQLite datetime modifier units
+_WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_window(text: str) -> str | None:
+    """
+    Convert a window like "30m", "24h" or "7d" into a SQLite datetime modifier.
+
+    Args:
+        text: Window spec, or "all" for no limit
+
+    Returns:
+        Modifier such as "-24 hours", or None for "all"
+
+    Raises:
+        ValueError: If the spec is not understood
+    """
+    text = text.strip().lower()
+    if text == "all":
+        return None
+    match = re.fullmatch(r"(\d+)([mhd])", text)
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{text}', use e.g. 30m, 24h, 7d or all")
+    return f"-{match.group(1)} {_WINDOW_UNITS[match.group(2)]}"
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values: Sample values (need not be sorted)
+        q: Percentile between 0 and 100
+
+    Returns:
+        The percentile value, or None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(rows: list[tuple]) -> dict[str, dict]:
+    """
+    Aggregate generation_stats rows per model.
+
+    Cache replays are counted but left out of the latency figures, since
+    they never reach Ollama.
+
+    Args:
+        rows: Tuples as returned by get_generation_stats()
+
+    Returns:
+        Model name -> dict with count, cached, ttft/total/load p50 and p95
+        (seconds), load_share, eval_tps, prompt_tps and avg_edits
+    """
+    per_model: dict[str, dict] = {}
+    for (
+        model,
+        cached,
+        ttft_ms,
+        edit_count,
+        total_duration,
+        load_duration,
+        prompt_eval_count,
+        prompt_eval_duration,
+        eval_count,
+        eval_duration,
+    ) in rows:
+        acc = per_model.setdefault(
+            model,
+            {
+                "count": 0,
+                "cached": 0,
+                "ttft": [],
+                "total": [],
+                "load": [],
+                "edits": [],
+                "eval_tokens": 0,
+                "eval_ns": 0,
+                "prompt_tokens": 0,
+                "prompt_ns": 0,
+            },
+        )
+        acc["count"] += 1
+        if edit_count is not None:
+            acc["edits"].append(edit_count)
+        if cached:
+            acc["cached"] += 1
+            continue
+        if ttft_ms is not None:
+            acc["ttft"].append(ttft_ms / 1000)
+        if total_duration:
+            acc["total"].append(total_duration / 1e9)
+            acc["load"].append((load_duration or 0) / 1e9)
+        if eval_count and eval_duration:
+            acc["eval_tokens"] += eval_count
+            acc["eval_ns"] += eval_duration
+        if prompt_eval_count and prompt_eval_duration:
+            acc["prompt_tokens"] += prompt_eval_count
+            acc["prompt_ns"] += prompt_eval_duration
+
+    summary = {}
+    for model, acc in per_model.items():
+        total_time = sum(acc["total"])
+        summary[model] = {
+            "count": acc["count"],
+            "cached": acc["cached"],
+            "ttft_p50": percentile(acc["ttft"], 50),
+            "ttft_p95": percentile(acc["ttft"], 95),
+            "total_p50": percentile(acc["total"], 50),
+            "total_p95": percentile(acc["total"], 95),
+            "load_p50": percentile(acc["load"], 50),
+            "load_p95": percentile(acc["load"], 95),
+            "load_share": sum(acc["load"]) / total_time if total_time else None,
+            "eval_tps": acc["eval_tokens"] / acc["eval_ns"] * 1e9 if acc["eval_ns"] else None,
+            "prompt_tps": (
+                acc["prompt_tokens"] / acc["prompt_ns"] * 1e9 if acc["prompt_ns"] else None
+            ),
+            "avg_edits": sum(acc["edits"]) / len(acc["edits"]) if acc["edits"] else None,
+        }
+    return summary
@@ -0,0 +1,171 @@
+"""
+Write-behind queue for chat messages and generation telemetry.
+
+Every turn writes at least two rows (the question and the answer) plus a
+stats row, and committing each one on its own costs a WAL fsync per row.
+This module provides the WriteBehindQueue class: rows are queued from
+the handlers and a background task commits them in batches, one
+transaction per flush interval or batch size, so the fsync cost is
+shared by every conversation active at the time. The queue is bounded:
+when it is full, producers wait for the next flush (backpressure).
+"""
+
+import asyncio
+import logging
+
+from bot.core.database import write_batch
+from bot.core.metrics import db_write_backpressure_total, db_write_batch_size, db_writes_total
+
+logger = logging.getLogger(__name__)
+
+
+class PendingWrite:
+    """
+    A row queued for insertion.
+
+    Pass it as a value in a later write (e.g. the chat_id of a stats row)
+    to reference this row's id; it is resolved when the batch is committed.
+
+    Attributes:
+        kind: Insert kind, see bot.core.database.write_batch
+        args: Arguments of the insert
+        row_id: Row id once committed
+        error: Exception if the insert failed
+    """
+
+    __slots__ = ("kind", "args", "row_id", "error", "_done")
+
+    def __init__(self, kind: str, args: tuple) -> None:
+        self.kind = kind
+        self.args = args
+        self.row_id: int | None = None
+        self.error: Exception | None = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    async def wait(self) -> int | None:
+        """
+        Wait until the row is committed.
+
+        Returns:
+            The row id
+
+        Raises:
+            Exception: The error of the insert, if it failed
+        """
+        await self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.row_id
+
+
+class WriteBehindQueue:
+    """
+    Batches queued inserts into few transactions.
+
+    Attributes:
+        executor: DatabaseExecutor whose writer thread runs the batches
+        batch_size: Most rows committed per transaction
+        flush_interval: Seconds to wait for more rows after the first one
+        max_pending: Rows queued before producers have to wait
+        flushes: Batches committed
+    """
+
+    def __init__(
+        self,
+        executor,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_pending: int = 5000,
+    ) -> None:
+        self.executor = executor
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self.max_pending = max(1, max_pending)
+        self.flushes = 0
+        self._queue: asyncio.Queue[PendingWrite] | None = None
+        self._task: asyncio.Task | None = None
+        self._last: PendingWrite | None = None
+
+    @property
+    def pending(self) -> int:
+        """Rows queued and not yet committed."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, kind: str, args: tuple) -> PendingWrite:
+        """
+        Queue an insert.
+
+        Returns as soon as the row is queued, which is immediately unless
+        the queue is full.
+
+        Args:
+            kind: Insert kind, see bot.core.database.write_batch
+            args: Arguments of the insert
+
+        Returns:
+            Handle to wait for the commit or reference the row in later writes
+        """
+        self._ensure_started()
+        write = PendingWrite(kind, args)
+        if self._queue.full():
+            db_write_backpressure_total.inc()
+            logger.warning(f"Write-behind queue full ({self.max_pending} rows), waiting")
+        await self._queue.put(write)
+        self._last = write
+        return write
+
+    async def flush(self) -> None:
+        """Wait until every row queued so far is committed."""
+        last = self._last
+        if last is not None and not last.done:
+            await last._done.wait()
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            if self._queue.qsize() < self.batch_size - 1 and self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._commit(batch)
+
+    async def _commit(self, batch: list[PendingWrite]) -> None:
+        try:
+            # Shielded so a shutdown in the middle of a flush still finishes it
+            await asyncio.shield(self.executor.write(write_batch, batch))
+        except Exception as e:
+            logger.error(f"Write-behind flush of {len(batch)} rows failed: {e}")
+            for write in batch:
+                write.error = write.error or e
+        self.flushes += 1
+        db_write_batch_size.observe(len(batch))
+        for write in batch:
+            if write.error is not None:
+                logger.error(f"Failed to save {write.kind} row: {write.error}")
+                db_writes_total.inc(kind=write.kind, outcome="error")
+            else:
+                db_writes_total.inc(kind=write.kind, outcome="ok")
+            write._done.set()
+
+    async def stop(self) -> None:
+        """Commit everything still queued and stop the flush task."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
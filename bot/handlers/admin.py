@@ -1,3 +1,4 @@
+import logging
 from aiogram import types, Router
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
@@ -5,7 +6,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.enums import ParseMode
 
 from bot.auth import perms_admins
-from bot.core.database import (
+from bot.core.async_database import (
     get_all_users_from_db,
     remove_user_from_db,
     add_user_to_db,
@@ -13,8 +14,17 @@ from bot.core.database import (
     add_global_prompt,
     delete_global_prompt,
     set_bot_config,
+    get_generation_stats,
 )
-from bot.core.ollama import model_list, manage_model
+from bot.core.catalog import capability_catalog, model_list_cache
+from bot.core.coalesce import coalescer
+from bot.core.context import prefix_stats
+from bot.core.ollama import manage_model
+from bot.core.pulls import pull_queue, PullJob
+from bot.core.residency import residency
+from bot.core.response_cache import response_cache
+from bot.core.semantic_cache import semantic_cache
+from bot.core.telemetry import default_window, parse_window, summarize
 from bot.ui import settings_kb, PromptStates
 from bot import state
 
@@ -29,24 +39,65 @@ async def settings_command_handler(message: types.Message) -> None:
     await message.answer("⚙️ Admin Control Panel", reply_markup=settings_kb.as_markup())
 
 
+def _format_size(num_bytes: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+def _format_pull_status(job: PullJob) -> str:
+    if job.status == "queued":
+        return f"⏳ Pull of '{job.model}' is queued."
+    if job.status == "pulling":
+        text = f"⬇️ Pulling '{job.model}': {job.detail or 'starting'}"
+        if job.total:
+            text += (
+                f"\n{job.percent:.1f}% ({_format_size(job.completed)} / {_format_size(job.total)})"
+            )
+        if job.digests:
+            text += f"\n{len(job.digests)} layer(s) done"
+        return text
+    if job.status == "success":
+        digests = "\n".join(f"- {d[:19]}" for d in job.digests)
+        return f"✅ Model '{job.model}' pulled.\n{digests}".rstrip()
+    return f"❌ Failed to pull model '{job.model}': {job.error}"
+
+
 @admin_router.message(Command("pullmodel"))
 @perms_admins
 async def pull_model_handler(message: types.Message) -> None:
     model_name = message.text.split(maxsplit=1)[1] if len(message.text.split()) > 1 else None
-    if model_name:
-        response = await manage_model("pull", model_name)
-        if response.status == 200:
-            await message.answer(f"Model '{model_name}' is being pulled.")
-        else:
-            await message.answer(f"Failed to pull model '{model_name}': {response.reason}")
-    else:
+    if not model_name:
         await message.answer("Please provide a model name to pull.")
+        return
+
+    status_message = await message.answer(f"⏳ Pull of '{model_name}' is queued.")
+
+    last_text = status_message.text
+
+    async def on_progress(job: PullJob) -> None:
+        # PullQueue rate-limits these calls; skip edits that change nothing
+        nonlocal last_text
+        text = _format_pull_status(job)
+        if text == last_text:
+            return
+        try:
+            await status_message.edit_text(text)
+            last_text = text
+        except Exception as e:
+            logging.warning(f"Could not edit pull status: {e}")
+
+    job, created = pull_queue.submit(model_name, on_progress)
+    if not created:
+        last_text = f"ℹ️ Model '{model_name}' is already being pulled. Progress will be shown here."
+        await status_message.edit_text(last_text)
 
 
 @admin_router.callback_query(lambda query: query.data == "switchllm")
 @perms_admins
 async def switchllm_callback_handler(query: types.CallbackQuery):
-    models = await model_list()
+    models = await model_list_cache.get()
     switchllm_builder = InlineKeyboardBuilder()
     for model in models:
         model_name = model["name"]
@@ -69,7 +120,9 @@ async def model_callback_handler(query: types.CallbackQuery):
     new_modelname = query.data.split("model_")[1]
     state.modelname = new_modelname
     # Persist the model selection to database
-    set_bot_config("current_model", new_modelname)
+    await set_bot_config("current_model", new_modelname)
+    # Load the new model now instead of during the next user request
+    residency.warm_in_background(new_modelname)
     await query.answer(f"Model changed to: {new_modelname}")
     await query.message.edit_text(f"✅ Model changed to: {new_modelname}")
 
@@ -77,7 +130,7 @@ async def model_callback_handler(query: types.CallbackQuery):
 @admin_router.callback_query(lambda query: query.data == "delete_model")
 @perms_admins
 async def delete_model_callback_handler(query: types.CallbackQuery):
-    models = await model_list()
+    models = await model_list_cache.get()
     delete_model_kb = InlineKeyboardBuilder()
     for model in models:
         model_name = model["name"]
@@ -96,6 +149,8 @@ async def delete_model_confirm_handler(query: types.CallbackQuery):
     modelname_to_delete = query.data.split("delete_model_")[1]
     response = await manage_model("delete", modelname_to_delete)
     if response.status == 200:
+        capability_catalog.invalidate(modelname_to_delete)
+        model_list_cache.invalidate()
         await query.answer(f"Deleted model: {modelname_to_delete}")
     else:
         await query.answer(f"Failed to delete model: {modelname_to_delete}")
@@ -107,7 +162,7 @@ async def delete_model_confirm_handler(query: types.CallbackQuery):
 @admin_router.callback_query(lambda query: query.data == "list_users")
 @perms_admins
 async def list_users_callback_handler(query: types.CallbackQuery):
-    users = get_all_users_from_db()
+    users = await get_all_users_from_db()
     user_kb = InlineKeyboardBuilder()
     for user_id, user_name, _ in users:
         user_kb.row(
@@ -123,7 +178,7 @@ async def list_users_callback_handler(query: types.CallbackQuery):
 @perms_admins
 async def remove_user_from_list_handler(query: types.CallbackQuery):
     user_id = int(query.data.split("_")[1])
-    if remove_user_from_db(user_id):
+    if await remove_user_from_db(user_id):
         await query.answer(f"User {user_id} has been removed.")
         await query.message.edit_text(f"User {user_id} has been removed.")
     else:
@@ -137,7 +192,7 @@ async def add_user_command_handler(message: types.Message):
         parts = message.text.split(maxsplit=2)
         user_id = int(parts[1])
         user_name = parts[2] if len(parts) > 2 else f"User {user_id}"
-        if add_user_to_db(user_id, user_name):
+        if await add_user_to_db(user_id, user_name):
             await message.reply(f"✅ User {user_name} ({user_id}) has been added to the allowlist.")
         else:
             await message.reply(f"⚠️ User {user_id} is already in the allowlist.")
@@ -150,7 +205,7 @@ async def add_user_command_handler(message: types.Message):
 async def rm_user_command_handler(message: types.Message):
     try:
         user_id = int(message.text.split(maxsplit=1)[1])
-        if remove_user_from_db(user_id):
+        if await remove_user_from_db(user_id):
             await message.reply(f"✅ User {user_id} has been removed from the allowlist.")
         else:
             await message.reply(f"⚠️ User {user_id} was not found in the allowlist.")
@@ -161,7 +216,7 @@ async def rm_user_command_handler(message: types.Message):
 @admin_router.message(Command("listusers"))
 @perms_admins
 async def list_users_command_handler(message: types.Message):
-    users = get_all_users_from_db()
+    users = await get_all_users_from_db()
     if not users:
         await message.reply("No users found in the allowlist.")
         return
@@ -171,13 +226,70 @@ async def list_users_command_handler(message: types.Message):
     await message.reply(user_list, parse_mode=ParseMode.MARKDOWN)
 
 
+# --- Statistics ---
+
+
+def _format_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def _format_rate(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f} tok/s"
+
+
+@admin_router.message(Command("stats"))
+@perms_admins
+async def stats_command_handler(message: types.Message):
+    """
+    Show per-model generation statistics: /stats [30m|24h|7d|all].
+    """
+    args = message.text.split(maxsplit=1)
+    window_text = args[1] if len(args) > 1 else default_window
+    try:
+        window = parse_window(window_text)
+    except ValueError as e:
+        await message.reply(f"❌ {e}")
+        return
+
+    summary = summarize(await get_generation_stats(window))
+    text = f"📊 <b>Generation stats</b> ({window_text.strip()})\n"
+    if not summary:
+        text += "\nNo generations recorded in this window.\n"
+    for model, s in sorted(summary.items(), key=lambda item: -item[1]["count"]):
+        load_share = "-" if s["load_share"] is None else f"{s['load_share']:.0%}"
+        avg_edits = "-" if s["avg_edits"] is None else f"{s['avg_edits']:.1f}"
+        text += (
+            f"\n<b>{model}</b>: {s['count']} answers ({s['cached']} cached)\n"
+            f"• TTFT p50/p95: {_format_seconds(s['ttft_p50'])} / {_format_seconds(s['ttft_p95'])}\n"
+            f"• Total p50/p95: {_format_seconds(s['total_p50'])} / {_format_seconds(s['total_p95'])}\n"
+            f"• Load p50/p95: {_format_seconds(s['load_p50'])} / {_format_seconds(s['load_p95'])}"
+            f" ({load_share} of time)\n"
+            f"• Generation: {_format_rate(s['eval_tps'])}, prompt: {_format_rate(s['prompt_tps'])}\n"
+            f"• Telegram edits per answer: {avg_edits}\n"
+        )
+
+    rc = response_cache.stats()
+    sc = semantic_cache.stats()
+    pc = prefix_stats.stats()
+    text += (
+        f"\n<b>Caches</b> (since start)\n"
+        f"• Response cache: {'on' if rc['enabled'] else 'off'}, "
+        f"{rc['hits']} hits / {rc['misses']} misses ({rc['hit_rate']:.0%})\n"
+        f"• Semantic cache: {'on' if sc['enabled'] else 'off'}, "
+        f"{sc['hits']} hits / {sc['misses']} misses ({sc['hit_rate']:.0%}), {sc['entries']} entries\n"
+        f"• Prompt prefix reuse: {pc['reuse_rate']:.0%} over {pc['turns']} turns, {pc['trims']} trims\n"
+        f"• Coalesced requests: {coalescer.coalesced}\n"
+    )
+    await message.reply(text, parse_mode=ParseMode.HTML)
+
+
 # --- Prompt Management ---
 
 
 @admin_router.callback_query(lambda query: query.data == "admin_prompts")
 @perms_admins
 async def admin_prompts_callback_handler(query: types.CallbackQuery):
-    prompts = get_global_prompts()
+    prompts = await get_global_prompts()
     admin_prompts_kb = InlineKeyboardBuilder()
     for prompt_id, name, _ in prompts:
         admin_prompts_kb.row(
@@ -224,7 +336,7 @@ async def prompt_text_handler(message: types.Message, state: FSMContext):
     data = await state.get_data()
     prompt_name = data["prompt_name"]
     prompt_text = message.text
-    add_global_prompt(prompt_name, prompt_text)
+    await add_global_prompt(prompt_name, prompt_text)
     await state.clear()
     await message.reply(f"✅ The new system prompt '{prompt_name}' has been saved.")
 
@@ -232,7 +344,7 @@ async def prompt_text_handler(message: types.Message, state: FSMContext):
 @admin_router.callback_query(lambda query: query.data == "delete_prompt_menu")
 @perms_admins
 async def delete_prompt_menu_handler(query: types.CallbackQuery):
-    prompts = get_global_prompts()
+    prompts = await get_global_prompts()
     delete_prompt_kb = InlineKeyboardBuilder()
     for prompt_id, name, _ in prompts:
         delete_prompt_kb.row(
@@ -248,7 +360,7 @@ async def delete_prompt_menu_handler(query: types.CallbackQuery):
 @perms_admins
 async def delete_prompt_confirm_handler(query: types.CallbackQuery):
     prompt_id = int(query.data.split("_")[2])
-    delete_global_prompt(prompt_id)
+    await delete_global_prompt(prompt_id)
     await query.answer("Prompt deleted successfully.")
     await admin_prompts_callback_handler(query)
 
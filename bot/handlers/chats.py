@@ -1,21 +1,37 @@
+import html
 import logging
+import secrets
+from collections import OrderedDict
 from aiogram import types, Router
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.enums import ParseMode
 
 from bot.auth import perms_allowed, perms_admins
-from bot.core.database import (
+from bot.core.async_database import (
     get_user_chat_sessions,
     create_chat_session,
     load_chat_history,
     delete_chat_session,
+    search_chat_history,
 )
+from bot.core.database import SNIPPET_START, SNIPPET_END
+from bot.core.calibration import token_calibrator
 from bot.ui import ChatCreationStates
+from bot import state as bot_state
 from bot.state import ACTIVE_CHATS, modelname, ensure_system_prompt
 
 chat_router = Router()
 
+SEARCH_PAGE_SIZE = 5
+# /search queries by (user id, query id), for the page buttons of each
+# results message; the least recently used are forgotten beyond
+# SEARCH_QUERIES_MAX. Query ids are random, so buttons from before a
+# restart expire instead of paging through someone's newer query.
+SEARCH_QUERIES: OrderedDict[tuple[int, str], str] = OrderedDict()
+SEARCH_QUERIES_MAX = 1000
+
 
 @chat_router.message(Command("reset"))
 @perms_allowed
@@ -32,7 +48,7 @@ async def command_reset_handler(message: types.Message) -> None:
 @perms_allowed
 async def command_chat_handler(message: types.Message) -> None:
     user_id = message.from_user.id
-    sessions = get_user_chat_sessions(user_id)
+    sessions = await get_user_chat_sessions(user_id)
     chat_kb = InlineKeyboardBuilder()
     for session_id, name in sessions:
         chat_kb.row(types.InlineKeyboardButton(text=name, callback_data=f"switchchat_{session_id}"))
@@ -67,7 +83,7 @@ async def chat_name_handler(message: types.Message, state: FSMContext):
         await message.reply("The name cannot be empty. Please enter a name for the chat:")
         return
 
-    session_id = create_chat_session(user_id, chat_name)
+    session_id = await create_chat_session(user_id, chat_name)
     await state.clear()
     messages = await ensure_system_prompt(user_id, [])
     ACTIVE_CHATS[user_id] = {
@@ -84,7 +100,10 @@ async def chat_name_handler(message: types.Message, state: FSMContext):
 async def switch_chat_handler(query: types.CallbackQuery):
     session_id = query.data.split("_")[1]
     user_id = query.from_user.id
-    history = load_chat_history(session_id)
+    # The 4096-token history budget is in the active model's tokens
+    history = await load_chat_history(
+        session_id, token_calibrator.baseline_budget(bot_state.modelname, 4096)
+    )
     messages = await ensure_system_prompt(user_id, history)
     ACTIVE_CHATS[user_id] = {
         "active_session_id": session_id,
@@ -100,7 +119,7 @@ async def switch_chat_handler(query: types.CallbackQuery):
 @perms_admins
 async def delete_chat_menu_handler(query: types.CallbackQuery):
     user_id = query.from_user.id
-    sessions = get_user_chat_sessions(user_id)
+    sessions = await get_user_chat_sessions(user_id)
     delete_kb = InlineKeyboardBuilder()
     for session_id, name in sessions:
         delete_kb.row(
@@ -127,7 +146,7 @@ async def chat_menu_main_handler(query: types.CallbackQuery):
 async def delete_session_handler(query: types.CallbackQuery):
     session_id = query.data.split("_")[2]
     user_id = query.from_user.id
-    if delete_chat_session(session_id, user_id):
+    if await delete_chat_session(session_id, user_id):
         if ACTIVE_CHATS.get(user_id, {}).get("active_session_id") == session_id:
             ACTIVE_CHATS[user_id]["active_session_id"] = None
             ACTIVE_CHATS[user_id]["messages"] = await ensure_system_prompt(user_id, [])
@@ -136,3 +155,97 @@ async def delete_session_handler(query: types.CallbackQuery):
         await query.answer("Failed to delete chat.")
     # This re-triggers the delete menu.
     await delete_chat_menu_handler(query)
+
+
+# --- Search ---
+
+
+async def _render_search_page(
+    user_id: int, query_id: str, search_text: str, page: int
+) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    # One extra row tells whether there is a next page
+    results = await search_chat_history(
+        user_id, search_text, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE
+    )
+    if results is None:
+        return "Search is not available on this bot.", None
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+    if not results:
+        text = "No saved messages match your search." if page == 0 else "No more results."
+        return text, None
+
+    text = f"🔎 <b>{html.escape(search_text)}</b> (page {page + 1})\n"
+    search_kb = InlineKeyboardBuilder()
+    sessions_shown = set()
+    for number, (session_id, name, role, snippet, timestamp) in enumerate(
+        results, start=page * SEARCH_PAGE_SIZE + 1
+    ):
+        snippet = (
+            html.escape(snippet).replace(SNIPPET_START, "<b>").replace(SNIPPET_END, "</b>")
+        )
+        text += (
+            f"\n{number}. <b>{html.escape(name)}</b> · {role} · {timestamp[:10]}\n"
+            f"<i>{snippet}</i>\n"
+        )
+        if session_id not in sessions_shown:
+            sessions_shown.add(session_id)
+            search_kb.row(
+                types.InlineKeyboardButton(
+                    text=f"📂 {name}", callback_data=f"switchchat_{session_id}"
+                )
+            )
+    nav = []
+    if page > 0:
+        nav.append(
+            types.InlineKeyboardButton(
+                text="◀️ Previous", callback_data=f"searchpage_{query_id}_{page - 1}"
+            )
+        )
+    if has_next:
+        nav.append(
+            types.InlineKeyboardButton(
+                text="Next ▶️", callback_data=f"searchpage_{query_id}_{page + 1}"
+            )
+        )
+    if nav:
+        search_kb.row(*nav)
+    search_kb.row(types.InlineKeyboardButton(text="❌ Close", callback_data="close_menu"))
+    return text, search_kb.as_markup()
+
+
+@chat_router.message(Command("search"))
+@perms_allowed
+async def command_search_handler(message: types.Message) -> None:
+    """
+    Search the user's saved chats: /search <words>.
+    """
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2 or not args[1].strip():
+        await message.reply("Usage: /search <words> (e.g. /search docker compose)")
+        return
+    user_id = message.from_user.id
+    search_text = args[1].strip()
+    query_id = secrets.token_hex(4)
+    SEARCH_QUERIES[(user_id, query_id)] = search_text
+    while len(SEARCH_QUERIES) > SEARCH_QUERIES_MAX:
+        SEARCH_QUERIES.popitem(last=False)
+    text, markup = await _render_search_page(user_id, query_id, search_text, 0)
+    await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+
+
+@chat_router.callback_query(lambda query: query.data.startswith("searchpage_"))
+@perms_allowed
+async def search_page_handler(query: types.CallbackQuery):
+    user_id = query.from_user.id
+    # searchpage_<query id>_<page>
+    parts = query.data.split("_")
+    search_text = SEARCH_QUERIES.get((user_id, parts[1])) if len(parts) == 3 else None
+    if search_text is None:
+        await query.answer("This search has expired, please run /search again.")
+        return
+    _, query_id, page = parts
+    SEARCH_QUERIES.move_to_end((user_id, query_id))
+    text, markup = await _render_search_page(user_id, query_id, search_text, int(page))
+    await query.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await query.answer()
@@ -5,15 +5,38 @@ import base64
 import time
 import aiohttp
 import asyncio
+from contextlib import aclosing
 from aiogram import types, Router
 from aiogram.enums import ParseMode
 from aiogram.filters.command import Command, CommandStart
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot.auth import perms_allowed
-from bot.core.database import get_global_prompts, update_user_prompt, save_chat_message
-from bot.core.ollama import generate, model_supports_vision
-from bot.ui import start_kb
+from bot.auth import perms_allowed, admin_ids
+from bot.core.async_database import (
+    get_global_prompts,
+    update_user_prompt,
+    save_chat_message,
+    save_generation_stats,
+)
+from bot.core.backends import BackendUnavailableError
+from bot.core.calibration import token_calibrator
+from bot.core.cancellation import generations
+from bot.core.catalog import model_supports_vision
+from bot.core.coalesce import coalescer, request_key
+from bot.core.metrics import (
+    errors_total,
+    generations_total,
+    messages_total,
+    tokens_per_second,
+    ttft_seconds,
+)
+from bot.core.context import build_options, parse_options, prefix_stats, trim_history
+from bot.core.ollama import GenerationTimeout, generate
+from bot.core.response_cache import response_cache
+from bot.core.semantic_cache import semantic_cache
+from bot.core.scheduler import scheduler
+from bot.core.stream import ChatChunk, replay_chunks
+from bot.ui import start_kb, stop_kb
 from bot.utils import smart_split
 from system_prompts import get_all_system_prompts
 
@@ -69,6 +92,83 @@ async def command_get_context_handler(message: types.Message) -> None:
         await message.answer("No chat history available for this user")
 
 
+@user_router.message(Command("stop"))
+@perms_allowed
+async def command_stop_handler(message: types.Message) -> None:
+    """
+    Handle the /stop command.
+
+    Cancels the generation currently running for this user in this chat.
+    """
+    if not generations.stop((message.chat.id, message.from_user.id)):
+        await message.answer("Nothing to stop.")
+
+
+@user_router.callback_query(lambda query: query.data == "stop_generation")
+async def stop_generation_callback_handler(query: types.CallbackQuery) -> None:
+    """
+    Handle the inline '⏹ Stop' button shown under a generating answer.
+
+    Only the user who asked can stop their own generation.
+    """
+    if generations.stop((query.message.chat.id, query.from_user.id)):
+        await query.answer("Stopping...")
+    else:
+        await query.answer("Nothing to stop.")
+
+
+@user_router.message(Command("options"))
+@perms_allowed
+async def command_options_handler(message: types.Message) -> None:
+    """
+    Handle the /options command.
+
+    Shows or changes the Ollama options used for the current chat:
+    - /options: show the options in effect
+    - /options temperature=0.2 num_predict=512: set session overrides
+    - /options reset: drop the session overrides
+    """
+    user_id = message.from_user.id
+    args = message.text.split(maxsplit=1)[1] if len(message.text.split()) > 1 else ""
+    if user_id not in ACTIVE_CHATS:
+        ACTIVE_CHATS[user_id] = {
+            "active_session_id": None,
+            "model": state.modelname,
+            "messages": [],
+            "stream": True,
+            "last_activity": time.time(),
+        }
+    chat = ACTIVE_CHATS[user_id]
+
+    if args.strip().lower() == "reset":
+        chat.pop("options", None)
+        await message.answer("✅ Session options cleared.")
+        return
+    if args:
+        try:
+            new_options = parse_options(args)
+        except ValueError as e:
+            await message.answer(f"❌ {e}")
+            return
+        chat["options"] = {**chat.get("options", {}), **new_options}
+
+    if "prompt_options" not in chat:
+        chat["messages"] = await ensure_system_prompt(user_id, chat["messages"])
+    prompt_options = chat.get("prompt_options") or {}
+    session_options = chat.get("options") or {}
+
+    def format_options(options: dict) -> str:
+        return ", ".join(f"{k}={v}" for k, v in options.items()) or "none"
+
+    await message.answer(
+        f"<b>Ollama options</b>\n"
+        f"System prompt: <code>{format_options(prompt_options)}</code>\n"
+        f"This session: <code>{format_options(session_options)}</code>\n"
+        f"num_ctx is sized automatically unless set here.",
+        parse_mode=ParseMode.HTML,
+    )
+
+
 @user_router.callback_query(lambda query: query.data == "about")
 async def about_callback_handler(query: types.CallbackQuery) -> None:
     """
@@ -108,7 +208,7 @@ async def prompts_command_handler(message: types.Message) -> None:
         )
 
     # Add custom prompts from the database
-    custom_prompts = get_global_prompts()
+    custom_prompts = await get_global_prompts()
     for prompt_id, name, _ in custom_prompts:
         prompts_kb.row(
             types.InlineKeyboardButton(
@@ -135,13 +235,13 @@ async def select_prompt_handler(query: types.CallbackQuery) -> None:
 
     if prompt_type == "custom":
         prompt_id_to_save = prompt_key  # Save as string
-        prompts = get_global_prompts()
+        prompts = await get_global_prompts()
         prompt_name = "Unknown"
         for p_id, name, _ in prompts:
             if str(p_id) == prompt_id_to_save:
                 prompt_name = name
                 break
-        update_user_prompt(user_id, prompt_id_to_save)
+        await update_user_prompt(user_id, prompt_id_to_save)
         await query.answer(f"System prompt changed to: {prompt_name}")
         await query.message.edit_text(f"✅ System prompt changed to: {prompt_name} (persistent)")
 
@@ -151,7 +251,7 @@ async def select_prompt_handler(query: types.CallbackQuery) -> None:
             prompt_name = predefined_prompts[prompt_key]["name"]
             # Save the predefined key as string (None for default, string key for others)
             prompt_value = None if prompt_key == "default" else prompt_key
-            update_user_prompt(user_id, prompt_value)
+            await update_user_prompt(user_id, prompt_value)
             await query.answer(f"System prompt changed to: {prompt_name}")
             await query.message.edit_text(
                 f"✅ System prompt changed to: {prompt_name} (persistent)"
@@ -182,6 +282,7 @@ async def handle_message(message: types.Message) -> None:
     - Groups/supergroups: only if bot is mentioned or replied to
     """
     await get_bot_info()
+    messages_total.inc(chat_type=message.chat.type)
     if message.chat.type == "private":
         await ollama_request(message)
         return
@@ -295,13 +396,15 @@ async def add_prompt_to_active_chats(
     ACTIVE_CHATS[user_id]["messages"] = messages
 
 
-async def handle_response(message: types.Message, response_data: dict, full_response: str) -> bool:
+async def handle_response(
+    message: types.Message, response_data: ChatChunk, full_response: str
+) -> bool:
     """
     Handle the final response from Ollama.
 
     Args:
         message: Original user message
-        response_data: Response payload from Ollama
+        response_data: Decoded response chunk from Ollama
         full_response: Complete response text
 
     Returns:
@@ -310,7 +413,7 @@ async def handle_response(message: types.Message, response_data: dict, full_resp
     full_response_stripped = full_response.strip()
     if full_response_stripped == "":
         return False
-    if response_data.get("done"):
+    if response_data.done:
         if ACTIVE_CHATS.get(message.from_user.id) is not None:
             ACTIVE_CHATS[message.from_user.id]["messages"].append(
                 {"role": "assistant", "content": full_response_stripped}
@@ -322,6 +425,89 @@ async def handle_response(message: types.Message, response_data: dict, full_resp
     return False
 
 
+async def scheduled_generate(
+    message: types.Message, payload: dict, modelname: str, prompt: str, options: dict
+):
+    """
+    Wait for a scheduler slot, then stream the generation from Ollama.
+
+    The slot is held until the stream ends. If the request has to wait,
+    the user is told their queue position.
+
+    Yields:
+        ChatChunk objects from generate()
+    """
+    queue_notice = None
+
+    async def notify_queued(position: int) -> None:
+        nonlocal queue_notice
+        queue_notice = await bot.send_message(
+            chat_id=message.chat.id,
+            text=f"⏳ The bot is busy. You are #{position} in the queue.",
+        )
+
+    # Wait for a generation slot (fair across users, admins first)
+    async with scheduler.slot(
+        message.from_user.id,
+        message.chat.id,
+        modelname,
+        priority=message.from_user.id in admin_ids,
+        on_queued=notify_queued,
+    ) as ticket:
+        if queue_notice is not None:
+            try:
+                await bot.delete_message(
+                    chat_id=message.chat.id, message_id=queue_notice.message_id
+                )
+            except Exception as e:
+                logging.warning(f"Could not delete queue notice: {e}")
+
+        async for chunk in generate(payload, modelname, prompt, options, ticket.backend):
+            yield chunk
+
+
+async def finalize_stopped(
+    message: types.Message, sent_message: types.Message | None, full_response: str
+) -> None:
+    """
+    Finish a generation that was stopped by the user.
+
+    The partial answer is kept in the chat (and in history) so the
+    conversation stays consistent with what the user has seen.
+
+    Args:
+        message: Original user message
+        sent_message: Message being edited with the answer, if any
+        full_response: Text generated before the stop
+    """
+    partial = full_response.strip()
+    if not partial or sent_message is None:
+        await state.spinner_manager.delete_if_exists(message)
+        await bot.send_message(chat_id=message.chat.id, text="⏹ Generation stopped.")
+        return
+
+    message_chunks = smart_split(f"{partial}\n\n⏹ `Stopped.`")
+    await bot.edit_message_text(
+        chat_id=message.chat.id,
+        message_id=sent_message.message_id,
+        text=message_chunks[0],
+        parse_mode=ParseMode.MARKDOWN,
+    )
+    for chunk in message_chunks[1:]:
+        await bot.send_message(
+            chat_id=message.chat.id,
+            text=chunk,
+            parse_mode=ParseMode.MARKDOWN,
+        )
+
+    if ACTIVE_CHATS.get(message.from_user.id) is not None:
+        ACTIVE_CHATS[message.from_user.id]["messages"].append(
+            {"role": "assistant", "content": partial}
+        )
+    session_id = ACTIVE_CHATS.get(message.from_user.id, {}).get("active_session_id")
+    await save_chat_message(message.from_user.id, session_id, "assistant", partial)
+
+
 async def ollama_request(message: types.Message, prompt: str = None):
     """
     Main request handler for interacting with Ollama API.
@@ -337,14 +523,23 @@ async def ollama_request(message: types.Message, prompt: str = None):
         4. Stream response from Ollama with progressive editing
         5. Handle errors with specific user-friendly messages
         6. Save assistant response to chat history
+
+    The request can be stopped with /stop or the inline Stop button; the
+    partial answer is then kept.
     """
+    gen_key = (message.chat.id, message.from_user.id)
+    task = asyncio.current_task()
+    generations.register(gen_key, task)
+    full_response = ""
+    sent_message = None
+    request_started = time.perf_counter()
+    ttft_ms = None
+    edits = 0
     try:
         # Limpieza automática de chats inactivos (umbral: 100 entradas)
         if len(ACTIVE_CHATS) > 100:
             cleanup_inactive_chats(timeout_hours=12)
 
-        full_response = ""
-        sent_message = None
         await bot.send_chat_action(message.chat.id, "typing")
         image_base64 = await process_image(message)
 
@@ -362,7 +557,7 @@ async def ollama_request(message: types.Message, prompt: str = None):
         if prompt is None:
             prompt = message.text or message.caption
         session_id = ACTIVE_CHATS.get(message.from_user.id, {}).get("active_session_id")
-        save_chat_message(message.from_user.id, session_id, "user", prompt)
+        await save_chat_message(message.from_user.id, session_id, "user", prompt)
         await add_prompt_to_active_chats(message, prompt, image_base64, state.modelname)
         logging.info(
             f"[OllamaAPI]: Processing '{prompt}' for {message.from_user.first_name} {message.from_user.last_name}"
@@ -372,71 +567,196 @@ async def ollama_request(message: types.Message, prompt: str = None):
         # Reset spinner state for this user
         state.spinner_manager.reset(message.from_user.id)
 
-        async for response_data in generate(payload, state.modelname, prompt):
-            msg = response_data.get("message")
-
-            # Update spinner independently of content (time-based)
-            sent_message = await state.spinner_manager.update(message, full_response)
-
-            if msg is None:
-                continue
-            chunk = msg.get("content", "")
-            full_response += chunk
-
-            # Transition to content mode on first token
-            if state.spinner_manager.get_mode(message.from_user.id) == "pure" and full_response.strip():
-                sent_message = await state.spinner_manager.transition_to_content(message, full_response)
-
-            # Handle paragraph breaks for faster updates
-            has_paragraph_break = chunk.endswith("\n\n") or "\n\n" in chunk
-            if has_paragraph_break:
-                # Force immediate update with faster interval
+        modelname = state.modelname
+        # Trim old turns (rarely, in large steps) so the prompt prefix stays
+        # stable and Ollama can reuse its KV cache between turns
+        prompt_tokens = trim_history(
+            modelname,
+            payload["messages"],
+            {**(payload.get("prompt_options") or {}), **(payload.get("options") or {})},
+        )
+        options = build_options(
+            modelname,
+            payload["messages"],
+            payload.get("prompt_options"),
+            payload.get("options"),
+            prompt_tokens,
+        )
+        key = request_key(modelname, payload["messages"], options)
+        cached_response = await response_cache.get(key)
+        semantic_vector = None
+        if cached_response is None:
+            # Near-duplicate standalone questions can reuse an earlier answer
+            cached_response, semantic_vector = await semantic_cache.lookup(
+                modelname, payload["messages"]
+            )
+        if cached_response is not None:
+            # Cache hit: replay through the normal streaming path
+            logging.info(f"[ResponseCache]: hit {key[:12]} for {message.from_user.id}")
+            stream = replay_chunks(cached_response)
+        else:
+            # Identical in-flight requests share one Ollama stream
+            stream = coalescer.stream(
+                key, lambda: scheduled_generate(message, payload, modelname, prompt, options)
+            )
+        stop_markup = stop_kb.as_markup()
+        # Close the stream as soon as this handler leaves it (stop, error or
+        # final chunk) instead of when it is garbage-collected: the last
+        # subscriber leaving cancels the shared Ollama request
+        async with aclosing(stream):
+            async for response_data in stream:
+                # Update spinner independently of content (time-based)
                 sent_message = await state.spinner_manager.update(
-                    message, full_response, force_mode="content"
+                    message, full_response, reply_markup=stop_markup
                 )
 
-            if sent_message is None and full_response.strip():
-                # Fallback: send initial message with spinner if not sent yet
-                initial_text = f"{full_response.strip()}\n\n`{state.spinner_manager.FRAMES[0]}`"
-                sent_message = await bot.send_message(
-                    chat_id=message.chat.id,
-                    text=initial_text,
-                    parse_mode=ParseMode.MARKDOWN,
-                )
+                if response_data.message is None:
+                    continue
+                chunk = response_data.content
+                full_response += chunk
+                if ttft_ms is None and chunk:
+                    # Time to first token as seen by the user (includes queueing)
+                    ttft_ms = (time.perf_counter() - request_started) * 1000
+
+                # Transition to content mode on first token
+                if state.spinner_manager.get_mode(message.from_user.id) == "pure" and full_response.strip():
+                    sent_message = await state.spinner_manager.transition_to_content(
+                        message, full_response, reply_markup=stop_markup
+                    )
 
-            if response_data.get("done"):
-                # Final response: remove spinner and send complete message(s)
-                final_text = f"{full_response.strip()}\n\n⚡ `{state.modelname} in {response_data.get('total_duration') / 1e9:.1f}s.`"
-                message_chunks = smart_split(final_text)
-                if len(message_chunks) == 1:
-                    await bot.edit_message_text(
-                        chat_id=message.chat.id,
-                        message_id=sent_message.message_id,
-                        text=message_chunks[0],
-                        parse_mode=ParseMode.MARKDOWN,
+                # Handle paragraph breaks for faster updates
+                has_paragraph_break = chunk.endswith("\n\n") or "\n\n" in chunk
+                if has_paragraph_break:
+                    # Force immediate update with faster interval
+                    sent_message = await state.spinner_manager.update(
+                        message, full_response, force_mode="content", reply_markup=stop_markup
                     )
-                else:
-                    await bot.edit_message_text(
+
+                if sent_message is None and full_response.strip():
+                    # Fallback: send initial message with spinner if not sent yet
+                    initial_text = f"{full_response.strip()}\n\n`{state.spinner_manager.FRAMES[0]}`"
+                    sent_message = await bot.send_message(
                         chat_id=message.chat.id,
-                        message_id=sent_message.message_id,
-                        text=message_chunks[0],
+                        text=initial_text,
                         parse_mode=ParseMode.MARKDOWN,
+                        reply_markup=stop_markup,
                     )
-                    for chunk in message_chunks[1:]:
-                        await bot.send_message(
+                    edits += 1
+
+                if response_data.done:
+                    # Final response: remove spinner and send complete message(s)
+                    cached = " (cached)" if response_data.raw.get("cached") else ""
+                    final_text = f"{full_response.strip()}\n\n⚡ `{state.modelname} in {response_data.total_duration / 1e9:.1f}s{cached}.`"
+                    message_chunks = smart_split(final_text)
+                    edits += len(message_chunks)
+                    if len(message_chunks) == 1:
+                        await bot.edit_message_text(
                             chat_id=message.chat.id,
-                            text=chunk,
+                            message_id=sent_message.message_id,
+                            text=message_chunks[0],
                             parse_mode=ParseMode.MARKDOWN,
                         )
-                await handle_response(message, response_data, full_response)
-                session_id = ACTIVE_CHATS.get(message.from_user.id, {}).get("active_session_id")
-                save_chat_message(
-                    message.from_user.id, session_id, "assistant", full_response.strip()
-                )
-                break
+                    else:
+                        await bot.edit_message_text(
+                            chat_id=message.chat.id,
+                            message_id=sent_message.message_id,
+                            text=message_chunks[0],
+                            parse_mode=ParseMode.MARKDOWN,
+                        )
+                        for chunk in message_chunks[1:]:
+                            await bot.send_message(
+                                chat_id=message.chat.id,
+                                text=chunk,
+                                parse_mode=ParseMode.MARKDOWN,
+                            )
+                    await handle_response(message, response_data, full_response)
+                    generations_total.inc(
+                        model=modelname, outcome="cached" if cached_response is not None else "ok"
+                    )
+                    if ttft_ms is not None:
+                        ttft_seconds.observe(ttft_ms / 1000, model=modelname)
+                    if response_data.eval_count and response_data.eval_duration:
+                        tokens_per_second.observe(
+                            response_data.eval_count / response_data.eval_duration * 1e9,
+                            model=modelname,
+                        )
+                    if cached_response is None:
+                        token_calibrator.observe(
+                            modelname,
+                            prompt_tokens,
+                            full_response.strip(),
+                            response_data.prompt_eval_count,
+                            response_data.eval_count,
+                        )
+                        reused = prefix_stats.record(prompt_tokens, response_data.prompt_eval_count)
+                        if reused is not None:
+                            logging.info(
+                                f"[Context]: evaluated {response_data.prompt_eval_count} of "
+                                f"~{prompt_tokens} prompt tokens ({reused:.0%} reused from cache)"
+                            )
+                    if (
+                        cached_response is None
+                        and response_data.done_reason in (None, "stop")
+                        and not image_base64
+                    ):
+                        response_cache.put(key, modelname, full_response.strip())
+                        semantic_cache.store(
+                            modelname, payload["messages"], semantic_vector, full_response.strip()
+                        )
+                    session_id = ACTIVE_CHATS.get(message.from_user.id, {}).get("active_session_id")
+                    chat_id = await save_chat_message(
+                        message.from_user.id, session_id, "assistant", full_response.strip()
+                    )
+                    await save_generation_stats(
+                        {
+                            "chat_id": chat_id,
+                            "user_id": message.from_user.id,
+                            "model": modelname,
+                            "cached": cached_response is not None,
+                            "ttft_ms": ttft_ms,
+                            "edit_count": edits
+                            + state.spinner_manager.get_edit_count(message.from_user.id),
+                            "total_duration": response_data.total_duration,
+                            "load_duration": response_data.load_duration,
+                            "prompt_eval_count": response_data.prompt_eval_count,
+                            "prompt_eval_duration": response_data.prompt_eval_duration,
+                            "eval_count": response_data.eval_count,
+                            "eval_duration": response_data.eval_duration,
+                            "done_reason": response_data.done_reason,
+                        }
+                    )
+                    break
+    except asyncio.CancelledError:
+        if not generations.was_stopped(task):
+            raise
+        # Stopped by the user: swallow the cancellation and keep the partial answer
+        task.uncancel()
+        logging.info(f"[OllamaAPI]: Generation stopped by {message.from_user.id}")
+        generations_total.inc(model=state.modelname, outcome="stopped")
+        try:
+            await finalize_stopped(message, sent_message, full_response)
+        except Exception as e:
+            logging.warning(f"Could not finalize stopped generation: {e}")
+    except BackendUnavailableError as e:
+        # Circuit open: every Ollama server is down, fail fast
+        logging.warning(f"Ollama unavailable: {e}")
+        errors_total.inc(type="unavailable")
+
+        await state.spinner_manager.delete_if_exists(message)
+
+        error_msg = (
+            "⏳ Ollama is unavailable right now. "
+            f"Please try again in about {max(1, round(e.retry_after))} seconds."
+        )
+        await bot.send_message(
+            chat_id=message.chat.id,
+            text=error_msg,
+            parse_mode=ParseMode.HTML,
+        )
     except aiohttp.ClientResponseError as e:
         # Error HTTP específico (404, 500, etc.)
         logging.error(f"Ollama HTTP error {e.status}: {e.message}", exc_info=True)
+        errors_total.inc(type="http")
 
         # Limpiar spinner si existe
         await state.spinner_manager.delete_if_exists(message)
@@ -457,6 +777,7 @@ async def ollama_request(message: types.Message, prompt: str = None):
     except aiohttp.ClientError as e:
         # Otros errores de conexión (conexión rechazada, timeout de conexión, etc.)
         logging.error(f"Ollama connection error: {e}", exc_info=True)
+        errors_total.inc(type="connection")
 
         # Limpiar spinner si existe
         await state.spinner_manager.delete_if_exists(message)
@@ -467,16 +788,23 @@ async def ollama_request(message: types.Message, prompt: str = None):
             text=error_msg,
             parse_mode=ParseMode.HTML,
         )
-    except asyncio.TimeoutError:
+    except asyncio.TimeoutError as e:
         # Timeout general
         logging.error("Ollama request timeout", exc_info=True)
 
         # Limpiar spinner si existe
         await state.spinner_manager.delete_if_exists(message)
 
-        error_msg = (
-            "❌ Ollama is taking too long to respond. Try a shorter prompt or check the model."
-        )
+        phase = e.phase if isinstance(e, GenerationTimeout) else None
+        errors_total.inc(type=f"timeout_{phase}" if phase else "timeout")
+        if phase == "first_token":
+            error_msg = "❌ The model took too long to start answering. It may still be loading, try again shortly."
+        elif phase == "stall":
+            error_msg = "❌ Ollama stopped responding in the middle of the answer. Please try again."
+        else:
+            error_msg = (
+                "❌ Ollama is taking too long to respond. Try a shorter prompt or check the model."
+            )
         await bot.send_message(
             chat_id=message.chat.id,
             text=error_msg,
@@ -485,6 +813,7 @@ async def ollama_request(message: types.Message, prompt: str = None):
     except Exception as e:
         # Cualquier otro error inesperado
         logging.error(f"Unexpected error in ollama_request: {e}", exc_info=True)
+        errors_total.inc(type="unexpected")
 
         # Limpiar spinner si existe
         await state.spinner_manager.delete_if_exists(message)
@@ -495,3 +824,5 @@ async def ollama_request(message: types.Message, prompt: str = None):
             text=error_msg,
             parse_mode=ParseMode.HTML,
         )
+    finally:
+        generations.unregister(gen_key, task)
@@ -9,19 +9,80 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 # Import shared state and core functions
 from bot.state import bot, dp, set_modelname_from_db
-from bot.core.database import init_db
+from bot.core.async_database import db_executor, write_behind
+from bot.core.database import (
+    init_db,
+    close_db,
+    fill_cum_tokens_batch,
+    fill_token_counts_batch,
+    index_chats_batch,
+    merge_chats_fts,
+)
+from bot.core.calibration import token_calibrator
+from bot.core.catalog import capability_catalog
+from bot.core.coalesce import coalescer
+from bot.core.cancellation import generations
+from bot.core.metrics import registry, metrics_server, TelegramLatencyMiddleware
+from bot.core.ollama import init_client, close_client
+from bot.core.pulls import pull_queue
+from bot.core.residency import residency
+from bot.core.response_cache import response_cache
+from bot.core.scheduler import scheduler
+from bot.core.semantic_cache import semantic_cache
 from bot.utils.spinner import SpinnerManager
 
 # Routers will be imported after spinner_manager initialization
 # (import statements moved inside main())
 
 
+async def backfill_in_background() -> None:
+    """Fill chats.token_count and cum_tokens for older messages, one batch at a time."""
+    try:
+        # On the writer thread, between the queued chat writes
+        batches = 0
+        last_id = 0
+        while (last_id := await db_executor.write(fill_token_counts_batch, last_id)) is not None:
+            batches += 1
+        last_session = ""
+        while (
+            last_session := await db_executor.write(fill_cum_tokens_batch, last_session)
+        ) is not None:
+            batches += 1
+        if batches:
+            logging.info(f"Token count backfill done ({batches} batches)")
+    except Exception as e:
+        logging.error(f"Token count backfill failed: {e}", exc_info=True)
+
+
+async def index_chats_in_background() -> None:
+    """Add messages saved before /search existed to its index, one batch at a time."""
+    try:
+        # On the writer thread, between the queued chat writes
+        indexed = 0
+        while (batch := await db_executor.write(index_chats_batch)) is not None:
+            indexed += batch
+            if indexed % 100000 < batch:
+                logging.info(f"Indexed {indexed} messages for search")
+        if indexed:
+            while await db_executor.write(merge_chats_fts):
+                pass
+            logging.info(f"Search index backfill done ({indexed} messages)")
+    except Exception as e:
+        logging.error(f"Search index backfill failed: {e}", exc_info=True)
+
+
 async def main():
     # Initialize database
     init_db()
 
+    # Store token counts for messages saved before they were tracked
+    backfill_task = asyncio.create_task(backfill_in_background())
+    # Index older messages for /search (resumes after a restart)
+    index_task = asyncio.create_task(index_chats_in_background())
+
     # Load saved model from database (if exists)
     set_modelname_from_db()
+    await token_calibrator.load()
 
     # Initialize spinner manager BEFORE importing any handlers
     import bot.state as state_module
@@ -40,10 +101,14 @@ async def main():
         types.BotCommand(command="chats", description="Manage chats"),
         types.BotCommand(command="reset", description="Reset current chat"),
         types.BotCommand(command="history", description="Look through messages"),
+        types.BotCommand(command="search", description="Search your saved chats"),
+        types.BotCommand(command="stop", description="Stop the current answer"),
+        types.BotCommand(command="options", description="Show or set model options"),
         types.BotCommand(command="pullmodel", description="[Admin] Pull a model from Ollama"),
         types.BotCommand(command="adduser", description="[Admin] Add user to allowlist"),
         types.BotCommand(command="rmuser", description="[Admin] Remove user from allowlist"),
         types.BotCommand(command="listusers", description="[Admin] List allowed users"),
+        types.BotCommand(command="stats", description="[Admin] Generation statistics"),
     ]
     await bot.set_my_commands(commands)
 
@@ -54,14 +119,67 @@ async def main():
         user_router
     )  # User router should be last as it has the generic message handler
 
-    # Start polling
-    await dp.start_polling(
-        bot,
-        timeout=50,
-        request_timeout=60,
-        drop_pending_updates=True,
-        allowed_updates=["message", "callback_query"],
+    # Metrics: Telegram API latency, runtime gauges and the optional /metrics server
+    bot.session.middleware(TelegramLatencyMiddleware())
+    registry.gauge(
+        "bot_active_chats", "Entries in ACTIVE_CHATS", lambda: len(state_module.ACTIVE_CHATS)
+    )
+    registry.gauge(
+        "bot_spinner_states", "Users with spinner state", lambda: len(state_module.spinner_manager)
+    )
+    registry.gauge(
+        "bot_scheduler_queue_depth", "Generations waiting for a slot", lambda: scheduler.queue_depth
     )
+    registry.gauge("bot_scheduler_running", "Generations holding a slot", lambda: scheduler.running)
+    registry.gauge(
+        "bot_streams_in_flight", "Upstream Ollama streams running", lambda: coalescer.in_flight
+    )
+    registry.gauge(
+        "bot_generations_active", "Generations users are waiting on", lambda: generations.active
+    )
+    registry.gauge(
+        "bot_db_write_queue_depth",
+        "Rows waiting in the write-behind queue",
+        lambda: write_behind.pending,
+    )
+    await metrics_server.start()
+
+    # Shared Ollama HTTP client (pooled keep-alive connections)
+    await init_client()
+
+    # Preload the active model so the first message doesn't pay the load time
+    residency.warm_in_background(state_module.modelname)
+    residency.start()
+
+    # Catalog model capabilities now and keep them fresh in the background
+    capability_catalog.start()
+    pull_queue.add_completion_hook(capability_catalog.on_pull_complete)
+
+    # Start polling
+    try:
+        await dp.start_polling(
+            bot,
+            timeout=50,
+            request_timeout=60,
+            drop_pending_updates=True,
+            allowed_updates=["message", "callback_query"],
+        )
+    finally:
+        # A batch already on the writer thread finishes before it shuts down
+        index_task.cancel()
+        backfill_task.cancel()
+        await asyncio.gather(index_task, backfill_task, return_exceptions=True)
+        await pull_queue.stop()
+        await residency.stop()
+        await capability_catalog.stop()
+        await close_client()
+        semantic_cache.close()
+        await metrics_server.stop()
+        # Commit queued chat messages and stats before the writer thread stops
+        await write_behind.stop()
+        db_executor.shutdown()
+        response_cache.close()
+        close_db()
 
 
 if __name__ == "__main__":
@@ -4,7 +4,8 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
-from bot.core.database import get_user_prompt, get_global_prompts, get_bot_config
+from bot.core.async_database import get_user_prompt, get_global_prompts
+from bot.core.database import get_bot_config
 from bot.utils.spinner import SpinnerManager
 
 # Load environment variables
@@ -80,23 +81,29 @@ async def ensure_system_prompt(user_id: int, messages: list[dict]) -> list[dict]
     - None (default)
     - A predefined prompt key string ("default", "code", etc.)
     - A custom prompt ID (stored as string in DB)
+
+    Predefined prompts may also define Ollama "options"; they are stored in
+    the user's ACTIVE_CHATS entry as "prompt_options".
     """
     from system_prompts import SYSTEM_PROMPTS
 
-    selected_prompt_id = get_user_prompt(user_id)
+    selected_prompt_id = await get_user_prompt(user_id)
     system_prompt_content = ""
+    prompt_options = {}
 
     if selected_prompt_id is None:
         # No selection, use default
         system_prompt_content = SYSTEM_PROMPTS["default"]["prompt"]
+        prompt_options = SYSTEM_PROMPTS["default"].get("options", {})
     elif selected_prompt_id in SYSTEM_PROMPTS:
         # It's a predefined prompt key
         system_prompt_content = SYSTEM_PROMPTS[selected_prompt_id]["prompt"]
+        prompt_options = SYSTEM_PROMPTS[selected_prompt_id].get("options", {})
     else:
         # It might be a custom prompt ID (stored as string)
         try:
             custom_id = int(selected_prompt_id)
-            prompts = get_global_prompts()
+            prompts = await get_global_prompts()
             for p_id, _, text in prompts:
                 if p_id == custom_id:
                     system_prompt_content = text
@@ -106,9 +113,14 @@ async def ensure_system_prompt(user_id: int, messages: list[dict]) -> list[dict]
             logging.warning(f"Invalid prompt_id format for user {user_id}: {selected_prompt_id}")
             system_prompt_content = SYSTEM_PROMPTS["default"]["prompt"]
 
+    # Ollama options of the selected prompt (temperature, num_predict, ...)
+    if user_id in ACTIVE_CHATS:
+        ACTIVE_CHATS[user_id]["prompt_options"] = prompt_options
+
     if system_prompt_content:
         if not messages or messages[0].get("role") != "system":
             messages.insert(0, {"role": "system", "content": system_prompt_content})
-        else:
+        elif messages[0]["content"] != system_prompt_content:
+            # Only touch the prefix when the prompt really changed
             messages[0]["content"] = system_prompt_content
     return messages
@@ -25,6 +25,8 @@ SYSTEM_PROMPTS = {
     "code": {
         "name": "Code Assistant",
         "prompt": "You are an expert AI programmer. You only write code and follow instructions, no extra explanations, only comments in code.",
+        # Optional Ollama options used with this prompt (see /options)
+        "options": {"temperature": 0.2},
     },
     "image_prompt_engineer": {
         "name": "Image Prompt Engineer",
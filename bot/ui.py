@@ -24,6 +24,11 @@ settings_kb.row(
     types.InlineKeyboardButton(text="❌ Close", callback_data="close_settings"),
 )
 
+stop_kb = InlineKeyboardBuilder()
+stop_kb.row(
+    types.InlineKeyboardButton(text="⏹ Stop", callback_data="stop_generation"),
+)
+
 # --- FSM States ---
 
 
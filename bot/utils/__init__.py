@@ -2,13 +2,33 @@
 Utility functions for the Ollama Telegram bot.
 """
 
+import functools
+
 from bot.utils.spinner import SpinnerManager
 from bot.utils.text import find_safe_split_pos, smart_split
 
 
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str | None):
+    """Return the (cached) tiktoken encoding for a model, or None without tiktoken."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Fallback to cl100k_base for unknown models
+            pass
+    return tiktoken.get_encoding("cl100k_base")
+
+
 def count_tokens(text: str, model: str | None = None) -> int:
     """Count tokens in a text string using tiktoken if available, else fallback.
 
+    The encoder is built once per model and reused.
+
     Args:
         text: The text to count tokens for.
         model: Optional model name to use appropriate encoding.
@@ -16,22 +36,11 @@ def count_tokens(text: str, model: str | None = None) -> int:
     Returns:
         Number of tokens in the text.
     """
-    try:
-        import tiktoken
-
-        if model:
-            try:
-                encoding = tiktoken.encoding_for_model(model)
-            except KeyError:
-                # Fallback to cl100k_base for unknown models
-                encoding = tiktoken.get_encoding("cl100k_base")
-        else:
-            encoding = tiktoken.get_encoding("cl100k_base")
-
-        return len(encoding.encode(text))
-    except ImportError:
+    encoding = _get_encoding(model)
+    if encoding is None:
         # Fallback: approximate 1 token per 4 characters
         return max(1, len(text) // 4)
+    return len(encoding.encode(text))
 
 
 __all__ = ["SpinnerManager", "find_safe_split_pos", "smart_split", "count_tokens"]
@@ -46,6 +46,10 @@ class SpinnerManager:
         self.bot = bot
         self._state: dict[int, dict] = {}
 
+    def __len__(self) -> int:
+        """Number of users with spinner state."""
+        return len(self._state)
+
     def get_state(self, user_id: int) -> dict:
         """
         Get or create spinner state for a user.
@@ -54,7 +58,7 @@ class SpinnerManager:
             user_id: Telegram user ID
 
         Returns:
-            State dictionary with keys: spinner_index, last_update, mode, sent_message
+            State dictionary with keys: spinner_index, last_update, mode, sent_message, edits
         """
         if user_id not in self._state:
             self._state[user_id] = {
@@ -62,6 +66,7 @@ class SpinnerManager:
                 "last_update": 0.0,
                 "mode": "pure",  # 'pure' | 'content'
                 "sent_message": None,
+                "edits": 0,  # Telegram send/edit calls made for this answer
             }
         return self._state[user_id]
 
@@ -96,6 +101,7 @@ class SpinnerManager:
         message: types.Message,
         full_response: str = "",
         force_mode: str = None,
+        reply_markup: types.InlineKeyboardMarkup | None = None,
     ) -> types.Message | None:
         """
         Update the spinner animation based on current mode and interval.
@@ -104,6 +110,7 @@ class SpinnerManager:
             message: Original user message (used for chat_id)
             full_response: Accumulated response text so far (empty = pure mode)
             force_mode: Optional mode override ('pure' or 'content')
+            reply_markup: Optional inline keyboard shown under the spinner
 
         Returns:
             The sent/updated message object, or None if no update was needed
@@ -137,7 +144,9 @@ class SpinnerManager:
                 chat_id=message.chat.id,
                 text=text,
                 parse_mode=ParseMode.MARKDOWN,
+                reply_markup=reply_markup,
             )
+            state["edits"] += 1
         else:
             if state["sent_message"].text != text:
                 try:
@@ -146,7 +155,9 @@ class SpinnerManager:
                         message_id=state["sent_message"].message_id,
                         text=text,
                         parse_mode=ParseMode.MARKDOWN,
+                        reply_markup=reply_markup,
                     )
+                    state["edits"] += 1
                 except Exception as e:
                     logger.warning(f"Could not edit spinner: {e}")
 
@@ -158,7 +169,10 @@ class SpinnerManager:
         return state["sent_message"]
 
     async def transition_to_content(
-        self, message: types.Message, full_response: str
+        self,
+        message: types.Message,
+        full_response: str,
+        reply_markup: types.InlineKeyboardMarkup | None = None,
     ) -> types.Message | None:
         """
         Smoothly transition from pure spinner to content mode.
@@ -170,6 +184,7 @@ class SpinnerManager:
         Args:
             message: Original user message
             full_response: First chunk of response text
+            reply_markup: Optional inline keyboard shown under the message
 
         Returns:
             Updated message object, or None if state doesn't exist
@@ -186,7 +201,9 @@ class SpinnerManager:
                 chat_id=message.chat.id,
                 text=text,
                 parse_mode=ParseMode.MARKDOWN,
+                reply_markup=reply_markup,
             )
+            state["edits"] += 1
         else:
             if state["sent_message"].text != text:
                 try:
@@ -195,7 +212,9 @@ class SpinnerManager:
                         message_id=state["sent_message"].message_id,
                         text=text,
                         parse_mode=ParseMode.MARKDOWN,
+                        reply_markup=reply_markup,
                     )
+                    state["edits"] += 1
                 except Exception as e:
                     logger.warning(f"Could not transition spinner: {e}")
 
@@ -235,6 +254,19 @@ class SpinnerManager:
         state = self._state.get(user_id)
         return state["mode"] if state else "pure"
 
+    def get_edit_count(self, user_id: int) -> int:
+        """
+        Get the number of Telegram send/edit calls made for the current answer.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Number of messages sent or edited since the last reset, or 0 if no state
+        """
+        state = self._state.get(user_id)
+        return state["edits"] if state else 0
+
     def get_spinner_index(self, user_id: int) -> int:
         """
         Get current spinner frame index for a user.
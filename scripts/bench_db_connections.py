@@ -0,0 +1,86 @@
+"""
+Benchmark of per-turn database work with shared vs per-call connections.
+
+Each simulated turn makes the calls a chat message causes: is_user_allowed,
+get_user_prompt, get_bot_config, two save_chat_message and one
+save_generation_stats, on a session that already holds 200 messages.
+
+- "shared": bot.core.database as it is, one long-lived WAL connection per
+  thread with tuned pragmas (see get_connection)
+- "per-call": how the module worked before, a fresh connection with
+  SQLite's defaults (rollback journal, synchronous=FULL) for every call
+
+Token counting is replaced by a word count in both modes, so only the
+database work is timed (and tiktoken needs no download).
+
+Usage:
+    python scripts/bench_db_connections.py [--turns 500]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bot.core import database  # noqa: E402
+
+
+def run(mode: str, turns: int) -> list[float]:
+    path = os.path.join(tempfile.mkdtemp(), "users.db")
+    database.close_db()
+    database.DATABASE_PATH = path
+    database.init_db()
+    if mode == "per-call":
+        database.close_db()
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        database.get_connection = lambda: sqlite3.connect(path)
+
+    database.add_user_to_db(1, "user")
+    session_id = database.create_chat_session(1, "bench")
+    for _ in range(200):
+        database.save_chat_message(1, session_id, "user", "hello " * 50)
+
+    def turn() -> None:
+        database.is_user_allowed(1)
+        database.get_user_prompt(1)
+        database.get_bot_config("current_model")
+        database.save_chat_message(1, session_id, "user", "question " * 40)
+        chat_id = database.save_chat_message(1, session_id, "assistant", "answer " * 200)
+        database.save_generation_stats({"chat_id": chat_id, "user_id": 1, "model": "llama3"})
+
+    for _ in range(20):
+        turn()
+    times = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        turn()
+        times.append((time.perf_counter() - started) * 1000)
+    return sorted(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    database.count_tokens = lambda text: len(text.split())
+    shared_get_connection = database.get_connection
+    for mode in ("per-call", "shared"):
+        times = run(mode, args.turns)
+        database.get_connection = shared_get_connection
+        print(
+            f"{mode:9s} mean {statistics.mean(times):6.2f} ms"
+            f"  p50 {times[len(times) // 2]:6.2f} ms"
+            f"  p95 {times[int(len(times) * 0.95)]:6.2f} ms"
+        )
+    database.close_db()
+
+
+if __name__ == "__main__":
+    main()
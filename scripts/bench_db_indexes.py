@@ -0,0 +1,183 @@
+"""
+Benchmark of the hot-path queries with and without their indexes.
+
+Builds a synthetic database at schema version 3 (before the hot-path
+indexes existed), upgrades it with init_db, fills the running token
+totals and the search index, and times:
+
+- load_chat_history (one random session)
+- get_user_chat_sessions (one random user)
+- delete_chat_history (one random user, rolled back)
+- get_generation_stats("-24 hours")
+
+first with every index in place, then with the indexes from migrations
+4 and 5 dropped, which is how these queries ran before. /search
+(search_chat_history) is timed once, on the full-text index, for a
+random user with a less common word, two words and a word found in
+nearly every message.
+
+Usage:
+    python scripts/bench_db_indexes.py [--messages 2000000] [--path bench.db]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bot.core import database  # noqa: E402
+
+HOT_PATH_INDEXES = (
+    "idx_chats_session",
+    "idx_chats_user",
+    "idx_chat_sessions_user",
+    "idx_generation_stats_created",
+    "idx_chats_session_cum",
+)
+# Message text is drawn from VOCABULARY_SIZE words with Zipf-like
+# frequencies; "w0" is in nearly every message, "w1000" in about 1%
+VOCABULARY_SIZE = 5000
+WORDS_PER_MESSAGE = 30
+
+
+def build(path: str, messages: int, users: int, sessions_per_user: int, stats: int) -> None:
+    """Create a version 3 database filled with synthetic chats and stats."""
+    conn = database.get_connection()
+    c = conn.cursor()
+    for migration in database.MIGRATIONS[:3]:
+        migration(c)
+    c.execute("PRAGMA user_version = 3")
+    rng = random.Random(1)
+    c.executemany(
+        "INSERT INTO users (id, name) VALUES (?, ?)", [(u, f"user {u}") for u in range(users)]
+    )
+    sessions = [
+        (str(uuid.uuid4()), u, f"chat {k}") for u in range(users) for k in range(sessions_per_user)
+    ]
+    c.executemany(
+        "INSERT INTO chat_sessions (session_id, user_id, name) VALUES (?, ?, ?)", sessions
+    )
+    words = [f"w{rank}" for rank in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    texts = [
+        " ".join(rng.choices(words, weights, k=WORDS_PER_MESSAGE)) for _ in range(10000)
+    ]
+    batch = []
+    for i in range(messages):
+        session_id, user_id, _ = sessions[rng.randrange(len(sessions))]
+        role = "user" if i % 2 == 0 else "assistant"
+        batch.append((session_id, user_id, role, rng.choice(texts), WORDS_PER_MESSAGE))
+        if len(batch) == 100000 or i == messages - 1:
+            c.executemany(
+                "INSERT INTO chats (session_id, user_id, role, content, token_count, timestamp)"
+                " VALUES (?, ?, ?, ?, ?,"
+                " datetime('2026-01-01', '+' || abs(random() % 30000000) || ' seconds'))",
+                batch,
+            )
+            batch = []
+    c.executemany(
+        "INSERT INTO generation_stats (user_id, model, ttft_ms, eval_count, created_at)"
+        " VALUES (?, 'llama3', 250.0, 300,"
+        " datetime('now', '-' || abs(random() % 2592000) || ' seconds'))",
+        [(rng.randrange(users),) for _ in range(stats)],
+    )
+    conn.commit()
+
+
+def bench(name: str, func, runs: int) -> None:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    p50, p95 = times[len(times) // 2], times[int(len(times) * 0.95)]
+    print(f"  {name:34s} p50 {p50:9.2f} ms  p95 {p95:9.2f} ms")
+
+
+def run_queries(users: int) -> None:
+    conn = database.get_connection()
+    session_ids = [row[0] for row in conn.execute("SELECT session_id FROM chat_sessions")]
+    rng = random.Random(2)
+
+    def delete_rolled_back() -> None:
+        conn.execute("SAVEPOINT bench")
+        conn.execute("DELETE FROM chats WHERE user_id = ?", (rng.randrange(users),))
+        conn.execute("ROLLBACK TO bench")
+        conn.execute("RELEASE bench")
+
+    bench("load_chat_history", lambda: database.load_chat_history(rng.choice(session_ids)), 30)
+    bench(
+        "get_user_chat_sessions", lambda: database.get_user_chat_sessions(rng.randrange(users)), 30
+    )
+    bench("delete_chat_history (rolled back)", delete_rolled_back, 10)
+    bench("get_generation_stats(24h)", lambda: database.get_generation_stats("-24 hours"), 30)
+
+
+def run_search(users: int) -> None:
+    rng = random.Random(3)
+
+    def search(text: str) -> None:
+        database.search_chat_history(rng.randrange(users), text, limit=6)
+
+    bench("search (one word)", lambda: search(f"w{rng.randrange(100, 2000)}"), 30)
+    bench(
+        "search (two words)",
+        lambda: search(f"w{rng.randrange(10, 100)} w{rng.randrange(100, 1000)}"),
+        30,
+    )
+    bench("search (common word)", lambda: search("w0"), 30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--sessions-per-user", type=int, default=10)
+    parser.add_argument("--stats", type=int, default=500000)
+    parser.add_argument("--path", help="Database file (default: a temporary file)")
+    args = parser.parse_args()
+
+    database.count_tokens = lambda text: len(text.split())
+    database.DATABASE_PATH = args.path or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if os.path.exists(database.DATABASE_PATH):
+        sys.exit(f"{database.DATABASE_PATH} already exists")
+
+    started = time.perf_counter()
+    build(database.DATABASE_PATH, args.messages, args.users, args.sessions_per_user, args.stats)
+    print(f"Built {args.messages} messages in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    database.init_db()
+    print(f"Upgraded the schema in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    database.backfill_token_counts()
+    print(f"Computed running token totals in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    while database.index_chats_batch() is not None:
+        pass
+    while database.merge_chats_fts():
+        pass
+    print(f"Built the search index in {time.perf_counter() - started:.1f} s")
+
+    print("Search:")
+    run_search(args.users)
+    print("With indexes:")
+    run_queries(args.users)
+
+    conn = database.get_connection()
+    for index in HOT_PATH_INDEXES:
+        conn.execute(f"DROP INDEX {index}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    print("Without the hot-path indexes:")
+    run_queries(args.users)
+    database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Microbenchmark of the /api/chat NDJSON stream decoder.
+
+Compares bot.core.stream.NDJSONDecoder (plus ChatChunk construction)
+with the loop generate() used before it, which appended every network
+chunk to a bytes buffer and split one line off at a time. The stream is
+fed in several chunkings, from one large read down to tiny pieces.
+
+Usage:
+    python scripts/bench_ndjson.py [--lines 20000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bot.core.stream import JSON_BACKEND, ChatChunk, NDJSONDecoder  # noqa: E402
+
+
+def make_stream(lines: int) -> bytes:
+    """An /api/chat stream of `lines` lines, the last one with the final stats."""
+    out = []
+    for i in range(lines - 1):
+        out.append(
+            {
+                "model": "llama3",
+                "created_at": "2026-01-01T00:00:00.000000Z",
+                "message": {"role": "assistant", "content": f" token{i % 97}"},
+                "done": False,
+            }
+        )
+    out.append(
+        {
+            "model": "llama3",
+            "created_at": "2026-01-01T00:00:00.000000Z",
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": 1,
+            "eval_count": lines,
+        }
+    )
+    return b"".join(json.dumps(obj).encode() + b"\n" for obj in out)
+
+
+def split(data: bytes, size: int | None, by_line: bool = False) -> list[bytes]:
+    if by_line:
+        return [line + b"\n" for line in data.split(b"\n") if line]
+    if size is None:
+        return [data]
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def old_decoder(chunks: list[bytes]) -> int:
+    # The loop generate() used before NDJSONDecoder
+    count = 0
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            line = line.strip()
+            if line:
+                json.loads(line)
+                count += 1
+    return count
+
+
+def new_decoder(chunks: list[bytes]) -> int:
+    count = 0
+    decoder = NDJSONDecoder()
+    for chunk in chunks:
+        for obj in decoder.feed(chunk):
+            ChatChunk.from_dict(obj)
+            count += 1
+    for obj in decoder.flush():
+        ChatChunk.from_dict(obj)
+        count += 1
+    return count
+
+
+def best_of(repeat: int, func, chunks) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(chunks)
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_stream(args.lines)
+    print(f"{args.lines} lines, {len(data) / 1e6:.1f} MB, JSON backend: {JSON_BACKEND}")
+    cases = [
+        ("one chunk", split(data, None)),
+        ("64 KiB chunks", split(data, 64 * 1024)),
+        ("one line/chunk", split(data, None, by_line=True)),
+        ("7-byte pieces", split(data, 7)),
+    ]
+    for name, chunks in cases:
+        assert old_decoder(chunks) == new_decoder(chunks) == args.lines
+        old = best_of(args.repeat, old_decoder, chunks)
+        new = best_of(args.repeat, new_decoder, chunks)
+        print(f"  {name:16s} old {old:8.1f} ms   new {new:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bot")]
+
+os.environ.setdefault("TOKEN", "123:ABC")
+os.environ.setdefault("ADMIN_IDS", "1")
+
+
+def _word_count(text: str, model: str | None = None) -> int:
+    # Stand-in for tiktoken, whose encodings are downloaded on first use
+    return len(text.split())
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """bot.core.database on a fresh, fully migrated database file."""
+    from bot.core import database
+
+    database.close_db()
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "count_tokens", _word_count)
+    database.init_db()
+    yield database
+    database.close_db()
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from bot.core.backends import Backend, BackendPool, BackendUnavailableError
+
+
+def _ejected_pool(cooldown_elapsed: bool) -> BackendPool:
+    pool = BackendPool([Backend("http://a:11434"), Backend("http://b:11434")], breaker_cooldown=30)
+    for backend in pool.backends:
+        backend.healthy = False
+        backend.opened_at = time.time() - (60 if cooldown_elapsed else 0)
+    return pool
+
+
+def test_metadata_selection_never_takes_the_trial_slot():
+    pool = _ejected_pool(cooldown_elapsed=True)
+    opened = [b.opened_at for b in pool.backends]
+
+    assert pool.select("llama3", trial=False) is None
+    assert [b.opened_at for b in pool.backends] == opened
+
+    # Real traffic gets the half-open trial
+    trial = pool.select("llama3")
+    assert trial is pool.backends[0] and trial.opened_at > opened[0]
+
+
+def test_selection_fails_fast_while_cooling_down():
+    pool = _ejected_pool(cooldown_elapsed=False)
+    with pytest.raises(BackendUnavailableError):
+        pool.select("llama3")
+    assert pool.select("llama3", trial=False) is None
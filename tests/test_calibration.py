@@ -0,0 +1,18 @@
+import asyncio
+import json
+
+from bot.core.calibration import TokenCalibrator
+
+
+def test_load_reads_persisted_ratios(database):
+    database.set_bot_config("token_ratio:llama3", json.dumps({"ratio": 1.25, "samples": 7}))
+    database.set_bot_config("token_ratio:broken", "not json")
+    database.set_bot_config("current_model", "llama3")
+
+    calibrator = TokenCalibrator()
+    asyncio.run(calibrator.load())
+
+    assert calibrator.factor("llama3") == 1.25
+    assert calibrator.factor("broken") == 1.0
+    assert calibrator.factor("unknown") == 1.0
+    assert set(calibrator._ratios) == {"llama3", "broken", "unknown"}
@@ -0,0 +1,28 @@
+import asyncio
+
+from bot.core import catalog
+from bot.core.catalog import CapabilityCatalog
+
+
+def test_refresh_only_fetches_new_and_expired_models(monkeypatch):
+    shown = []
+
+    async def show_model(name):
+        shown.append(name)
+        return {"capabilities": ["completion"]}
+
+    monkeypatch.setattr(catalog, "show_model", show_model)
+    capabilities = CapabilityCatalog(ttl=600)
+
+    async def scenario():
+        await capabilities.refresh([{"name": "a"}, {"name": "b"}])
+        # Revalidated list: "c" is new, "b" was removed
+        await capabilities.refresh([{"name": "a"}, {"name": "c"}])
+        assert shown == ["a", "b", "c"]
+        assert set(capabilities.entries) == {"a", "c"}
+
+        capabilities.entries["a"].fetched_at -= 600
+        await capabilities.refresh([{"name": "a"}, {"name": "c"}])
+        assert shown == ["a", "b", "c", "a"]
+
+    asyncio.run(scenario())
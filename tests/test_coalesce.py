@@ -0,0 +1,45 @@
+import asyncio
+
+from bot.core.coalesce import StreamCoalescer
+
+
+def test_request_after_last_subscriber_left_starts_fresh_flight():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        started = []
+
+        async def producer():
+            started.append(True)
+            yield len(started)
+            await asyncio.sleep(3600)
+
+        first = coalescer.stream("key", producer)
+        assert await first.__anext__() == 1
+        # The only subscriber leaves: the flight is cancelled, and a request
+        # arriving before its task unwinds must not join it
+        await first.aclose()
+        assert coalescer.in_flight == 0
+
+        second = coalescer.stream("key", producer)
+        assert await second.__anext__() == 2
+        await second.aclose()
+        await asyncio.sleep(0)
+        assert coalescer.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_flight_ends_stream_without_error():
+    async def scenario():
+        coalescer = StreamCoalescer()
+
+        async def producer():
+            yield "partial"
+            await asyncio.sleep(3600)
+
+        stream = coalescer.stream("key", producer)
+        assert await stream.__anext__() == "partial"
+        coalescer._flights["key"].task.cancel()
+        assert [chunk async for chunk in stream] == []
+
+    asyncio.run(scenario())
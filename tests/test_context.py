@@ -0,0 +1,26 @@
+from bot.core import context
+
+
+def test_trim_history_tokenizes_each_message_once(monkeypatch):
+    counted = []
+
+    def count_tokens(text):
+        counted.append(text)
+        return len(text.split())
+
+    monkeypatch.setattr(context, "count_tokens", count_tokens)
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "first question"},
+        {"role": "assistant", "content": "first answer"},
+    ]
+    context.trim_history("model", messages)
+    assert len(counted) == 3
+
+    messages.append({"role": "user", "content": "second question"})
+    context.trim_history("model", messages)
+    assert counted[3:] == ["second question"]
+
+    # A replaced system prompt is counted again
+    messages[0]["content"] = "be very brief"
+    assert context.estimate_tokens(messages[:1]) == 3 + context.MESSAGE_OVERHEAD_TOKENS
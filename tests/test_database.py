@@ -0,0 +1,119 @@
+def test_save_chat_message_without_content(database):
+    # A photo sent without a caption is saved with content None
+    session_id = database.create_chat_session(1, "Photos")
+    row_id = database.save_chat_message(1, session_id, "user", None)
+
+    row = (
+        database.get_connection()
+        .execute("SELECT content, token_count, cum_tokens FROM chats WHERE id = ?", (row_id,))
+        .fetchone()
+    )
+    assert row == (None, 0, 0)
+
+
+def test_write_batch_isolates_failing_write(database):
+    from bot.core.write_behind import PendingWrite
+
+    session_id = database.create_chat_session(1, "Batch")
+    question = PendingWrite("chat_message", (1, session_id, "user", "hello there"))
+    # Not a dict: fails with AttributeError, not sqlite3.Error
+    poisoned = PendingWrite("generation_stats", (None,))
+    answer = PendingWrite("chat_message", (1, session_id, "assistant", "hi"))
+    stats = PendingWrite("generation_stats", ({"chat_id": answer, "model": "m"},))
+
+    database.write_batch([question, poisoned, answer, stats])
+
+    conn = database.get_connection()
+    assert not conn.in_transaction
+    assert isinstance(poisoned.error, AttributeError) and poisoned.row_id is None
+    assert all(w.error is None for w in (question, answer, stats))
+    assert conn.execute("SELECT id, content FROM chats ORDER BY id").fetchall() == [
+        (question.row_id, "hello there"),
+        (answer.row_id, "hi"),
+    ]
+    assert conn.execute("SELECT chat_id, model FROM generation_stats").fetchall() == [
+        (answer.row_id, "m")
+    ]
+
+    # The next batch commits only its own rows
+    later = PendingWrite("chat_message", (1, session_id, "user", "again"))
+    database.write_batch([later])
+    assert conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 3
+
+
+def _snippets(database, user_id, text):
+    return [row[3] for row in database.search_chat_history(user_id, text, limit=50)]
+
+
+def test_search_index_backfill_with_concurrent_changes(database):
+    session_id = database.create_chat_session(1, "Notes")
+    ids = [
+        database.save_chat_message(1, session_id, "user", f"kubernetes note {i}")
+        for i in range(7)
+    ]
+    conn = database.get_connection()
+    # As if the messages had been saved before the index existed
+    conn.execute("INSERT INTO chats_fts (chats_fts) VALUES ('delete-all')")
+    database.set_bot_config(database.FTS_BACKFILL_KEY, str(ids[-1]))
+    conn.commit()
+
+    # Changes to rows the backfill has not reached yet must not touch the index
+    conn.execute("DELETE FROM chats WHERE id = ?", (ids[1],))
+    conn.execute("UPDATE chats SET content = 'docker note' WHERE id = ?", (ids[2],))
+    conn.commit()
+    newer = database.save_chat_message(1, session_id, "user", "kubernetes newest")
+
+    batches = []
+    while (indexed := database.index_chats_batch(batch_size=2)) is not None:
+        batches.append(indexed)
+    while database.merge_chats_fts():
+        pass
+
+    assert sum(batches) == 6
+    assert database.get_bot_config(database.FTS_BACKFILL_KEY) is None
+    conn.execute("INSERT INTO chats_fts (chats_fts, rank) VALUES ('integrity-check', 1)")
+    assert len(_snippets(database, 1, "kubernetes")) == 6
+    assert len(_snippets(database, 1, "docker")) == 1
+    assert newer is not None
+
+
+def test_search_index_created_after_sqlite_upgrade(database):
+    conn = database.get_connection()
+    # As if migration 6 had run on an SQLite build without FTS5
+    for trigger in ("chats_fts_insert", "chats_fts_delete", "chats_fts_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP TABLE chats_fts_vocab")
+    conn.execute("DROP TABLE chats_fts")
+    conn.commit()
+    session_id = database.create_chat_session(1, "Notes")
+    database.save_chat_message(1, session_id, "user", "saved without an index")
+    assert database.search_chat_history(1, "index") is None
+
+    database.init_db()
+    while database.index_chats_batch() is not None:
+        pass
+    assert _snippets(database, 1, "index") == ["saved without an \x02index\x03"]
+
+
+def test_backfill_token_counts(database):
+    session_id = database.create_chat_session(1, "Old")
+    for text in ("one", "two words", "three more words"):
+        database.save_chat_message(1, session_id, "user", text)
+    conn = database.get_connection()
+    # As if saved before the counts were stored
+    conn.execute("UPDATE chats SET token_count = NULL, cum_tokens = NULL")
+    conn.commit()
+
+    assert database.fill_token_counts_batch(0, batch_size=2) is not None
+    # A message saved mid-backfill: its session is not totalled yet
+    database.save_chat_message(1, session_id, "user", "four")
+
+    database.backfill_token_counts(batch_size=2)
+    assert database.fill_token_counts_batch() is None
+    assert database.fill_cum_tokens_batch() is None
+    assert conn.execute("SELECT token_count, cum_tokens FROM chats ORDER BY id").fetchall() == [
+        (1, 1),
+        (2, 3),
+        (3, 6),
+        (1, 7),
+    ]
@@ -0,0 +1,53 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bot.core import ollama
+from bot.core.backends import Backend, BackendPool
+
+
+def _server(status: int, calls: list[str], name: str) -> TestServer:
+    async def chat(request):
+        calls.append(name)
+        if status != 200:
+            return web.Response(status=status, text="model is loading")
+        return web.json_response(
+            {"model": "llama3", "message": {"role": "assistant", "content": name}, "done": True}
+        )
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    return TestServer(app)
+
+
+def test_retry_fails_over_to_another_backend(monkeypatch):
+    async def scenario():
+        calls = []
+        failing = _server(503, calls, "a")
+        working = _server(200, calls, "b")
+        await failing.start_server()
+        await working.start_server()
+        pool = BackendPool([Backend(str(failing.make_url(""))), Backend(str(working.make_url("")))])
+        monkeypatch.setattr(ollama, "backend_pool", pool)
+        monkeypatch.setattr(ollama, "retry_base_delay", 0)
+        client = ollama.OllamaClient()
+        await client.start()
+        monkeypatch.setattr(ollama, "client", client)
+        try:
+            payload = {"messages": [{"role": "user", "content": "hi"}], "stream": False}
+            # Reserved by the scheduler, still healthy after one failure
+            reserved = pool.backends[0]
+            chunks = [
+                chunk async for chunk in ollama.generate(payload, "llama3", "hi", None, reserved)
+            ]
+        finally:
+            await client.close()
+            await failing.close()
+            await working.close()
+
+        assert calls == ["a", "b"]
+        assert chunks[0].content == "b"
+        assert pool.backends[0].healthy and pool.backends[0].failures == 1
+
+    asyncio.run(scenario())
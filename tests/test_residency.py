@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from bot.core.backends import Backend, BackendPool
+from bot.core.residency import ResidencyManager
+
+
+def test_stop_cancels_warm_ups(monkeypatch):
+    async def scenario():
+        residency = ResidencyManager(BackendPool([Backend("http://a:11434")]))
+        loading = asyncio.Event()
+
+        async def load(backend, model, keep_alive, options=None):
+            loading.set()
+            await asyncio.sleep(3600)
+
+        monkeypatch.setattr(residency, "_load", load)
+        task = residency.warm_in_background("llama3")
+        await loading.wait()
+        assert residency._warming == {task}
+
+        await residency.stop()
+        assert task.cancelled() and not residency._warming
+
+    asyncio.run(scenario())
+
+
+def test_warm_up_errors_are_logged(monkeypatch, caplog):
+    async def scenario():
+        residency = ResidencyManager(BackendPool([Backend("http://a:11434")]))
+
+        async def load(backend, model, keep_alive, options=None):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(residency, "_load", load)
+        task = residency.warm_in_background("llama3")
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert not residency._warming
+
+    with caplog.at_level(logging.ERROR, logger="bot.core.residency"):
+        asyncio.run(scenario())
+    assert "Warming failed: boom" in caplog.text
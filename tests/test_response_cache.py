@@ -0,0 +1,28 @@
+import asyncio
+
+from bot.core.async_database import db_executor
+from bot.core.response_cache import ResponseCache
+
+
+def test_disk_tier_round_trip(tmp_path):
+    async def scenario():
+        cache = ResponseCache(path=str(tmp_path / "cache.db"), max_disk_bytes=10, enabled=True)
+        cache.put("a", "model", "answer")
+        cache.put("b", "model", "other")
+        # Wait for the queued disk writes
+        await db_executor.write(lambda: None)
+        cache._memory.clear()
+
+        # "a" was evicted to keep the disk tier under 10 bytes
+        assert await cache.get("a") is None
+        assert await cache.get("b") == "other"
+        assert cache.stats()["disk_bytes"] == 5
+
+        cache.ttl = -1
+        cache._memory.clear()
+        assert await cache.get("b") is None
+        await db_executor.write(lambda: None)
+        assert cache.stats()["disk_bytes"] == 0
+        cache.close()
+
+    asyncio.run(scenario())
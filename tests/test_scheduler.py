@@ -0,0 +1,49 @@
+import asyncio
+
+from bot.core.backends import Backend, BackendPool
+from bot.core.scheduler import GenerationScheduler
+
+
+def test_slots_are_counted_per_backend():
+    async def scenario():
+        pool = BackendPool([Backend("http://a:11434"), Backend("http://b:11434")])
+        # Model affinity alone would send every request to "a"
+        pool.backends[0].loaded_models["llama3"] = {}
+        scheduler = GenerationScheduler(max_per_backend=2, pool=pool)
+        release = asyncio.Event()
+        backends = []
+
+        async def generation(user_id):
+            async with scheduler.slot(user_id, user_id, "llama3") as ticket:
+                backends.append(ticket.backend.url)
+                await release.wait()
+
+        tasks = [asyncio.create_task(generation(user_id)) for user_id in range(5)]
+        await asyncio.sleep(0)
+        assert sorted(backends) == ["http://a:11434"] * 2 + ["http://b:11434"] * 2
+        # Both backends are full: the fifth request waits
+        assert scheduler.queue_depth == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert len(backends) == 5
+        assert scheduler.running == 0 and scheduler.running_per_backend == {}
+
+    asyncio.run(scenario())
+
+
+def test_total_cap_while_every_backend_is_ejected():
+    async def scenario():
+        pool = BackendPool([Backend("http://a:11434")])
+        pool.backends[0].healthy = False
+        scheduler = GenerationScheduler(max_per_backend=1, pool=pool)
+
+        async with scheduler.slot(1, 1, "llama3") as ticket:
+            # Left to the pool: a trial request or a fast failure
+            assert ticket.backend is None
+            waiting = asyncio.create_task(scheduler.slot(2, 2, "llama3").__aenter__())
+            await asyncio.sleep(0)
+            assert not waiting.done()
+        assert (await waiting).backend is None
+
+    asyncio.run(scenario())
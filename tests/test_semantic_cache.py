@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import numpy as np
+
+from bot.core.semantic_cache import SemanticCache, VectorIndex
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_compact_rewrites_index(tmp_path):
+    index = VectorIndex(str(tmp_path / "index"))
+    index.add("a", _unit(1, 0), {"answer": "old", "created_at": 0})
+    index.add("b", _unit(0, 1), {"answer": "kept", "created_at": 2})
+    index.add("a", _unit(1, 1), {"answer": "new", "created_at": 1})
+
+    assert index.compact(lambda row: row["created_at"] > 0) == 1
+
+    reloaded = VectorIndex(index.path)
+    reloaded.load()
+    for idx in (index, reloaded):
+        assert [row["answer"] for row in idx.rows] == ["kept", "new"]
+        assert idx.search("a", _unit(1, 0))[0]["answer"] == "new"
+        assert idx.search("b", _unit(0, 1))[0]["answer"] == "kept"
+
+
+def test_store_prunes_expired_and_oldest_entries(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / "cache"), ttl=60, max_entries=4)
+    now = time.time()
+    cache._add("s", _unit(1, 0), {"answer": "expired", "created_at": now - 120})
+    for i in range(4):
+        cache._add("s", _unit(1, i), {"answer": str(i), "created_at": now})
+
+    # Over the cap: the expired row goes, then the oldest down to 3/4 of it
+    assert [row["answer"] for row in cache._index.rows] == ["1", "2", "3"]
+    cache.close()
+
+
+def test_concurrent_first_lookups_load_index_once(tmp_path):
+    messages = [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "hello"}]
+    stored = SemanticCache(path=str(tmp_path / "cache"), enabled=True)
+    scope = stored.scope("m", messages)
+    stored._add(scope, _unit(1, 0), {"answer": "hi", "created_at": time.time()})
+    stored.close()
+
+    async def embed(texts, model):
+        await asyncio.sleep(0)
+        return [[1.0, 0.0]]
+
+    async def scenario():
+        cache = SemanticCache(path=str(tmp_path / "cache"), enabled=True, embed_fn=embed)
+        answers = await asyncio.gather(*(cache.lookup("m", messages) for _ in range(5)))
+        cache.close()
+        return cache, answers
+
+    cache, answers = asyncio.run(scenario())
+    assert [answer for answer, _ in answers] == ["hi"] * 5
+    assert list(cache._index._scopes.values()) == [[0]]